@@ -2,12 +2,34 @@ import os
 import json
 import base64
 import time
-import hashlib
-import re
 import uuid
 import random
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from storage import create_storage
+from backup import (
+    ARCHIVE_EXTENSION, DIFF, BackupArchive, BackupChain, backup_chain, create_backup_file,
+    delete_backup_file, encryption_available, list_backup_files
+)
+from restore import MemoryBackup, apply_restore, plan_is_valid, plan_restore
+from datastore import SharedDataStore
+from facets import popcount
+from fake_llm import create_fake_llm
+from generation import MAX_PROBLEMS, IncrementalJsonParser, fan_out
+from jobs import JobQueue
+from llm_cache import create_llm_cache
+from llm_client import create_client_registry
+from llm_scheduler import create_scheduler, is_rate_limit_error
+from llm_usage import FEATURES, BudgetExceededError, create_usage_meter
+from pagination import paginate
+from passwords import hash_password, verify_password
+from pregrading import SECTION_LABELS, build_pregrade_prompt, parse_correction, pregrade_all
+from problem_import import import_problems, missing_columns
+from problem_schema import schema_text, validate_problem
+from problem_store import REPOSITORY_PREFIX, owned_problems
+from roster_import import build_student_users, credentials_csv, prepare_roster, read_roster
+from record_index import is_pending_grading
 
 # 패키지 가용성 체크
 try:
@@ -68,120 +90,197 @@ except ImportError:
     
     pd = DummyPandas()
 
-# OpenAI 관련 기능 수정
+# OpenAI 라이브러리가 없으면 가짜 모델(fake_llm)로 AI 기능을 실행
 has_openai = False
 try:
     import openai
     has_openai = True
 except ImportError:
     has_openai = False
-    # 간단한 대체 클래스
-    class DummyChat:
-        def completions(self):
-            return self
-        
-        def create(self, *args, **kwargs):
-            class DummyMessage:
-                def __init__(self):
-                    self.content = "OpenAI API를 사용할 수 없습니다."
-            
-            class DummyChoice:
-                def __init__(self):
-                    self.message = DummyMessage()
-            
-            class DummyResponse:
-                def __init__(self):
-                    self.choices = [DummyChoice()]
-            
-            return DummyResponse()
-            
-    class DummyOpenAI:
-        def __init__(self, *args, **kwargs):
-            self.chat = DummyChat()
-        
-    # 가짜 openai 모듈 생성
-    openai = type('obj', (), {'OpenAI': DummyOpenAI})
-
-# 비밀번호 관련 기능
-try:
-    from passlib.hash import pbkdf2_sha256
-    USING_PASSLIB = True
-except ImportError:
-    USING_PASSLIB = False
-    pbkdf2_sha256 = None
+    openai = None
 
 # Initialize session state variables if they don't exist
 if 'username' not in st.session_state:
     st.session_state.username = None
-if 'users' not in st.session_state:
-    st.session_state.users = {}
-if 'teacher_problems' not in st.session_state:
-    st.session_state.teacher_problems = {}
-if 'student_records' not in st.session_state:
-    st.session_state.student_records = {}
 if 'openai_api_key' not in st.session_state:
     st.session_state.openai_api_key = os.getenv("OPENAI_API_KEY", "")
 
-# Helper functions
-def hash_password(password):
-    """비밀번호를 해싱합니다."""
-    if USING_PASSLIB and pbkdf2_sha256:
-        try:
-            return pbkdf2_sha256.hash(password)
-        except Exception:
-            # 실패하면 기본 방식 사용
-            return hashlib.sha256(password.encode()).hexdigest()
-    else:
-        return hashlib.sha256(password.encode()).hexdigest()
+# AI 문제 생성: 한 번의 요청에 만드는 문제 수, 동시에 보내는 요청 수
+GENERATION_BATCH_SIZE = int(os.getenv("GENERATION_BATCH_SIZE", "5"))
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "8"))
+# 생성 중인 문제를 작업 파일에 기록하는 최소 간격(초)
+GENERATION_REPORT_INTERVAL = float(os.getenv("GENERATION_REPORT_INTERVAL", "1.0"))
+# AI 사전 채점 동시 요청 수
+PREGRADE_WORKERS = int(os.getenv("PREGRADE_WORKERS", "8"))
 
-def verify_password(plain_password, hashed_password):
-    """평문 비밀번호가 해시된 비밀번호와 일치하는지 검증합니다."""
-    if USING_PASSLIB and pbkdf2_sha256 and '$' in hashed_password:
-        try:
-            return pbkdf2_sha256.verify(plain_password, hashed_password)
-        except Exception:
-            # 실패하면 기본 방식으로 비교
-            return hash_password(plain_password) == hashed_password
-    else:
-        # 기본 방식으로 비교
-        return hash_password(plain_password) == hashed_password
+# 백업 아카이브 보관 폴더
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join("data", "backups"))
+
+# 목록 정렬 기준
+DIFFICULTY_ORDER = {"쉬움": 0, "보통": 1, "중간": 1, "어려움": 2}
+REPOSITORY_SORT_OPTIONS = {
+    "기본 순서": (None, False),
+    "최신순": (lambda p: p.get("created_at", ""), True),
+    "제목순": (lambda p: p.get("title", ""), False),
+    "난이도순": (lambda p: DIFFICULTY_ORDER.get(p.get("difficulty", "보통"), 1), False)
+}
+
+# 저장소 백엔드 (프로세스 당 하나, STORAGE_BACKEND 환경 변수로 json/sqlite 선택)
+@st.cache_resource
+def get_storage():
+    return create_storage()
+
+# 프로세스 전체에서 공유하는 데이터 (세션마다 복사하지 않음)
+@st.cache_resource
+def get_data_store():
+    return SharedDataStore(get_storage())
+
+# API 키별 OpenAI 클라이언트 (연결 풀을 프로세스 전체에서 재사용)
+# LLM_PROVIDER=fake 이거나 openai 패키지가 없으면 네트워크 없이 동작하는 가짜 모델 사용 (테스트, 부하 측정용)
+def uses_fake_llm():
+    return os.getenv("LLM_PROVIDER", "openai").lower() == "fake" or not has_openai
 
-def save_users_data():
+@st.cache_resource
+def get_openai_clients():
+    if uses_fake_llm():
+        return create_client_registry(create_fake_llm().client)
+    return create_client_registry(openai.OpenAI)
+
+# 모든 AI 요청이 거치는 스케줄러 (API 키별 요청/토큰 한도, 429 재시도)
+@st.cache_resource
+def get_llm_scheduler():
+    return create_scheduler()
+
+# AI 사용량 (토큰, 지연 시간, 예상 비용) 집계와 교사별 월 예산
+@st.cache_resource
+def get_usage_meter():
+    return create_usage_meter()
+
+# feature: 사용량 집계 기능 구분 ("generation", "correction", "connection_test"), 사용량은 현재 로그인한 사용자에게 청구
+def get_openai_client(api_key=None, feature="generation"):
+    api_key = api_key or st.session_state.get("openai_api_key", "")
+    client = get_usage_meter().wrap(get_openai_clients().get(api_key), st.session_state.get("username"), feature)
+    return get_llm_scheduler().wrap(api_key, client)
+
+# 현재 사용자의 이번 달 AI 사용액과 예산 표시 (예산이 없으면 표시하지 않음)
+def show_ai_budget():
+    meter = get_usage_meter()
+    limit = meter.budget(st.session_state.username)
+    if limit is not None:
+        spent = meter.monthly_spend(st.session_state.username)
+        st.caption(f"이번 달 AI 사용액: ${spent:.2f} / 예산 ${limit:.2f}")
+
+# 현재 사용자의 이번 달 AI 예산이 남아 있는지 확인 (남아 있으면 (True, ""), 아니면 (False, 오류 메시지))
+def check_ai_budget():
     try:
-        with open("data/users.json", "w") as f:
-            json.dump(st.session_state.users, f, indent=2)
-    except Exception as e:
-        st.error(f"사용자 데이터 저장 중 오류 발생: {str(e)}")
+        get_usage_meter().check(st.session_state.get("username"))
+        return True, ""
+    except BudgetExceededError as e:
+        return False, str(e)
+
+# 백그라운드 작업 큐 (AI 문제 생성, 사전 채점을 스크립트 실행과 분리)
+@st.cache_resource
+def get_job_queue():
+    job_queue = JobQueue(os.path.join("data", "jobs"), max_workers=int(os.getenv("JOB_WORKERS", "4")))
+    job_queue.register("generate_problems", run_generation_job)
+    job_queue.register("pregrade_answers", run_pregrade_job)
+    return job_queue
 
-def load_users_data():
+# AI 응답 디스크 캐시 (프로세스 전체에서 공유)
+@st.cache_resource
+def get_llm_cache():
+    return create_llm_cache()
+
+def bind_session_data():
+    """세션 상태가 공유 데이터를 복사하지 않고 참조하도록 연결합니다."""
+    store = get_data_store()
+    st.session_state.users = store.users
+    st.session_state.teacher_problems = store.teacher_problems
+    st.session_state.student_records = store.student_records
+    st.session_state.problem_repository = store.problem_repository
+
+# 공유 데이터를 바꿀 때 잡는 잠금 (저장, 색인 갱신, 백업이 같은 잠금 아래에서 데이터를 순회하므로 변경과 저장을 함께 이 잠금 안에서 수행)
+def shared_data_lock():
+    return get_data_store().lock
+
+# 문제 ID 색인 (교사 문제 + 저장소 문제, 데이터가 바뀐 경우에만 다시 만듦)
+def get_problem_store():
+    return get_data_store().problem_store()
+
+# changed: 변경된 사용자 아이디 목록 (없으면 전체 저장)
+def save_users_data(changed=None):
     try:
-        with open("data/users.json", "r") as f:
-            st.session_state.users = json.load(f)
-    except FileNotFoundError:
-        st.session_state.users = {}
+        get_data_store().save("users", changed)
+    except Exception as e:
+        st.error(f"사용자 데이터 저장 중 오류 발생: {str(e)}")
 
 def logout_user():
     st.session_state.username = None
 
 def register_user(username, password, role, name, email="", created_by="system"):
-    if username in st.session_state.users:
-        return False, "이미 존재하는 아이디입니다."
-    
-    # 사용자 정보 저장
-    st.session_state.users[username] = {
-        "password": hash_password(password),
-        "role": role,
-        "name": name,
-        "email": email,
-        "created_at": datetime.now().isoformat(),
-        "created_by": created_by
-    }
-    
-    # JSON 파일에 저장
-    save_users_data()
+    with shared_data_lock():
+        if username in st.session_state.users:
+            return False, "이미 존재하는 아이디입니다."
+        
+        # 사용자 정보 저장
+        st.session_state.users[username] = {
+            "password": hash_password(password),
+            "role": role,
+            "name": name,
+            "email": email,
+            "created_at": datetime.now().isoformat(),
+            "created_by": created_by
+        }
+        
+        # JSON 파일에 저장
+        save_users_data([username])
     
     return True, "사용자가 성공적으로 등록되었습니다."
 
+# 페이지 단위 목록: 현재 페이지의 항목만 그리고, 본문은 사용자가 펼친 항목만 그림
+# header(index, item) -> 항목 제목, body(index, item) -> 본문 출력, sort_options: 정렬 이름 -> (정렬 키, 내림차순 여부)
+# item_id(item) -> 항목 ID (펼침 상태를 정렬, 페이지가 바뀌어도 같은 항목에 유지)
+def paginated_list(items, key, header, body, sort_options=None, page_sizes=(10, 20, 50), item_id=None):
+    col1, col2 = st.columns([2, 1])
+    
+    sort_label, sort_key, reverse = None, None, False
+    if sort_options:
+        with col1:
+            sort_label = st.selectbox("정렬:", list(sort_options), key=f"{key}_sort")
+        sort_key, reverse = sort_options[sort_label]
+    
+    with col2:
+        page_size = st.selectbox("페이지당 항목 수:", list(page_sizes), index=min(1, len(page_sizes) - 1), key=f"{key}_page_size")
+    
+    # 정렬, 페이지 크기, 항목 수가 바뀌면 첫 페이지로 이동
+    cursor_key = f"{key}_cursor"
+    signature = (sort_label, page_size, len(items))
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[cursor_key] = 0
+    
+    page = paginate(items, st.session_state.get(cursor_key, 0), page_size, sort_key, reverse)
+    
+    for index, item in enumerate(page.items, start=page.cursor):
+        # 펼친 항목만 본문을 그림
+        open_id = item_id(item) if item_id else item.get("id")
+        if st.checkbox(header(index, item), key=f"{key}_open_{open_id if open_id is not None else index}"):
+            body(index, item)
+            st.markdown("---")
+    
+    # 페이지 이동
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("◀ 이전", key=f"{key}_prev", disabled=page.prev_cursor is None):
+            st.session_state[cursor_key] = page.prev_cursor
+            st.rerun()
+    with col2:
+        st.caption(f"{page.number} / {page.page_count} 페이지 (총 {page.total}개)")
+    with col3:
+        if st.button("다음 ▶", key=f"{key}_next", disabled=page.next_cursor is None):
+            st.session_state[cursor_key] = page.next_cursor
+            st.rerun()
+
 # 사용자 정보 가져오기
 def get_user_data():
     # 현재 로그인한 사용자의 정보를 가져오기
@@ -198,7 +297,7 @@ def teacher_dashboard():
         st.header("메뉴")
         selected_menu = st.radio(
             "메뉴 선택:",
-            ["내 정보", "학생 관리", "문제 출제", "문제 목록", "문제 저장소", "채점"],
+            ["내 정보", "학생 관리", "문제 출제", "내 작업", "문제 목록", "문제 저장소", "채점"],
             key="teacher_menu"
         )
         
@@ -214,6 +313,8 @@ def teacher_dashboard():
         teacher_student_management()
     elif selected_menu == "문제 출제":
         teacher_problem_creation()
+    elif selected_menu == "내 작업":
+        teacher_jobs()
     elif selected_menu == "문제 목록":
         teacher_problem_list()
     elif selected_menu == "문제 저장소":
@@ -258,10 +359,15 @@ def teacher_problem_repository():
         
         search_query = st.text_input("검색어", key="repo_search_query")
         
-        # 저장소 문제 필터링
+        # 저장소 문제 필터링 (검색어가 있으면 검색 색인에서 관련도 순으로 후보를 가져옴)
         filtered_problems = []
         
-        for problem in st.session_state.problem_repository.get("problems", []):
+        if search_query:
+            candidates = [problem for problem, _ in get_data_store().repository_search.search(search_query)]
+        else:
+            candidates = st.session_state.problem_repository.get("problems", [])
+        
+        for problem in candidates:
             # 문제 유형 필터
             if problem_type_filter != "모두" and problem.get("type", "주관식") != (
                 "객관식" if problem_type_filter == "객관식" else "주관식"
@@ -276,10 +382,6 @@ def teacher_problem_repository():
             if subject_filter != "모두" and problem.get("subject", "기타") != subject_filter:
                 continue
                 
-            # 검색어 필터
-            if search_query and search_query.lower() not in problem.get("title", "").lower() and search_query.lower() not in problem.get("content", "").lower():
-                continue
-                
             filtered_problems.append(problem)
         
         # 필터링된 문제 목록 표시
@@ -288,51 +390,51 @@ def teacher_problem_repository():
         else:
             st.success(f"{len(filtered_problems)}개의 문제를 찾았습니다.")
             
-            for i, problem in enumerate(filtered_problems):
-                with st.expander(f"{i+1}. [{problem.get('subject', '기타')}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"):
-                    st.write(f"**제목:** {problem.get('title', '제목 없음')}")
-                    st.write(f"**과목:** {problem.get('subject', '기타')}")
-                    st.write(f"**난이도:** {problem.get('difficulty', '보통')}")
-                    st.write(f"**유형:** {problem.get('type', '주관식')}")
-                    st.write(f"**등록자:** {problem.get('created_by', '알 수 없음')}")
-                    st.write(f"**등록일:** {problem.get('created_at', '알 수 없음')}")
-                    
-                    st.markdown("---")
-                    st.markdown("**문제 내용:**")
-                    st.markdown(problem.get("content", "내용 없음"))
+            def problem_header(i, problem):
+                return f"{i+1}. [{problem.get('subject', '기타')}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"
+            
+            def problem_body(i, problem):
+                st.write(f"**제목:** {problem.get('title', '제목 없음')}")
+                st.write(f"**과목:** {problem.get('subject', '기타')}")
+                st.write(f"**난이도:** {problem.get('difficulty', '보통')}")
+                st.write(f"**유형:** {problem.get('type', '주관식')}")
+                st.write(f"**등록자:** {problem.get('created_by', '알 수 없음')}")
+                st.write(f"**등록일:** {problem.get('created_at', '알 수 없음')}")
+                
+                st.markdown("---")
+                st.markdown("**문제 내용:**")
+                st.markdown(problem.get("content", "내용 없음"))
+                
+                if problem.get("type") == "객관식":
+                    st.markdown("**선택지:**")
+                    options = problem.get("options", [])
+                    for j, option in enumerate(options):
+                        st.markdown(f"{j+1}. {option}")
+                    st.markdown(f"**정답:** {problem.get('answer', '정답 없음')}")
+                else:
+                    st.markdown(f"**정답:** {problem.get('answer', '정답 없음')}")
+                
+                # 내 문제 저장소에 추가 버튼
+                if st.button("내 문제 저장소에 추가", key=f"add_to_mine_{i}"):
+                    # 현재 사용자의 문제 저장소
+                    username = st.session_state.username
                     
-                    if problem.get("type") == "객관식":
-                        st.markdown("**선택지:**")
-                        options = problem.get("options", [])
-                        for j, option in enumerate(options):
-                            st.markdown(f"{j+1}. {option}")
-                        st.markdown(f"**정답:** {problem.get('answer', '정답 없음')}")
-                    else:
-                        st.markdown(f"**정답:** {problem.get('answer', '정답 없음')}")
+                    # 문제 추가
+                    problem_copy = problem.copy()
+                    problem_copy["id"] = str(uuid.uuid4())
                     
-                    # 내 문제 저장소에 추가 버튼
-                    if st.button("내 문제 저장소에 추가", key=f"add_to_mine_{i}"):
-                        # 사용자 문제 저장소에 추가
-                        if "teacher_problems" not in st.session_state:
-                            st.session_state.teacher_problems = {}
-                        
-                        # 현재 사용자의 문제 저장소
-                        username = st.session_state.username
-                        if username not in st.session_state.teacher_problems:
-                            st.session_state.teacher_problems[username] = {
-                                "problems": []
-                            }
-                        
-                        # 문제 추가
-                        problem_copy = problem.copy()
-                        problem_copy["id"] = str(uuid.uuid4())
-                        
-                        st.session_state.teacher_problems[username]["problems"].append(problem_copy)
+                    with shared_data_lock():
+                        owned_problems(st.session_state.teacher_problems, username).append(problem_copy)
                         
                         # 저장
-                        save_teacher_problems()
-                        
-                        st.success("문제가 내 저장소에 추가되었습니다.")
+                        save_teacher_problems([username])
+                    
+                    st.success("문제가 내 저장소에 추가되었습니다.")
+            
+            paginated_list(
+                filtered_problems, "repo_list", problem_header, problem_body,
+                sort_options=REPOSITORY_SORT_OPTIONS
+            )
     
     # 내 문제 저장소에 추가 탭
     with tab2:
@@ -410,10 +512,11 @@ def teacher_problem_repository():
                     problem_data["answer"] = answer
                 
                 # 문제 저장소에 문제 추가
-                st.session_state.problem_repository["problems"].append(problem_data)
-                
-                # 문제 저장소 저장
-                save_problem_repository()
+                with shared_data_lock():
+                    st.session_state.problem_repository["problems"].append(problem_data)
+                    
+                    # 문제 저장소 저장
+                    save_problem_repository([problem_id])
                 
                 st.success("문제가 저장소에 추가되었습니다.")
                 
@@ -441,7 +544,7 @@ def teacher_my_info():
         st.subheader("통계")
         
         # 출제한 문제 수
-        problem_count = len(st.session_state.teacher_problems.get(st.session_state.username, []))
+        problem_count = len(get_problem_store().ids(owner=username))
         
         # 등록한 학생 수
         student_count = sum(1 for student in st.session_state.users.values()
@@ -482,17 +585,39 @@ def teacher_my_info():
             st.error("현재 비밀번호가 일치하지 않습니다.")
         else:
             # 비밀번호 변경
-            st.session_state.users[st.session_state.username]["password"] = hash_password(new_password)
-            save_users_data()
+            with shared_data_lock():
+                st.session_state.users[st.session_state.username]["password"] = hash_password(new_password)
+                save_users_data([st.session_state.username])
             st.success("비밀번호가 성공적으로 변경되었습니다.")
 
+# 선택지 옆에 해당 값을 고를 때 남는 문제 수를 표시하는 필터 선택 상자
+def facet_selectbox(label, facets, facet, selections, base, key, format_value=None, order=None):
+    counts = facets.counts(facet, selections, base)
+    values = facets.values(facet)
+    if order:
+        values.sort(key=lambda v: order.index(v) if v in order else len(order))
+    options = ["모두"] + values
+    
+    # 선택했던 값이 사라진 경우 (문제 삭제 등) 초기화
+    if st.session_state.get(key, "모두") not in options:
+        st.session_state[key] = "모두"
+    
+    format_value = format_value or str
+    choice = st.selectbox(
+        label,
+        options,
+        format_func=lambda v: v if v == "모두" else f"{format_value(v)} ({counts.get(v, 0)})",
+        key=key
+    )
+    return None if choice == "모두" else choice
+
 def student_problem_solving():
     st.header("문제 풀기")
     
-    # 교사가 출제한 모든 문제 목록 가져오기
-    all_problems = st.session_state.teacher_problems
+    # 교사가 출제한 모든 문제의 필터 색인 (문제가 바뀐 경우에만 다시 만듦)
+    facets = get_data_store().problem_facets()
     
-    if not all_problems:
+    if not facets.ids:
         st.info("현재 풀 수 있는 문제가 없습니다. 나중에 다시 확인해주세요.")
         return
     
@@ -500,106 +625,74 @@ def student_problem_solving():
     student_records = st.session_state.student_records.get(st.session_state.username, {})
     solved_problems = student_records.get("problems", {})
     
+    # 학생의 문제 상태별 비트셋
+    status_ids = {"진행 중": [], "채점 대기": [], "완료": []}
+    for p_id, record in solved_problems.items():
+        status_label = {"in_progress": "진행 중", "submitted": "채점 대기", "completed": "완료"}.get(record.get("status"))
+        if status_label:
+            status_ids[status_label].append(p_id)
+    status_masks = {label: facets.mask_of(ids) for label, ids in status_ids.items()}
+    status_masks["미시도"] = facets.all_mask & ~facets.mask_of(solved_problems)
+    
+    # 현재 선택된 필터 값 (선택지별 문제 수 계산에 사용)
+    facet_keys = {
+        "teacher": "solve_filter_teacher",
+        "difficulty": "solve_filter_difficulty",
+        "type": "solve_filter_type",
+        "school_type": "solve_filter_school",
+        "grade": "solve_filter_grade",
+        "topic": "solve_filter_topic"
+    }
+    selections = {}
+    for facet, key in facet_keys.items():
+        value = st.session_state.get(key, "모두")
+        selections[facet] = value if value in facets.bitsets[facet] else None
+    
+    status_base = status_masks.get(st.session_state.get("solve_filter_status", "모두"))
+    
     # 문제 필터링 옵션
     st.subheader("문제 필터링")
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        filter_status = st.selectbox(
+        status_counts = {label: popcount(facets.mask(selections) & mask) for label, mask in status_masks.items()}
+        st.selectbox(
             "상태:",
-            ["모두", "미시도", "진행 중", "완료"]
+            ["모두", "미시도", "진행 중", "채점 대기", "완료"],
+            format_func=lambda v: v if v == "모두" else f"{v} ({status_counts.get(v, 0)})",
+            key="solve_filter_status"
         )
     
     with col2:
-        # 교사 목록 생성
-        teacher_ids = list(set(problem.get("created_by", "") for problem in all_problems.values()))
-        teacher_names = {teacher_id: st.session_state.users.get(teacher_id, {}).get("name", teacher_id) 
-                        for teacher_id in teacher_ids}
-        
-        filter_teacher = st.selectbox(
-            "교사:",
-            ["모두"] + [f"{name} ({tid})" for tid, name in teacher_names.items()]
+        facet_selectbox(
+            "교사:", facets, "teacher", selections, status_base, facet_keys["teacher"],
+            format_value=lambda tid: f"{st.session_state.users.get(tid, {}).get('name', tid)} ({tid})"
         )
     
     with col3:
-        filter_difficulty = st.selectbox(
-            "난이도:",
-            ["모두", "쉬움", "중간", "어려움"]
+        facet_selectbox(
+            "난이도:", facets, "difficulty", selections, status_base, facet_keys["difficulty"],
+            order=["쉬움", "보통", "중간", "어려움"]
         )
     
     with col4:
-        filter_type = st.selectbox(
-            "문제 유형:",
-            ["모두", "객관식", "주관식"]
+        facet_selectbox(
+            "문제 유형:", facets, "type", selections, status_base, facet_keys["type"],
+            order=["객관식", "주관식"]
         )
     
-    # 추가 필터링 옵션 (펼침 상자로 제공)
+    # 추가 필터링 옵션 (펼침 상자로 제공, 값이 있는 항목만 표시)
     with st.expander("추가 필터 옵션"):
-        school_types = list(set(problem.get("school_type", "") for problem in all_problems.values() if "school_type" in problem))
-        if school_types:
-            filter_school = st.selectbox("학교 구분:", ["모두"] + school_types)
-        else:
-            filter_school = "모두"
-            
-        grades = list(set(problem.get("grade", "") for problem in all_problems.values() if "grade" in problem))
-        if grades:
-            filter_grade = st.selectbox("학년:", ["모두"] + grades)
-        else:
-            filter_grade = "모두"
-            
-        topics = list(set(problem.get("topic_category", "") for problem in all_problems.values() if "topic_category" in problem))
-        if topics:
-            filter_topic = st.selectbox("주제:", ["모두"] + topics)
-        else:
-            filter_topic = "모두"
-    
-    # 필터링 적용
-    filtered_problems = {}
-    
-    for p_id, problem in all_problems.items():
-        # 상태 필터링
-        if filter_status != "모두":
-            if p_id not in solved_problems:
-                if filter_status != "미시도":
-                    continue
-            elif solved_problems[p_id].get("status") == "in_progress":
-                if filter_status != "진행 중":
-                    continue
-            elif solved_problems[p_id].get("status") == "completed":
-                if filter_status != "완료":
-                    continue
-        
-        # 교사 필터링
-        if filter_teacher != "모두":
-            teacher_id = filter_teacher.split(" (")[-1][:-1]  # 교사 ID 추출
-            if problem.get("created_by") != teacher_id:
-                continue
-        
-        # 난이도 필터링
-        if filter_difficulty != "모두" and problem.get("difficulty") != filter_difficulty:
-            continue
-            
-        # 문제 유형 필터링
-        if filter_type != "모두":
-            problem_type = problem.get("problem_type", "essay")  # 기본값은 주관식
-            if (filter_type == "객관식" and problem_type != "multiple_choice") or \
-               (filter_type == "주관식" and problem_type == "multiple_choice"):
-                continue
-        
-        # 학교 구분 필터링
-        if filter_school != "모두" and problem.get("school_type") != filter_school:
-            continue
-            
-        # 학년 필터링
-        if filter_grade != "모두" and problem.get("grade") != filter_grade:
-            continue
-            
-        # 주제 필터링
-        if filter_topic != "모두" and problem.get("topic_category") != filter_topic:
-            continue
-        
-        filtered_problems[p_id] = problem
+        if facets.values("school_type"):
+            facet_selectbox("학교 구분:", facets, "school_type", selections, status_base, facet_keys["school_type"])
+        if facets.values("grade"):
+            facet_selectbox("학년:", facets, "grade", selections, status_base, facet_keys["grade"])
+        if facets.values("topic"):
+            facet_selectbox("주제:", facets, "topic", selections, status_base, facet_keys["topic"])
+    
+    # 필터링 적용 (선택된 비트셋의 교집합)
+    filtered_problems = dict(facets.select(facets.mask(selections, base=status_base)))
     
     # 필터링된 문제 목록 표시
     st.subheader("문제 목록")
@@ -619,6 +712,8 @@ def student_problem_solving():
         if p_id in solved_problems:
             if solved_problems[p_id].get("status") == "in_progress":
                 status = "진행 중"
+            elif solved_problems[p_id].get("status") == "submitted":
+                status = "채점 대기"
             elif solved_problems[p_id].get("status") == "completed":
                 status = "완료"
                 score = f" (점수: {solved_problems[p_id].get('score', 0)})"
@@ -689,108 +784,119 @@ def student_records_view():
     
     col1, col2, col3 = st.columns(3)
     
+    # 제출/채점 때마다 갱신되는 학생별 통계
+    stats = get_data_store().record_stats.student(st.session_state.username)
+    
     with col1:
-        problems_attempted = len(solved_problems)
-        st.metric("시도한 문제 수", problems_attempted)
+        st.metric("시도한 문제 수", stats["attempted"])
     
     with col2:
-        problems_completed = sum(1 for problem in solved_problems.values() 
-                               if problem.get("status") == "completed")
-        st.metric("완료한 문제 수", problems_completed)
+        st.metric("완료한 문제 수", stats["completed"])
     
     with col3:
-        # 평균 점수 계산
-        total_score = sum(problem.get("score", 0) for problem in solved_problems.values() 
-                         if problem.get("status") == "completed")
-        
-        if problems_completed > 0:
-            average_score = total_score / problems_completed
-        else:
-            average_score = 0
-        
-        st.metric("평균 점수", f"{average_score:.1f}")
+        st.metric("평균 점수", f"{stats['average_score']:.1f}")
     
     # 기록 자세히 보기
     st.subheader("문제 기록 자세히 보기")
     
     tab1, tab2 = st.tabs(["완료한 문제", "진행 중인 문제"])
     
+    # 기록 항목: (문제 ID, 기록) 쌍
+    def record_problem(item):
+        return get_problem_store().get(item[0], {})
+    
+    def format_time(value):
+        try:
+            return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            return value
+    
     # 완료한 문제 탭
     with tab1:
-        completed_problems = {p_id: problem for p_id, problem in solved_problems.items() 
-                             if problem.get("status") == "completed"}
+        completed_problems = [(p_id, problem) for p_id, problem in solved_problems.items() 
+                              if problem.get("status") == "completed"]
         
         if not completed_problems:
             st.info("아직 완료한 문제가 없습니다.")
         else:
-            for p_id, problem_record in completed_problems.items():
-                problem_data = st.session_state.teacher_problems.get(p_id, {})
+            def completed_header(i, item):
+                return f"{record_problem(item).get('title', '제목 없음')} - 점수: {item[1].get('score', 0)}"
+            
+            def completed_body(i, item):
+                p_id, problem_record = item
+                problem_data = record_problem(item)
                 teacher_name = st.session_state.users.get(problem_data.get("created_by", ""), {}).get("name", "알 수 없음")
                 
-                with st.expander(f"{problem_data.get('title', '제목 없음')} - 점수: {problem_record.get('score', 0)}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**출제자:** {teacher_name}")
-                        st.write(f"**난이도:** {problem_data.get('difficulty', '중간')}")
-                        
-                        # 완료 시간 형식화
-                        completed_at = problem_record.get("completed_at", "")
-                        try:
-                            completed_at = datetime.fromisoformat(completed_at).strftime("%Y-%m-%d %H:%M:%S")
-                        except:
-                            pass
-                        
-                        st.write(f"**완료 시간:** {completed_at}")
-                    
-                    with col2:
-                        st.write(f"**점수:** {problem_record.get('score', 0)}")
-                        st.write(f"**피드백:** {problem_record.get('feedback', '피드백 없음')}")
-                    
-                    st.markdown("---")
-                    st.write("**문제:**")
-                    st.write(problem_data.get("description", "내용 없음"))
-                    
-                    st.write("**나의 답변:**")
-                    st.write(problem_record.get("answer", "답변 없음"))
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**출제자:** {teacher_name}")
+                    st.write(f"**난이도:** {problem_data.get('difficulty', '중간')}")
+                    st.write(f"**완료 시간:** {format_time(problem_record.get('completed_at', ''))}")
+                
+                with col2:
+                    st.write(f"**점수:** {problem_record.get('score', 0)}")
+                    st.write(f"**피드백:** {problem_record.get('feedback', '피드백 없음')}")
+                
+                st.markdown("---")
+                st.write("**문제:**")
+                st.write(problem_data.get("description", "내용 없음"))
+                
+                st.write("**나의 답변:**")
+                st.write(problem_record.get("answer", "답변 없음"))
+            
+            paginated_list(
+                completed_problems, "completed_records", completed_header, completed_body,
+                item_id=lambda item: item[0],
+                sort_options={
+                    "최근 완료순": (lambda item: item[1].get("completed_at", ""), True),
+                    "점수 높은순": (lambda item: item[1].get("score", 0) or 0, True),
+                    "점수 낮은순": (lambda item: item[1].get("score", 0) or 0, False)
+                }
+            )
     
     # 진행 중인 문제 탭
     with tab2:
-        in_progress_problems = {p_id: problem for p_id, problem in solved_problems.items() 
-                               if problem.get("status") == "in_progress"}
+        in_progress_problems = [(p_id, problem) for p_id, problem in solved_problems.items() 
+                                if problem.get("status") == "in_progress"]
         
         if not in_progress_problems:
             st.info("현재 진행 중인 문제가 없습니다.")
         else:
-            for p_id, problem_record in in_progress_problems.items():
-                problem_data = st.session_state.teacher_problems.get(p_id, {})
+            def in_progress_header(i, item):
+                return f"{record_problem(item).get('title', '제목 없음')} - 진행 중"
+            
+            def in_progress_body(i, item):
+                p_id, problem_record = item
+                problem_data = record_problem(item)
                 teacher_name = st.session_state.users.get(problem_data.get("created_by", ""), {}).get("name", "알 수 없음")
                 
-                with st.expander(f"{problem_data.get('title', '제목 없음')} - 진행 중"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.write(f"**출제자:** {teacher_name}")
-                        st.write(f"**난이도:** {problem_data.get('difficulty', '중간')}")
-                    
-                    with col2:
-                        # 시작 시간 형식화
-                        started_at = problem_record.get("started_at", "")
-                        try:
-                            started_at = datetime.fromisoformat(started_at).strftime("%Y-%m-%d %H:%M:%S")
-                        except:
-                            pass
-                        
-                        st.write(f"**시작 시간:** {started_at}")
-                    
-                    st.markdown("---")
-                    st.write("**문제:**")
-                    st.write(problem_data.get("description", "내용 없음"))
-                    
-                    # 계속 풀기 버튼
-                    if st.button(f"계속 풀기 - {problem_data.get('title', '제목 없음')}", key=f"continue_{p_id}"):
-                        st.session_state.problem_solving_id = p_id
-                        st.rerun()
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**출제자:** {teacher_name}")
+                    st.write(f"**난이도:** {problem_data.get('difficulty', '중간')}")
+                
+                with col2:
+                    st.write(f"**시작 시간:** {format_time(problem_record.get('started_at', ''))}")
+                
+                st.markdown("---")
+                st.write("**문제:**")
+                st.write(problem_data.get("description", "내용 없음"))
+                
+                # 계속 풀기 버튼
+                if st.button(f"계속 풀기 - {problem_data.get('title', '제목 없음')}", key=f"continue_{p_id}"):
+                    st.session_state.problem_solving_id = p_id
+                    st.rerun()
+            
+            paginated_list(
+                in_progress_problems, "in_progress_records", in_progress_header, in_progress_body,
+                item_id=lambda item: item[0],
+                sort_options={
+                    "최근 시작순": (lambda item: item[1].get("started_at", ""), True),
+                    "오래된 순": (lambda item: item[1].get("started_at", ""), False)
+                }
+            )
 
 def display_and_solve_problem():
     st.header("문제 풀기")
@@ -804,7 +910,7 @@ def display_and_solve_problem():
     problem_id = st.session_state.problem_solving_id
     
     # 문제 데이터 가져오기
-    problem_data = st.session_state.teacher_problems.get(problem_id)
+    problem_data = get_problem_store().get(problem_id)
     
     if not problem_data:
         st.error("선택한 문제를 찾을 수 없습니다.")
@@ -814,22 +920,24 @@ def display_and_solve_problem():
         return
     
     # 학생 기록 초기화 또는 업데이트
-    if st.session_state.username not in st.session_state.student_records:
-        st.session_state.student_records[st.session_state.username] = {"problems": {}}
-    
-    student_records = st.session_state.student_records[st.session_state.username]
-    
-    if "problems" not in student_records:
-        student_records["problems"] = {}
-    
-    # 해당 문제에 대한 학생 기록이 없으면 초기화
-    if problem_id not in student_records["problems"]:
-        student_records["problems"][problem_id] = {
-            "status": "in_progress",
-            "started_at": datetime.now().isoformat(),
-            "answer": "",
-            "score": 0
-        }
+    with shared_data_lock():
+        if st.session_state.username not in st.session_state.student_records:
+            st.session_state.student_records[st.session_state.username] = {"problems": {}}
+        
+        student_records = st.session_state.student_records[st.session_state.username]
+        
+        if "problems" not in student_records:
+            student_records["problems"] = {}
+        
+        # 해당 문제에 대한 학생 기록이 없으면 초기화 (시도 횟수에 반영되도록 저장)
+        if problem_id not in student_records["problems"]:
+            student_records["problems"][problem_id] = {
+                "status": "in_progress",
+                "started_at": datetime.now().isoformat(),
+                "answer": "",
+                "score": 0
+            }
+            save_student_record(st.session_state.username, problem_id)
     
     problem_record = student_records["problems"][problem_id]
     is_completed = problem_record.get("status") == "completed"
@@ -939,11 +1047,11 @@ def display_and_solve_problem():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("임시 저장"):
-                    problem_record["answer"] = str(option_radio)
-                    problem_record["updated_at"] = datetime.now().isoformat()
-                    
-                    with open("student_records.json", "w") as f:
-                        json.dump(st.session_state.student_records, f)
+                    with shared_data_lock():
+                        problem_record["answer"] = str(option_radio)
+                        problem_record["updated_at"] = datetime.now().isoformat()
+                        
+                        save_student_record(st.session_state.username, problem_id)
                     
                     st.success("답변이 임시 저장되었습니다.")
             
@@ -958,17 +1066,17 @@ def display_and_solve_problem():
                         score = 100 if option_radio == correct_answer else 0
                         
                         # 학생 기록 업데이트
-                        problem_record["answer"] = str(option_radio)
-                        problem_record["score"] = score
-                        problem_record["completed_at"] = datetime.now().isoformat()
-                        problem_record["status"] = "completed"
-                        problem_record["feedback"] = f"{'정답입니다! 🎉' if score == 100 else '아쉽게도 오답입니다. 😢'}"
-                        
-                        if "explanation" in problem_data:
-                            problem_record["feedback"] += f"\n\n{problem_data.get('explanation', '')}"
-                        
-                        with open("student_records.json", "w") as f:
-                            json.dump(st.session_state.student_records, f)
+                        with shared_data_lock():
+                            problem_record["answer"] = str(option_radio)
+                            problem_record["score"] = score
+                            problem_record["completed_at"] = datetime.now().isoformat()
+                            problem_record["status"] = "completed"
+                            problem_record["feedback"] = f"{'정답입니다! 🎉' if score == 100 else '아쉽게도 오답입니다. 😢'}"
+                            
+                            if "explanation" in problem_data:
+                                problem_record["feedback"] += f"\n\n{problem_data.get('explanation', '')}"
+                            
+                            save_student_record(st.session_state.username, problem_id)
                         
                         st.success("답변이 제출되었습니다.")
                         time.sleep(1)
@@ -985,11 +1093,11 @@ def display_and_solve_problem():
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("임시 저장"):
-                    problem_record["answer"] = answer_text
-                    problem_record["updated_at"] = datetime.now().isoformat()
-                    
-                    with open("student_records.json", "w") as f:
-                        json.dump(st.session_state.student_records, f)
+                    with shared_data_lock():
+                        problem_record["answer"] = answer_text
+                        problem_record["updated_at"] = datetime.now().isoformat()
+                        
+                        save_student_record(st.session_state.username, problem_id)
                     
                     st.success("답변이 임시 저장되었습니다.")
             
@@ -1000,12 +1108,14 @@ def display_and_solve_problem():
                         st.error("답변을 작성해주세요.")
                     else:
                         # 학생 기록 업데이트
-                        problem_record["answer"] = answer_text
-                        problem_record["submitted_at"] = datetime.now().isoformat()
-                        problem_record["status"] = "submitted"
-                        
-                        with open("student_records.json", "w") as f:
-                            json.dump(st.session_state.student_records, f)
+                        with shared_data_lock():
+                            problem_record["answer"] = answer_text
+                            problem_record["submitted_at"] = datetime.now().isoformat()
+                            problem_record["status"] = "submitted"
+                            # 다시 제출한 답안에는 이전 답안의 AI 채점 초안을 쓰지 않음
+                            problem_record.pop("ai_draft", None)
+                            
+                            save_student_record(st.session_state.username, problem_id)
                         
                         st.success("답변이 제출되었습니다. 교사의 채점을 기다려주세요.")
                         
@@ -1018,100 +1128,6 @@ def display_and_solve_problem():
         st.session_state.pop("problem_solving_id", None)
         st.rerun()
 
-# 객관식 문제 파싱 함수
-def parse_multiple_choice_problems(content):
-    problems = []
-    problem_blocks = re.split(r'문제\s*\d+:', content)
-    
-    for block in problem_blocks:
-        if not block.strip():
-            continue
-        
-        problem = {}
-        
-        # 제목 추출
-        title_match = re.search(r'제목:\s*(.*?)(?:\n|$)', block)
-        if title_match:
-            problem['title'] = title_match.group(1).strip()
-        
-        # 내용 추출
-        desc_match = re.search(r'내용:\s*(.*?)(?:\n보기1:|$)', block, re.DOTALL)
-        if desc_match:
-            problem['description'] = desc_match.group(1).strip()
-        
-        # 보기 추출
-        options = []
-        for i in range(1, 5):
-            option_match = re.search(fr'보기{i}:\s*(.*?)(?:\n|$)', block)
-            if option_match:
-                options.append(option_match.group(1).strip())
-        
-        if options:
-            problem['options'] = options
-        
-        # 정답 추출
-        answer_match = re.search(r'정답:\s*(\d+)', block)
-        if answer_match:
-            problem['correct_answer'] = int(answer_match.group(1))
-        
-        # 해설 추출
-        explanation_match = re.search(r'해설:\s*(.*?)(?:\n예상 시간:|$)', block, re.DOTALL)
-        if explanation_match:
-            problem['explanation'] = explanation_match.group(1).strip()
-        
-        # 예상 시간 추출
-        time_match = re.search(r'예상 시간:\s*(\d+)', block)
-        if time_match:
-            problem['expected_time'] = int(time_match.group(1))
-        
-        # 최소한의 정보가 있으면 추가
-        if 'title' in problem and 'description' in problem:
-            problems.append(problem)
-    
-    return problems
-
-# 주관식 문제 파싱 함수
-def parse_essay_problems(content):
-    problems = []
-    problem_blocks = re.split(r'문제\s*\d+:', content)
-    
-    for block in problem_blocks:
-        if not block.strip():
-            continue
-        
-        problem = {}
-        
-        # 제목 추출
-        title_match = re.search(r'제목:\s*(.*?)(?:\n|$)', block)
-        if title_match:
-            problem['title'] = title_match.group(1).strip()
-        
-        # 내용 추출
-        desc_match = re.search(r'내용:\s*(.*?)(?:\n예시 답안:|$)', block, re.DOTALL)
-        if desc_match:
-            problem['description'] = desc_match.group(1).strip()
-        
-        # 예시 답안 추출
-        sample_match = re.search(r'예시 답안:\s*(.*?)(?:\n채점 기준:|$)', block, re.DOTALL)
-        if sample_match:
-            problem['sample_answer'] = sample_match.group(1).strip()
-        
-        # 채점 기준 추출
-        criteria_match = re.search(r'채점 기준:\s*(.*?)(?:\n예상 시간:|$)', block, re.DOTALL)
-        if criteria_match:
-            problem['grading_criteria'] = criteria_match.group(1).strip()
-        
-        # 예상 시간 추출
-        time_match = re.search(r'예상 시간:\s*(\d+)', block)
-        if time_match:
-            problem['expected_time'] = int(time_match.group(1))
-        
-        # 최소한의 정보가 있으면 추가
-        if 'title' in problem and 'description' in problem:
-            problems.append(problem)
-    
-    return problems
-
 # 설정 파일 및 환경 변수에서 API 키 로드
 def load_api_keys():
     # 기본 API 키 (하드코딩된 옵션) - 실제 배포 시 빈 문자열로 변경하세요
@@ -1150,39 +1166,21 @@ def load_api_keys():
         
         st.session_state.openai_api_key = openai_key
     
-    # OpenAI 클라이언트 초기화 (openai 라이브러리가 있는 경우)
-    if has_openai and st.session_state.openai_api_key:
+    # OpenAI 클라이언트 초기화 (openai 라이브러리가 없으면 가짜 모델)
+    if st.session_state.openai_api_key:
         try:
-            st.session_state.openai_client = openai.OpenAI(api_key=st.session_state.openai_api_key)
+            st.session_state.openai_client = get_openai_client(st.session_state.openai_api_key)
         except Exception:
             # 초기화 실패 시 클라이언트는 None으로 설정
             st.session_state.openai_client = None
 
-# 문제 저장소 로드 함수
-def load_problem_repository():
-    try:
-        with open("data/problem_repository.json", "r") as f:
-            st.session_state.problem_repository = json.load(f)
-    except FileNotFoundError:
-        # 저장소 파일이 없으면 빈 저장소 생성
-        st.session_state.problem_repository = {
-            "problems": [],
-            "metadata": {
-                "last_updated": datetime.now().isoformat(),
-                "version": "1.0"
-            }
-        }
-        # 빈 저장소 파일 생성
-        save_problem_repository()
-
-# 문제 저장소 저장 함수
-def save_problem_repository():
-    # 마지막 업데이트 시간 갱신
-    st.session_state.problem_repository["metadata"]["last_updated"] = datetime.now().isoformat()
-    
+# 문제 저장소 저장 함수 (changed: 변경된 문제 ID 목록, 없으면 전체 저장)
+def save_problem_repository(changed=None):
     try:
-        with open("data/problem_repository.json", "w") as f:
-            json.dump(st.session_state.problem_repository, f, indent=2)
+        with shared_data_lock():
+            # 마지막 업데이트 시간 갱신
+            st.session_state.problem_repository["metadata"]["last_updated"] = datetime.now().isoformat()
+            get_data_store().save("problem_repository", changed)
     except Exception as e:
         st.error(f"문제 저장소 저장 중 오류 발생: {str(e)}")
 
@@ -1231,8 +1229,9 @@ def student_dashboard():
     
     # 첫 로그인 플래그 업데이트
     if first_login:
-        st.session_state.users[st.session_state.username]["first_login"] = False
-        save_users_data()
+        with shared_data_lock():
+            st.session_state.users[st.session_state.username]["first_login"] = False
+            save_users_data([st.session_state.username])
 
 # 학생용 문제 저장소 뷰 인터페이스
 def student_problem_repository_view():
@@ -1266,10 +1265,15 @@ def student_problem_repository_view():
     
     search_query = st.text_input("검색어", key="student_repo_search_query")
     
-    # 저장소 문제 필터링
+    # 저장소 문제 필터링 (검색어가 있으면 검색 색인에서 관련도 순으로 후보를 가져옴)
     filtered_problems = []
     
-    for problem in st.session_state.problem_repository.get("problems", []):
+    if search_query:
+        candidates = [problem for problem, _ in get_data_store().repository_search.search(search_query)]
+    else:
+        candidates = st.session_state.problem_repository.get("problems", [])
+    
+    for problem in candidates:
         # 문제 유형 필터
         if problem_type_filter != "모두" and problem.get("type", "주관식") != (
             "객관식" if problem_type_filter == "객관식" else "주관식"
@@ -1284,10 +1288,6 @@ def student_problem_repository_view():
         if subject_filter != "모두" and problem.get("subject", "기타") != subject_filter:
             continue
             
-        # 검색어 필터
-        if search_query and search_query.lower() not in problem.get("title", "").lower() and search_query.lower() not in problem.get("content", "").lower():
-            continue
-            
         filtered_problems.append(problem)
     
     # 필터링된 문제 목록 표시
@@ -1296,57 +1296,36 @@ def student_problem_repository_view():
     else:
         st.success(f"{len(filtered_problems)}개의 문제를 찾았습니다.")
         
-        for i, problem in enumerate(filtered_problems):
+        def problem_header(i, problem):
+            return f"{i+1}. [{problem.get('subject', '기타')}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"
+        
+        def problem_body(i, problem):
             author_name = st.session_state.users.get(problem.get("created_by", ""), {}).get("name", "알 수 없음")
             
-            with st.expander(f"{i+1}. [{problem.get('subject', '기타')}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"):
-                st.write(f"**제목:** {problem.get('title', '제목 없음')}")
-                st.write(f"**과목:** {problem.get('subject', '기타')}")
-                st.write(f"**난이도:** {problem.get('difficulty', '보통')}")
-                st.write(f"**유형:** {problem.get('type', '주관식')}")
-                st.write(f"**출제자:** {author_name}")
-                
-                st.markdown("---")
-                st.markdown("**문제 내용:**")
-                st.markdown(problem.get("content", "내용 없음"))
+            st.write(f"**제목:** {problem.get('title', '제목 없음')}")
+            st.write(f"**과목:** {problem.get('subject', '기타')}")
+            st.write(f"**난이도:** {problem.get('difficulty', '보통')}")
+            st.write(f"**유형:** {problem.get('type', '주관식')}")
+            st.write(f"**출제자:** {author_name}")
+            
+            st.markdown("---")
+            st.markdown("**문제 내용:**")
+            st.markdown(problem.get("content", "내용 없음"))
+            
+            # 문제 풀기 버튼
+            repo_problem_id = problem.get("id")
+            if repo_problem_id and st.button(f"이 문제 풀기", key=f"solve_repo_problem_{i}"):
+                # 저장소 문제는 문제 색인에 repo_ ID로 등록되어 있음
+                temp_problem_id = f"{REPOSITORY_PREFIX}{repo_problem_id}"
                 
-                # 문제 풀기 버튼
-                repo_problem_id = problem.get("id")
-                if repo_problem_id and st.button(f"이 문제 풀기", key=f"solve_repo_problem_{i}"):
-                    # 임시 문제 ID 생성 (충돌 방지)
-                    temp_problem_id = f"repo_{repo_problem_id}"
-                    
-                    # 문제가 이미 교사 문제 목록에 없으면 추가
-                    if temp_problem_id not in st.session_state.teacher_problems:
-                        # 저장소 문제를 교사 문제 형식으로 변환
-                        teacher_problem = {
-                            "id": temp_problem_id,
-                            "title": problem.get("title", ""),
-                            "description": problem.get("content", ""),
-                            "difficulty": problem.get("difficulty", "보통"),
-                            "created_by": problem.get("created_by", "system"),
-                            "created_at": datetime.now().isoformat(),
-                            "problem_type": "multiple_choice" if problem.get("type") == "객관식" else "essay",
-                            "subject": problem.get("subject", "기타"),
-                            "from_repository": True
-                        }
-                        
-                        # 문제 유형에 따라 추가 필드 추가
-                        if problem.get("type") == "객관식":
-                            teacher_problem["options"] = problem.get("options", [])
-                            teacher_problem["correct_answer"] = problem.get("answer", "")
-                        else:
-                            teacher_problem["answer"] = problem.get("answer", "")
-                            
-                        if "explanation" in problem:
-                            teacher_problem["explanation"] = problem.get("explanation", "")
-                        
-                        # 교사 문제 목록에 추가
-                        st.session_state.teacher_problems[temp_problem_id] = teacher_problem
-                    
-                    # 문제 풀기 페이지로 전환
-                    st.session_state.problem_solving_id = temp_problem_id
-                    st.rerun()
+                # 문제 풀기 페이지로 전환
+                st.session_state.problem_solving_id = temp_problem_id
+                st.rerun()
+        
+        paginated_list(
+            filtered_problems, "student_repo_list", problem_header, problem_body,
+            sort_options=REPOSITORY_SORT_OPTIONS
+        )
 
 # 직접 문제 출제 기능
 def direct_problem_creation():
@@ -1410,10 +1389,6 @@ def direct_problem_creation():
             elif (problem_type == "주관식" or problem_type == "서술식") and not sample_answer:
                 st.error("주관식/서술식 문제는 예시 답안을 입력해야 합니다.")
             else:
-                # 교사의 문제 목록 초기화
-                if st.session_state.username not in st.session_state.teacher_problems:
-                    st.session_state.teacher_problems[st.session_state.username] = []
-                
                 # 새 문제 생성
                 new_problem = {
                     "id": str(uuid.uuid4()),
@@ -1439,10 +1414,11 @@ def direct_problem_creation():
                     new_problem["grading_criteria"] = grading_criteria
                 
                 # 교사의 문제 목록에 추가
-                st.session_state.teacher_problems[st.session_state.username].append(new_problem)
-                
-                # 변경사항 저장
-                save_teacher_problems()
+                with shared_data_lock():
+                    owned_problems(st.session_state.teacher_problems, st.session_state.username).append(new_problem)
+                    
+                    # 변경사항 저장
+                    save_teacher_problems([st.session_state.username])
                 
                 st.success("문제가 성공적으로 추가되었습니다!")
 
@@ -1458,10 +1434,12 @@ def csv_problem_upload():
         CSV 파일은 다음 필드를 포함해야 합니다:
         - **title**: 문제 제목
         - **description**: 문제 내용
-        - **difficulty**: 난이도 (쉬움, 보통, 어려움)
+        - **difficulty**: 난이도 (쉬움, 보통, 중간, 어려움)
         - **subject**: 과목 (수학, 영어, 국어, 과학, 사회, 기타)
         - **type**: 문제 유형 (객관식, 주관식, 서술식)
         
+        난이도나 문제 유형이 위 값이 아닌 행, 선택지가 2개 미만이거나 정답 번호가 선택지 범위를 벗어난 객관식 행은 추가되지 않고 오류 보고서에 데이터 행 번호(헤더 다음 행이 1)와 함께 표시됩니다.
+        
         객관식일 경우 추가 필드:
         - **options**: 선택지 (쉼표로 구분)
         - **answer**: 정답 번호 (1부터 시작)
@@ -1508,167 +1486,381 @@ def csv_problem_upload():
     
     if uploaded_file is not None:
         try:
-            # pandas로 CSV 파일 읽기
+            # 미리보기는 앞부분만 읽음
             import pandas as pd
-            df = pd.read_csv(uploaded_file)
+            preview = pd.read_csv(uploaded_file, nrows=5, dtype=str, keep_default_na=False)
+            uploaded_file.seek(0)
             
             # 데이터 미리보기
             st.write("업로드된 데이터 미리보기:")
-            st.dataframe(df.head())
+            st.dataframe(preview)
             
             # 필수 필드 확인
-            required_fields = ["title", "description", "difficulty", "type"]
-            missing_fields = [field for field in required_fields if field not in df.columns]
+            missing_fields = missing_columns(preview.columns)
             
             if missing_fields:
                 st.error(f"필수 필드가 누락되었습니다: {', '.join(missing_fields)}")
             else:
-                # 데이터 처리 및 문제 추가 로직
+                # 데이터 처리 및 문제 추가 로직 (파일을 나눠 읽고 검증한 뒤 마지막에 한 번만 저장)
                 if st.button("문제 추가하기"):
-                    success_count = 0
-                    error_count = 0
+                    total_rows = max(1, uploaded_file.getvalue().count(b"\n") - 1)
+                    progress_bar = st.progress(0.0)
+                    status = st.empty()
                     
-                    # 교사의 문제 목록 초기화
-                    if st.session_state.username not in st.session_state.teacher_problems:
-                        st.session_state.teacher_problems[st.session_state.username] = []
+                    def on_progress(rows_read, total):
+                        progress_bar.progress(min(rows_read / total, 1.0))
+                        status.write(f"{rows_read:,}행 확인 중...")
                     
-                    for i, row in df.iterrows():
-                        try:
-                            problem = {
-                                "id": str(uuid.uuid4()),
-                                "title": row["title"],
-                                "description": row["description"],
-                                "difficulty": row["difficulty"],
-                                "type": row["type"],
-                                "created_by": st.session_state.username,
-                                "created_at": datetime.now().isoformat()
-                            }
-                            
-                            # 과목 정보 추가
-                            if "subject" in row:
-                                problem["subject"] = row["subject"]
-                            else:
-                                problem["subject"] = "기타"
-                            
-                            # 학년 정보 추가
-                            if "grade" in row:
-                                problem["grade"] = row["grade"]
-                            else:
-                                problem["grade"] = "1"
-                            
-                            # 문제 유형에 따른 추가 필드
-                            if row["type"] == "객관식":
-                                # 선택지 처리
-                                if "options" in row:
-                                    problem["options"] = [opt.strip() for opt in str(row["options"]).split(",")]
-                                else:
-                                    st.warning(f"행 {i+1}의 객관식 문제에 선택지가 누락되었습니다.")
-                                    problem["options"] = []
-                                
-                                # 정답 처리
-                                if "answer" in row:
-                                    problem["answer"] = str(row["answer"])
-                                else:
-                                    st.warning(f"행 {i+1}의 객관식 문제에 정답이 누락되었습니다.")
-                                    problem["answer"] = "1"
-                            else:
-                                # 주관식/서술식 답안
-                                if "answer" in row:
-                                    problem["answer"] = row["answer"]
-                                else:
-                                    st.warning(f"행 {i+1}의 문제에 답안이 누락되었습니다.")
-                                    problem["answer"] = ""
-                            
-                            # 교사의 문제 목록에 추가
-                            st.session_state.teacher_problems[st.session_state.username].append(problem)
-                            success_count += 1
-                        except Exception as e:
-                            error_count += 1
-                            st.error(f"행 {i+1}의 문제 추가 중 오류 발생: {e}")
+                    result = import_problems(
+                        uploaded_file, st.session_state.username, datetime.now().isoformat(),
+                        total_rows=total_rows, on_progress=on_progress
+                    )
+                    progress_bar.progress(1.0)
+                    status.empty()
                     
-                    # 변경사항 저장
-                    save_teacher_problems()
+                    # 교사의 문제 목록에 추가 후 변경사항 저장
+                    if result["problems"]:
+                        with shared_data_lock():
+                            my_problems = owned_problems(st.session_state.teacher_problems, st.session_state.username)
+                            my_problems.extend(result["problems"])
+                            save_teacher_problems([st.session_state.username])
+                        st.success(f"{len(result['problems'])}개의 문제가 성공적으로 추가되었습니다.")
                     
-                    if success_count > 0:
-                        st.success(f"{success_count}개의 문제가 성공적으로 추가되었습니다.")
-                    if error_count > 0:
-                        st.warning(f"{error_count}개의 문제 추가 중 오류가 발생했습니다.")
+                    if result["missing_answers"]:
+                        st.warning(f"{result['missing_answers']}개의 주관식/서술식 문제에 답안이 없습니다.")
+                    
+                    # 오류가 있는 행은 보고서로 내려받기
+                    rejected = result["rejected"]
+                    if rejected is not None:
+                        st.warning(f"전체 {result['rows']}행 중 {len(rejected)}행은 오류로 추가하지 않았습니다.")
+                        st.dataframe(rejected.head(20))
+                        st.download_button(
+                            label="오류 보고서 다운로드",
+                            data=rejected.to_csv(index=False).encode("utf-8-sig"),
+                            file_name="problem_import_errors.csv",
+                            mime="text/csv"
+                        )
         
         except Exception as e:
             st.error(f"파일 처리 중 오류가 발생했습니다: {e}")
 
 # OpenAI API 연결 및 오류 처리 개선
-def ai_generate_problems(subject, grade, difficulty, topic, problem_type, num_problems):
-    """AI를 사용하여 문제를 생성하는 함수"""
-    # API 키 확인
-    api_key = st.session_state.get("openai_api_key", "")
-    
-    if not api_key:
-        return False, "OpenAI API 키가 설정되지 않았습니다. 관리자 메뉴에서 API 키를 설정하세요."
+# AI 문제 생성 프롬프트 구성 (batch_note: 여러 묶음으로 나눠 생성할 때 묶음별 안내 문구)
+# 응답은 {"problems": [...]} JSON이며 각 항목은 저장되는 문제 스키마를 따름
+def build_generation_prompt(subject, grade, difficulty, topic, problem_type, num_problems, batch_note=""):
+    prompt = f"""
+{grade}학년 {subject} 교과 {topic} 관련 {difficulty} 수준의 {problem_type} 문제를 {num_problems}개 만들어주세요.
+반드시 {{"problems": [...]}} 형태의 JSON 객체 하나로만 답하세요. "problems" 배열에는 문제 {num_problems}개가 들어가야 하며,
+각 문제는 다음 JSON 스키마를 따라야 합니다.
+
+{schema_text(problem_type)}
+"""
     
+    if batch_note:
+        prompt += f"\n{batch_note}\n"
+    return prompt
+
+# 스키마 검증에 실패한 문제 하나를 고쳐 달라는 프롬프트
+def build_repair_prompt(problem_type, item, errors):
+    item_text = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+    error_text = "\n".join(f"- {error}" for error in errors)
+    return f"""
+다음 {problem_type} 문제 JSON이 스키마에 맞지 않습니다.
+
+문제:
+{item_text}
+
+오류:
+{error_text}
+
+내용은 최대한 유지하면서 오류를 고친 문제 하나를 {{"problems": [<문제>]}} 형태의 JSON 객체로만 답하세요.
+스키마:
+
+{schema_text(problem_type)}
+"""
+
+# AI 호출 한 번 (캐시 확인 포함, 실패하면 예외 발생). 작업 스레드에서도 호출되므로 세션 상태를 사용하지 않음
+# on_text가 있으면 응답을 스트리밍으로 받아 도착하는 대로 on_text(텍스트 조각)을 호출
+def request_completion(client, cache, messages, use_cache=True, on_text=None, temperature=0.7, max_tokens=2000, json_mode=False):
+    model = "gpt-3.5-turbo"
+    
+    # 같은 요청의 캐시된 응답이 있으면 재사용
+    if use_cache:
+        cached_content = cache.get(model, messages, temperature)
+        if cached_content is not None:
+            return cached_content
+    
+    options = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    if json_mode:
+        options["response_format"] = {"type": "json_object"}
+    
+    # 모델 호출
+    if on_text is None:
+        response = client.chat.completions.create(**options)
+        content = response.choices[0].message.content
+    else:
+        stream = client.chat.completions.create(stream=True, **options)
+        parts = []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_text(delta)
+        content = "".join(parts)
+    
+    # 응답 캐시에 저장 후 반환 (새로 생성한 경우에도 다음 요청을 위해 저장)
+    cache.put(model, messages, temperature, content)
+    return content
+
+# AI 호출 오류를 사용자에게 보여줄 메시지로 변환
+def describe_ai_error(error, action="문제 생성"):
+    error_msg = str(error)
+    if isinstance(error, BudgetExceededError):
+        return error_msg
+    elif is_rate_limit_error(error):
+        return "AI 요청이 많아 처리하지 못했습니다. 잠시 후 다시 시도해주세요."
+    elif "Authentication" in error_msg:
+        return "API 키가 올바르지 않습니다. 관리자 메뉴에서 유효한 API 키를 설정하세요."
+    elif "Connection" in error_msg:
+        return "OpenAI 서버에 연결할 수 없습니다. 인터넷 연결을 확인하세요."
+    else:
+        return f"{action} 중 오류가 발생했습니다: {error_msg}"
+
+# 문제 생성 요청 (성공 시 (True, 응답 JSON 텍스트), 실패 시 (False, 오류 메시지))
+def request_generation(client, cache, prompt, use_cache=True, on_text=None, temperature=0.7):
+    messages = [
+        {"role": "system", "content": "당신은 교육 콘텐츠 전문가로, 학생들을 위한 학습 문제를 만드는 역할을 합니다."},
+        {"role": "user", "content": prompt}
+    ]
     try:
-        # OpenAI API 호출
-        client = openai.OpenAI(api_key=api_key)
-        
-        # 프롬프트 구성
-        if problem_type == "객관식":
-            prompt = f"""
-            {grade}학년 {subject} 교과 {topic} 관련 {difficulty} 수준의 객관식 문제를 {num_problems}개 만들어주세요.
-            각 문제는 다음 형식으로 작성해주세요:
-            
-            문제: [문제 내용]
-            1. [선택지 1]
-            2. [선택지 2]
-            3. [선택지 3]
-            4. [선택지 4]
-            정답: [정답 번호]
-            
-            각 문제 사이에는 빈 줄을 넣어서 구분해주세요.
-            """
-        elif problem_type == "주관식":
-            prompt = f"""
-            {grade}학년 {subject} 교과 {topic} 관련 {difficulty} 수준의 주관식 문제를 {num_problems}개 만들어주세요.
-            각 문제는 다음 형식으로 작성해주세요:
-            
-            문제: [문제 내용]
-            정답: [정답]
-            
-            각 문제 사이에는 빈 줄을 넣어서 구분해주세요.
-            """
-        else:  # 서술식
-            prompt = f"""
-            {grade}학년 {subject} 교과 {topic} 관련 {difficulty} 수준의 서술식 문제를 {num_problems}개 만들어주세요.
-            각 문제는 다음 형식으로 작성해주세요:
-            
-            문제: [문제 내용]
-            모범답안: [모범답안]
-            
-            각 문제 사이에는 빈 줄을 넣어서 구분해주세요.
-            """
-        
-        # 모델 호출
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "당신은 교육 콘텐츠 전문가로, 학생들을 위한 학습 문제를 만드는 역할을 합니다."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        # 생성된 문제 반환
-        generated_content = response.choices[0].message.content
-        return True, generated_content
-    
+        return True, request_completion(client, cache, messages, use_cache, on_text, temperature, json_mode=True)
     except Exception as e:
-        error_msg = str(e)
-        if "Authentication" in error_msg:
-            return False, "API 키가 올바르지 않습니다. 관리자 메뉴에서 유효한 API 키를 설정하세요."
-        elif "Connection" in error_msg:
-            return False, "OpenAI 서버에 연결할 수 없습니다. 인터넷 연결을 확인하세요."
+        return False, describe_ai_error(e, "문제 생성")
+
+# 많은 문제를 묶음(GENERATION_BATCH_SIZE개씩)으로 나눠 동시에 생성하고 결과를 합침
+# 각 묶음은 스트리밍으로 받고, 문제 블록이 완성될 때마다 on_problem(문제)를 호출
+# 작업 스레드에서 실행되므로 세션 상태 대신 client, cache와 params(subject, grade, difficulty, topic, problem_type, num_problems, use_cache)를 받음
+def generate_problem_set(client, cache, params, on_progress=None, on_problem=None):
+    """
+    성공 시 (True, {"problems", "contents", "errors", "duplicates", "repaired"}), 실패 시 (False, 오류 메시지)
+    """
+    subject = params["subject"]
+    grade = params["grade"]
+    difficulty = params["difficulty"]
+    topic = params["topic"]
+    problem_type = params["problem_type"]
+    use_cache = params.get("use_cache", True)
+    
+    def make_parser():
+        return IncrementalJsonParser(lambda item: validate_problem(item, problem_type))
+    
+    def generate(count, batch_index, batch_count, on_text):
+        batch_note = ""
+        if batch_count > 1:
+            batch_note = f"(문제 묶음 {batch_index + 1}/{batch_count}: 다른 묶음과 겹치지 않도록 서로 다른 문제를 만들어주세요.)"
+        prompt = build_generation_prompt(subject, grade, difficulty, topic, problem_type, count, batch_note)
+        return request_generation(client, cache, prompt, use_cache, on_text)
+    
+    # 검증에 실패한 문제는 하나씩 고쳐 달라고 요청하고, 모자란 문제 수만큼만 다시 생성 (묶음 전체는 재요청하지 않음)
+    def repair(rejected, missing):
+        repaired = []
+        for item, errors in rejected:
+            success, content = request_generation(client, cache, build_repair_prompt(problem_type, item, errors), use_cache, temperature=0)
+            if success:
+                parser = make_parser()
+                repaired.extend(parser.feed(content) + parser.close())
+        
+        if missing > 0:
+            prompt = build_generation_prompt(
+                subject, grade, difficulty, topic, problem_type, missing,
+                f"(부족한 문제 {missing}개를 추가로 만들어주세요.)"
+            )
+            success, content = request_generation(client, cache, prompt, use_cache)
+            if success:
+                parser = make_parser()
+                repaired.extend(parser.feed(content) + parser.close())
+        return repaired
+    
+    result = fan_out(
+        generate, make_parser, params["num_problems"],
+        batch_size=GENERATION_BATCH_SIZE,
+        max_workers=GENERATION_WORKERS,
+        on_progress=on_progress,
+        on_problem=on_problem,
+        repair=repair
+    )
+    
+    if not result["contents"]:
+        return False, result["errors"][0] if result["errors"] else "문제를 생성하지 못했습니다."
+    return True, result
+
+# 백그라운드 문제 생성 작업 (작업 큐의 작업 스레드에서 실행)
+def run_generation_job(params, context, report):
+    problems = []
+    progress = {"done": 0, "total": 0, "problems": 0}
+    last_report = [0.0]
+    
+    # 묶음이 끝날 때마다 진행 상황과 지금까지 만든 문제를 작업 파일에 기록
+    def on_progress(done, batch_count, problem_count):
+        progress.update(done=done, total=batch_count, problems=problem_count)
+        last_report[0] = time.monotonic()
+        report(dict(progress), {"problems": list(problems)})
+    
+    # 문제가 파싱될 때마다 바로 보이고 저장할 수 있도록 기록 (너무 잦은 파일 쓰기를 막기 위해 간격 제한)
+    def on_problem(problem):
+        problems.append(problem)
+        now = time.monotonic()
+        if now - last_report[0] >= GENERATION_REPORT_INTERVAL:
+            last_report[0] = now
+            report(dict(progress, problems=len(problems)), {"problems": list(problems)})
+    
+    success, result = generate_problem_set(
+        context["client"], context["cache"], params,
+        on_progress=on_progress, on_problem=on_problem
+    )
+    if not success:
+        raise RuntimeError(result)
+    return result
+
+# 문제 생성 작업 등록 (성공 시 (True, 작업 ID), 실패 시 (False, 오류 메시지))
+def submit_generation_job(params):
+    api_key = st.session_state.get("openai_api_key", "")
+    
+    if not api_key:
+        return False, "OpenAI API 키가 설정되지 않았습니다. 관리자 메뉴에서 API 키를 설정하세요."
+    
+    within_budget, message = check_ai_budget()
+    if not within_budget:
+        return False, message
+    
+    title = f"{params['subject']} {params['grade']}학년 {params['topic']} {params['problem_type']} {params['num_problems']}문제 ({params['difficulty']})"
+    context = {"client": get_openai_client(api_key), "cache": get_llm_cache()}
+    job_id = get_job_queue().submit(st.session_state.username, "generate_problems", params, title, context)
+    return True, job_id
+
+# 생성 작업의 문제를 내 문제 목록에 저장 (진행 중에도 지금까지 만든 문제를 저장할 수 있고, 같은 문제는 한 번만 저장)
+def collect_generated_problems(job):
+    available = (job.get("result") or {}).get("problems", [])
+    start, end = get_job_queue().claim_results(job["id"], len(available))
+    
+    params = job["params"]
+    username = job["owner"]
+    problems = available[start:end]
+    if not problems:
+        return 0
+    with shared_data_lock():
+        my_problems = owned_problems(st.session_state.teacher_problems, username)
+        
+        for problem in problems:
+            problem["subject"] = params["subject"]
+            problem["grade"] = params["grade"]
+            problem["difficulty"] = params["difficulty"]
+            problem["type"] = params["problem_type"]
+            problem["topic"] = params["topic"]
+            problem["created_by"] = username
+            problem["created_at"] = datetime.now().isoformat()
+            problem["id"] = str(uuid.uuid4())
+            my_problems.append(problem)
+        
+        save_teacher_problems([username])
+    return len(problems)
+
+# AI 사전 채점 초안 하나 작성 (작업 스레드에서 실행, 실패하면 예외 발생)
+# 초안을 만드는 동안 학생이 답안을 바꾸지 않았는지 확인할 수 있도록 채점한 답안도 함께 반환
+def draft_essay_grade(client, cache, store, student_id, problem_id):
+    with store.lock:
+        problem = store.problem_store().get(problem_id)
+        record = dict(store.student_records.get(student_id, {}).get("problems", {}).get(problem_id) or {})
+    if not problem or not is_pending_grading(record):
+        raise ValueError("채점 대기 중인 답안이 아닙니다.")
+    
+    answer = record.get("answer", "")
+    messages = [{"role": "user", "content": build_pregrade_prompt(problem, answer)}]
+    correction = parse_correction(request_completion(client, cache, messages, temperature=0.3, max_tokens=3000))
+    if correction["score"] is None:
+        raise ValueError("AI 응답에서 점수를 찾지 못했습니다.")
+    
+    return {
+        "score": correction["score"],
+        "sections": correction["sections"],
+        "answer": answer,
+        "created_at": datetime.now().isoformat()
+    }
+
+# 백그라운드 사전 채점 작업 (params["items"]: [[학생 ID, 문제 ID], ...])
+# 초안은 학생 기록의 ai_draft에 저장되며, 교사가 채점 화면에서 수락하거나 고쳐서 채점을 완료함
+def run_pregrade_job(params, context, report):
+    store = context["store"]
+    items = [tuple(item) for item in params["items"]]
+    progress = {"done": 0, "total": len(items), "drafted": 0, "failed": 0}
+    errors = []
+    
+    def grade_one(item):
+        return draft_essay_grade(context["client"], context["cache"], store, item[0], item[1])
+    
+    # 답안마다 끝나는 대로 기록에 저장 (초안을 만드는 동안 답안이 바뀌었거나 채점된 경우는 버림)
+    def on_result(item, draft, error):
+        student_id, problem_id = item
+        progress["done"] += 1
+        saved = False
+        if draft is not None:
+            with store.lock:
+                record = store.student_records.get(student_id, {}).get("problems", {}).get(problem_id)
+                if record and is_pending_grading(record) and record.get("answer", "") == draft["answer"]:
+                    record["ai_draft"] = draft
+                    store.save("student_records", [(student_id, problem_id)])
+                    saved = True
+        if saved:
+            progress["drafted"] += 1
         else:
-            return False, f"문제 생성 중 오류가 발생했습니다: {error_msg}"
+            progress["failed"] += 1
+            if error and len(errors) < 10:
+                errors.append(describe_ai_error(error, "사전 채점"))
+        report(dict(progress))
+    
+    pregrade_all(grade_one, items, max_workers=PREGRADE_WORKERS, on_result=on_result)
+    return {"drafted": progress["drafted"], "failed": progress["failed"], "errors": errors}
+
+# 교사의 채점 대기 답안 중 AI 초안이 없는 서술형 답안 목록 ([(학생 ID, 문제 ID), ...])
+def pregrade_candidates(teacher_id):
+    store = get_data_store()
+    problems = get_problem_store()
+    
+    # 진행 중인 사전 채점 작업에 이미 들어 있는 답안은 제외
+    in_progress = set()
+    for job in get_job_queue().list(teacher_id):
+        if job.get("kind") == "pregrade_answers" and job.get("status") in ("queued", "running"):
+            in_progress.update(tuple(item) for item in job["params"]["items"])
+    
+    candidates = []
+    with store.lock:
+        for item in store.grading_queue.page(teacher_id, 0, store.grading_queue.pending_count(teacher_id)):
+            problem = problems.get(item["problem_id"], {})
+            record = store.student_records.get(item["student_id"], {}).get("problems", {}).get(item["problem_id"])
+            key = (item["student_id"], item["problem_id"])
+            if record and problem.get("problem_type") != "multiple_choice" and not record.get("ai_draft") and key not in in_progress:
+                candidates.append(key)
+    return candidates
+
+# 사전 채점 작업 등록 (성공 시 (True, 작업 ID), 실패 시 (False, 오류 메시지))
+def submit_pregrade_job(items):
+    api_key = st.session_state.get("openai_api_key", "")
+    
+    if not api_key:
+        return False, "OpenAI API 키가 설정되지 않았습니다. 관리자 메뉴에서 API 키를 설정하세요."
+    if not items:
+        return False, "AI 사전 채점할 답안이 없습니다."
+    
+    within_budget, message = check_ai_budget()
+    if not within_budget:
+        return False, message
+    
+    params = {"items": [list(item) for item in items]}
+    context = {"client": get_openai_client(api_key, "correction"), "cache": get_llm_cache(), "store": get_data_store()}
+    job_id = get_job_queue().submit(st.session_state.username, "pregrade_answers", params, f"서술형 답안 {len(items)}개 AI 사전 채점", context)
+    return True, job_id
 
 # 문제 생성 부분 수정
 def teacher_problem_creation():
@@ -1722,51 +1914,135 @@ def teacher_problem_creation():
         problem_type = st.radio("문제 유형:", ["객관식", "주관식", "서술식"], horizontal=True, index=0)
         
         # 생성할 문제 수
-        num_problems = st.slider("생성할 문제 수:", min_value=1, max_value=5, value=5)
+        num_problems = st.slider("생성할 문제 수:", min_value=1, max_value=MAX_PROBLEMS, value=5)
+        
+        # 캐시 사용 여부 (같은 조건으로 이전에 생성한 결과 재사용)
+        fresh_output = st.checkbox("캐시를 사용하지 않고 새로 생성", value=False, help="같은 조건으로 생성한 이전 결과가 있어도 새로 생성합니다.")
+        show_ai_budget()
         
-        # 문제 생성 버튼
+        # 문제 생성 버튼 (백그라운드 작업으로 등록, 결과는 '내 작업' 메뉴에서 확인)
         if st.button("AI로 문제 생성", use_container_width=True):
-            with st.spinner(f"{subject} {grade}학년 {topic} 관련 문제를 생성하는 중입니다..."):
-                success, result = ai_generate_problems(subject, grade, difficulty, topic, problem_type, num_problems)
-                
-                if success:
-                    st.success("문제가 성공적으로 생성되었습니다! 생성된 문제는 자동으로 파싱되어 선생님의 문제 저장소에 저장됩니다.")
-                    st.markdown("### 생성된 문제")
-                    st.markdown(result)
-                    
-                    # 문제 파싱 및 저장
-                    parsed_problems = []
-                    if problem_type == "객관식":
-                        parsed_problems = parse_multiple_choice_problems(result)
-                    else:
-                        parsed_problems = parse_essay_problems(result)
-                    
-                    # 문제 저장
-                    if parsed_problems:
-                        # 현재 사용자의 문제 목록 가져오기
-                        username = st.session_state.username
-                        if username not in st.session_state.teacher_problems:
-                            st.session_state.teacher_problems[username] = []
-                        
-                        # 각 문제에 메타데이터 추가하여 저장
-                        for problem in parsed_problems:
-                            problem["subject"] = subject
-                            problem["grade"] = grade
-                            problem["difficulty"] = difficulty
-                            problem["type"] = problem_type
-                            problem["topic"] = topic
-                            problem["created_by"] = username
-                            problem["created_at"] = datetime.now().isoformat()
-                            problem["id"] = str(uuid.uuid4())
-                            
-                            st.session_state.teacher_problems[username].append(problem)
-                        
-                        # 변경사항 저장
-                        save_teacher_problems()
-                        
-                        st.success(f"{len(parsed_problems)}개의 문제가 성공적으로 저장되었습니다! '문제 목록' 메뉴에서 확인하실 수 있습니다.")
+            success, result = submit_generation_job({
+                "subject": subject,
+                "grade": grade,
+                "difficulty": difficulty,
+                "topic": topic,
+                "problem_type": problem_type,
+                "num_problems": num_problems,
+                "use_cache": not fresh_output
+            })
+            
+            if success:
+                st.success("문제 생성 작업이 등록되었습니다. 다른 메뉴로 이동해도 생성은 계속됩니다.")
+                st.info("'내 작업' 메뉴에서 진행 상황을 확인하고, 완료된 문제를 내 문제 목록에 저장할 수 있습니다.")
+            else:
+                st.error(result)
+
+# 교사의 백그라운드 작업 목록 (AI 문제 생성, 사전 채점)
+def teacher_jobs():
+    st.header("내 작업")
+    
+    job_queue = get_job_queue()
+    jobs = job_queue.list(st.session_state.username)
+    
+    if not jobs:
+        st.info("등록된 작업이 없습니다. '문제 출제' 메뉴에서 AI 문제 생성을, '채점' 메뉴에서 AI 사전 채점을 요청하세요.")
+        return
+    
+    active_count = job_queue.active_count(st.session_state.username)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        if active_count:
+            st.info(f"{active_count}개 작업이 진행 중입니다.")
+    with col2:
+        if st.button("새로고침", key="jobs_refresh"):
+            st.rerun()
+    
+    status_labels = {"queued": "⏳ 대기 중", "running": "🔄 진행 중", "done": "✅ 완료", "failed": "❌ 실패"}
+    
+    for job in jobs:
+        status = job.get("status")
+        result = job.get("result") or {}
+        problems = result.get("problems", [])
+        expanded = status in ("queued", "running") or (status == "done" and not job.get("collected_at"))
+        
+        with st.expander(f"{job.get('title', '작업')} - {status_labels.get(status, status)}", expanded=expanded):
+            st.caption(f"등록: {job.get('created_at', '')[:19]}  |  작업 ID: {job['id'][:8]}")
+            
+            progress = job.get("progress") or {}
+            if status == "running" and progress.get("total"):
+                st.progress(progress["done"] / progress["total"])
+                if job.get("kind") == "pregrade_answers":
+                    st.write(f"{progress['done']}/{progress['total']} 답안 완료 - 초안 {progress.get('drafted', 0)}개 작성")
                 else:
-                    st.error(result)
+                    st.write(f"{progress['done']}/{progress['total']} 묶음 완료 - 지금까지 {progress.get('problems', 0)}개 문제 생성")
+            
+            if status == "failed":
+                st.error(job.get("error") or "작업이 실패했습니다.")
+                if st.button("다시 실행", key=f"job_retry_{job['id']}"):
+                    if job.get("kind") == "pregrade_answers":
+                        success, message = submit_pregrade_job(pregrade_candidates(st.session_state.username))
+                    else:
+                        success, message = submit_generation_job(job["params"])
+                    if success:
+                        job_queue.delete(job["id"])
+                        st.rerun()
+                    else:
+                        st.error(message)
+            
+            # 사전 채점 결과 (초안은 학생 기록에 저장되어 있으므로 요약만 표시)
+            if job.get("kind") == "pregrade_answers":
+                if status == "done":
+                    st.success(f"{result.get('drafted', 0)}개 답안의 채점 초안을 작성했습니다. '채점' 메뉴에서 확인하고 수락하세요.")
+                    if result.get("failed"):
+                        st.warning(f"{result['failed']}개 답안은 초안을 작성하지 못했습니다.")
+                    for error in result.get("errors", []):
+                        st.caption(error)
+                if status in ("done", "failed") and st.button("작업 삭제", key=f"job_delete_{job['id']}"):
+                    job_queue.delete(job["id"])
+                    st.rerun()
+                continue
+            
+            if status == "done":
+                if result.get("errors"):
+                    st.warning(f"{len(result['errors'])}개 묶음의 생성에 실패했습니다: {result['errors'][0]}")
+                if result.get("duplicates"):
+                    st.info(f"중복된 문제 {result['duplicates']}개를 제외했습니다.")
+                if result.get("repaired"):
+                    st.info(f"형식이 맞지 않았던 문제 {result['repaired']}개를 개별 수정/재생성했습니다.")
+            
+            # 생성된 (또는 지금까지 생성된) 문제
+            for i, problem in enumerate(problems):
+                st.markdown(f"**{i+1}. {problem.get('title', '제목 없음')}**")
+                st.markdown(problem.get("description", ""))
+                for j, option in enumerate(problem.get("options", [])):
+                    st.markdown(f"{j+1}. {option}")
+            
+            # 진행 중인 작업도 지금까지 만든 문제를 먼저 저장 가능
+            collected = job.get("collected", 0)
+            if status == "running" and len(problems) > collected:
+                if st.button(f"지금까지 만든 문제 저장 ({len(problems) - collected}개)", key=f"job_collect_partial_{job['id']}"):
+                    saved = collect_generated_problems(job)
+                    st.success(f"{saved}개의 문제가 저장되었습니다!")
+                    st.rerun()
+            
+            if status == "done":
+                if not problems:
+                    st.warning("생성된 응답에서 올바른 형식의 문제를 찾지 못했습니다. 아래 AI 응답 원문을 확인하세요.")
+                    for content in result.get("contents", []):
+                        st.code(content, language="json")
+                elif job.get("collected_at"):
+                    st.caption(f"{job['collected_at'][:19]}에 내 문제 목록에 저장했습니다.")
+                elif collected >= len(problems):
+                    st.caption("생성된 문제를 모두 내 문제 목록에 저장했습니다.")
+                elif st.button("내 문제 목록에 저장" if not collected else f"남은 문제 저장 ({len(problems) - collected}개)", key=f"job_collect_{job['id']}"):
+                    saved = collect_generated_problems(job)
+                    st.success(f"{saved}개의 문제가 저장되었습니다! '문제 목록' 메뉴에서 확인하실 수 있습니다.")
+                    st.rerun()
+            
+            if status in ("done", "failed") and st.button("작업 삭제", key=f"job_delete_{job['id']}"):
+                job_queue.delete(job["id"])
+                st.rerun()
 
 def main():
     # 앱 초기화
@@ -1775,20 +2051,6 @@ def main():
     # 앱 시작 시 설정 파일에서 API 키 로드
     load_api_keys()
     
-    # 세션 상태 초기화
-    if 'users' not in st.session_state:
-        load_users_data()
-    
-    if 'teacher_problems' not in st.session_state:
-        load_teacher_problems()
-    
-    if 'student_records' not in st.session_state:
-        load_student_records()
-    
-    # 문제 저장소 초기화
-    if 'problem_repository' not in st.session_state:
-        load_problem_repository()
-    
     # 로그인 상태 확인
     if st.session_state.username is None:
         login_page()
@@ -1817,69 +2079,47 @@ def init_app():
     os.makedirs("data", exist_ok=True)
     os.makedirs("uploads", exist_ok=True)
     
-    # 사용자 데이터 로드
-    if 'users' not in st.session_state:
-        load_users_data()
+    # 공유 데이터 연결 (데이터는 프로세스 당 한 번만 로드됨)
+    bind_session_data()
     
     # 초기 관리자 계정 생성 (필요한 경우)
-    if not st.session_state.users:
-        # 기본 사용자 계정 생성 - 데모 계정
-        admin_password = hash_password("admin")
-        teacher_password = hash_password("teacher")
-        student_password = hash_password("student")
-        
-        st.session_state.users = {
-            "admin": {
-                "username": "admin",
-                "password": admin_password,
-                "name": "관리자",
-                "role": "admin",
-                "email": "admin@example.com",
-                "created_at": datetime.now().isoformat(),
-                "created_by": "system"
-            },
-            "teacher": {
-                "username": "teacher",
-                "password": teacher_password,
-                "name": "선생님",
-                "role": "teacher",
-                "email": "teacher@example.com",
-                "created_at": datetime.now().isoformat(),
-                "created_by": "system"
-            },
-            "student": {
-                "username": "student",
-                "password": student_password,
-                "name": "학생",
-                "role": "student",
-                "email": "student@example.com",
-                "created_at": datetime.now().isoformat(),
-                "created_by": "system"
-            }
-        }
-        save_users_data()
-
-# 데이터 로드 함수
-def load_users_data():
-    try:
-        with open("data/users.json", "r") as f:
-            st.session_state.users = json.load(f)
-    except FileNotFoundError:
-        st.session_state.users = {}
-        
-def load_teacher_problems():
-    try:
-        with open("data/teacher_problems.json", "r") as f:
-            st.session_state.teacher_problems = json.load(f)
-    except FileNotFoundError:
-        st.session_state.teacher_problems = {}
-        
-def load_student_records():
-    try:
-        with open("data/student_records.json", "r") as f:
-            st.session_state.student_records = json.load(f)
-    except FileNotFoundError:
-        st.session_state.student_records = {}
+    with shared_data_lock():
+        if not st.session_state.users:
+            # 기본 사용자 계정 생성 - 데모 계정
+            admin_password = hash_password("admin")
+            teacher_password = hash_password("teacher")
+            student_password = hash_password("student")
+            
+            st.session_state.users.update({
+                "admin": {
+                    "username": "admin",
+                    "password": admin_password,
+                    "name": "관리자",
+                    "role": "admin",
+                    "email": "admin@example.com",
+                    "created_at": datetime.now().isoformat(),
+                    "created_by": "system"
+                },
+                "teacher": {
+                    "username": "teacher",
+                    "password": teacher_password,
+                    "name": "선생님",
+                    "role": "teacher",
+                    "email": "teacher@example.com",
+                    "created_at": datetime.now().isoformat(),
+                    "created_by": "system"
+                },
+                "student": {
+                    "username": "student",
+                    "password": student_password,
+                    "name": "학생",
+                    "role": "student",
+                    "email": "student@example.com",
+                    "created_at": datetime.now().isoformat(),
+                    "created_by": "system"
+                }
+            })
+            save_users_data()
 
 # teacher_student_management 함수 추가
 def teacher_student_management():
@@ -1895,6 +2135,9 @@ def teacher_student_management():
         # 새 학생 등록 폼
         with st.expander("새 학생 등록", expanded=True):
             add_new_student()
+        
+        with st.expander("학생 일괄 등록 (CSV/XLSX)"):
+            import_student_roster()
             
         return
     
@@ -1921,30 +2164,18 @@ def teacher_student_management():
             st.markdown(f"**등록일:** {student_data.get('created_at', '알 수 없음')}")
             st.markdown(f"**등록자:** {student_data.get('created_by', '알 수 없음')}")
             
-            # 학생 기록 불러오기
-            student_records = st.session_state.student_records.get(selected_student, {})
-            solved_problems = student_records.get("problems", {})
-            
-            # 학습 통계
+            # 학습 통계 (제출/채점 때마다 갱신되는 학생별 통계)
             st.subheader("학습 통계")
             
-            problems_attempted = len(solved_problems)
-            problems_completed = sum(1 for problem in solved_problems.values() 
-                                   if problem.get("status") == "completed")
+            stats = get_data_store().record_stats.student(selected_student)
             
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("시도한 문제 수", problems_attempted)
+                st.metric("시도한 문제 수", stats["attempted"])
             with col2:
-                st.metric("완료한 문제 수", problems_completed)
+                st.metric("완료한 문제 수", stats["completed"])
             with col3:
-                if problems_completed > 0:
-                    total_score = sum(problem.get("score", 0) for problem in solved_problems.values() 
-                                     if problem.get("status") == "completed")
-                    average_score = total_score / problems_completed
-                    st.metric("평균 점수", f"{average_score:.1f}")
-                else:
-                    st.metric("평균 점수", "0.0")
+                st.metric("평균 점수", f"{stats['average_score']:.1f}")
             
             # 학생 계정 관리 옵션
             st.subheader("계정 관리")
@@ -1955,11 +2186,12 @@ def teacher_student_management():
                 else:
                     # 임시 비밀번호 생성 및 설정
                     temp_password = "".join([str(random.randint(0, 9)) for _ in range(6)])
-                    st.session_state.users[selected_student]["password_hash"] = hash_password(temp_password)
-                    st.session_state.users[selected_student]["password_reset_by_teacher"] = True
-                    
-                    # 사용자 데이터 저장
-                    save_users_data()
+                    with shared_data_lock():
+                        st.session_state.users[selected_student]["password_hash"] = hash_password(temp_password)
+                        st.session_state.users[selected_student]["password_reset_by_teacher"] = True
+                        
+                        # 사용자 데이터 저장
+                        save_users_data([selected_student])
                     
                     st.success(f"비밀번호가 초기화되었습니다. 임시 비밀번호: {temp_password}")
             
@@ -1968,15 +2200,16 @@ def teacher_student_management():
                 confirmation = st.text_input("삭제하려면 '삭제확인'을 입력하세요:")
                 if confirmation == "삭제확인":
                     # 학생 계정 삭제
-                    st.session_state.users.pop(selected_student, None)
-                    
-                    # 학생 기록 삭제
-                    if selected_student in st.session_state.student_records:
-                        st.session_state.student_records.pop(selected_student, None)
-                    
-                    # 변경사항 저장
-                    save_users_data()
-                    save_student_records()
+                    with shared_data_lock():
+                        st.session_state.users.pop(selected_student, None)
+                        
+                        # 학생 기록 삭제
+                        if selected_student in st.session_state.student_records:
+                            st.session_state.student_records.pop(selected_student, None)
+                        
+                        # 변경사항 저장
+                        save_users_data([selected_student])
+                        save_student_record(selected_student)
                     
                     st.success("학생 계정이 삭제되었습니다.")
                     st.rerun()
@@ -1984,6 +2217,9 @@ def teacher_student_management():
     # 새 학생 등록 폼
     with st.expander("새 학생 등록"):
         add_new_student()
+    
+    with st.expander("학생 일괄 등록 (CSV/XLSX)"):
+        import_student_roster()
 
 # 새 학생 등록 함수
 def add_new_student():
@@ -2010,55 +2246,118 @@ def add_new_student():
             # 학생 등록
             password_hash = hash_password(student_password)
             
-            st.session_state.users[student_username] = {
-                "username": student_username,
-                "password_hash": password_hash,
-                "name": student_name,
-                "email": student_email,
-                "role": "student",
-                "created_at": datetime.now().isoformat(),
-                "created_by": st.session_state.username,
-                "first_login": True
-            }
-            
-            # 학생 기록 초기화
-            if student_username not in st.session_state.student_records:
-                st.session_state.student_records[student_username] = {
-                    "problems": {}
+            with shared_data_lock():
+                st.session_state.users[student_username] = {
+                    "username": student_username,
+                    "password_hash": password_hash,
+                    "name": student_name,
+                    "email": student_email,
+                    "role": "student",
+                    "created_at": datetime.now().isoformat(),
+                    "created_by": st.session_state.username,
+                    "first_login": True
                 }
-            
-            # 변경사항 저장
-            save_users_data()
-            save_student_records()
+                
+                # 학생 기록 초기화
+                if student_username not in st.session_state.student_records:
+                    st.session_state.student_records[student_username] = {
+                        "problems": {}
+                    }
+                
+                # 변경사항 저장
+                save_users_data([student_username])
+                save_student_record(student_username)
             
             st.success(f"학생 '{student_name}'이(가) 성공적으로 등록되었습니다.")
             time.sleep(2)
             st.rerun()
 
+# 명단 파일로 학생 일괄 등록 (비밀번호는 여러 프로세스에서 한꺼번에 해싱, 저장은 한 번만)
+def import_student_roster():
+    st.subheader("학생 일괄 등록")
+    st.markdown("""
+    명단 파일에는 **이름(name)** 열이 필요하며, **아이디(username)**, **이메일(email)**, **비밀번호(password)** 열은 선택입니다.
+    아이디를 비워두면 접두어 뒤에 번호를 붙여 만들고, 비밀번호를 비워두면 임의의 비밀번호를 만듭니다.
+    """)
+    
+    # 방금 등록한 학생들의 계정 목록 (비밀번호는 이 화면에서만 확인 가능)
+    if st.session_state.get("roster_credentials"):
+        count, credentials = st.session_state.roster_credentials
+        st.success(f"{count}명의 학생이 등록되었습니다. 계정 목록을 내려받아 학생들에게 전달하세요.")
+        st.download_button(
+            "계정 목록 다운로드 (아이디, 비밀번호)",
+            data=credentials,
+            file_name="student_credentials.csv",
+            mime="text/csv",
+            key="roster_credentials_download"
+        )
+        if st.button("계정 목록 닫기", key="roster_credentials_close"):
+            st.session_state.pop("roster_credentials", None)
+            st.rerun()
+    
+    roster_sample = "이름,아이디,이메일,비밀번호\n홍길동,hong01,hong@example.com,\n김영희,,,\n"
+    st.download_button("명단 샘플 다운로드", data=roster_sample.encode("utf-8-sig"), file_name="roster_sample.csv", mime="text/csv")
+    
+    # 등록이 끝나면 업로드 위젯을 새로 만들어 같은 파일을 다시 검증하지 않도록 함
+    upload_round = st.session_state.get("roster_upload_round", 0)
+    uploaded_file = st.file_uploader("명단 파일 선택", type=["csv", "xlsx"], key=f"roster_upload_{upload_round}")
+    prefix = st.text_input("자동 생성 아이디 접두어:", value="student", key="roster_prefix")
+    
+    if uploaded_file is None:
+        return
+    
+    try:
+        frame = read_roster(uploaded_file, uploaded_file.name)
+    except Exception as e:
+        st.error(f"명단 파일을 읽는 중 오류가 발생했습니다: {e}")
+        return
+    
+    # 이미 등록된 아이디, 파일 안의 중복과 비교해 미리 검증
+    try:
+        accounts, rejected = prepare_roster(frame, st.session_state.users.keys(), prefix or "student")
+    except ValueError as e:
+        st.error(str(e))
+        return
+    st.write(f"전체 {len(frame)}명 중 {len(accounts)}명 등록 가능")
+    st.dataframe([{"이름": a["name"], "아이디": a["username"], "이메일": a["email"]} for a in accounts[:20]])
+    
+    if rejected:
+        st.warning(f"{len(rejected)}명은 오류로 등록할 수 없습니다.")
+        st.dataframe([{"행": row["line"], "이름": row["name"], "아이디": row["username"], "오류": row["error"]} for row in rejected])
+    
+    if accounts and st.button(f"{len(accounts)}명 등록", key="roster_register"):
+        with st.spinner("비밀번호를 암호화하는 중..."):
+            new_users = build_student_users(accounts, st.session_state.username, datetime.now().isoformat())
+        
+        with shared_data_lock():
+            # 암호화하는 동안 다른 가입이나 등록으로 생긴 아이디는 덮어쓰지 않고 등록을 취소
+            taken = [username for username in new_users if username in st.session_state.users]
+            if taken:
+                st.error(f"암호화하는 동안 이미 등록된 아이디가 있어 등록을 취소했습니다: {', '.join(taken[:10])}. 명단을 다시 확인하세요.")
+                return
+            st.session_state.users.update(new_users)
+            for username in new_users:
+                st.session_state.student_records.setdefault(username, {"problems": {}})
+            
+            # 변경사항 저장 (사용자, 학생 기록 각각 한 번)
+            save_users_data(list(new_users))
+            save_student_records([(username, None) for username in new_users])
+        
+        st.session_state.roster_credentials = (len(new_users), credentials_csv(accounts))
+        st.session_state.roster_upload_round = upload_round + 1
+        st.rerun()
+
 # teacher_problem_list 함수 추가
 def teacher_problem_list():
     st.header("내 문제 목록")
     
     # 교사가 출제한 문제 목록 가져오기
-    teacher_problems = st.session_state.teacher_problems.get(st.session_state.username, [])
+    teacher_problems = [problem for _, problem in get_problem_store().find(owner=st.session_state.username)]
     
     if not teacher_problems:
         st.info("출제한 문제가 없습니다. '문제 출제' 메뉴에서 문제를 만들어주세요.")
         return
     
-    # 정렬 옵션
-    sort_option = st.selectbox(
-        "정렬:",
-        ["최신순", "난이도순"]
-    )
-    
-    # 정렬
-    if sort_option == "최신순":
-        sorted_problems = sorted(teacher_problems, key=lambda x: x.get("created_at", ""), reverse=True)
-    else:  # 난이도순
-        difficulty_order = {"쉬움": 0, "보통": 1, "어려움": 2}
-        sorted_problems = sorted(teacher_problems, key=lambda x: difficulty_order.get(x.get("difficulty", "보통"), 1))
-    
     # 필터링 옵션들
     with st.expander("필터 옵션"):
         col1, col2 = st.columns(2)
@@ -2086,7 +2385,7 @@ def teacher_problem_list():
     
     # 필터링
     filtered_problems = []
-    for problem in sorted_problems:
+    for problem in teacher_problems:
         # 난이도 필터링
         if problem.get("difficulty") not in filter_difficulty:
             continue
@@ -2113,113 +2412,174 @@ def teacher_problem_list():
     # 필터링 결과 표시
     st.write(f"총 {len(filtered_problems)}개의 문제")
     
-    # 문제 목록 표시
-    for i, problem in enumerate(filtered_problems):
-        # 문제 타입 표시
+    # 문제 목록 표시 (현재 페이지만, 본문은 펼친 문제만 그림)
+    attempt_index = get_data_store().attempt_index
+    record_stats = get_data_store().record_stats
+    
+    def type_label_of(problem):
+        problem_type = problem.get("problem_type", "essay")
+        return "객관식" if problem_type == "multiple_choice" else "주관식" if problem_type == "essay" else "서술식"
+    
+    def problem_header(i, problem):
+        return f"{i+1}. [{type_label_of(problem)}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"
+    
+    def problem_body(i, problem):
         problem_type = problem.get("problem_type", "essay")
-        type_label = "객관식" if problem_type == "multiple_choice" else "주관식" if problem_type == "essay" else "서술식"
         
-        # 문제 상태 정보
-        total_attempts = 0
-        completed_count = 0
+        # 문제 상태 정보 (문제별 시도 색인에서 조회)
+        attempt_counts = attempt_index.counts(problem.get("id"))
+        total_attempts = attempt_counts["attempts"]
+        completed_count = attempt_counts["completed"]
         
-        for student_id, student_record in st.session_state.student_records.items():
-            for p_id, p_data in student_record.get("problems", {}).items():
-                if p_id == problem.get("id"):
-                    total_attempts += 1
-                    if p_data.get("status") == "completed":
-                        completed_count += 1
+        col1, col2 = st.columns([3, 1])
         
-        # 문제 카드 표시
-        with st.expander(f"{i+1}. [{type_label}] {problem.get('title', '제목 없음')} ({problem.get('difficulty', '보통')})"):
-            col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown(f"**내용:** {problem.get('description', '내용 없음')}")
             
-            with col1:
-                st.markdown(f"**내용:** {problem.get('description', '내용 없음')}")
+            if problem_type == "multiple_choice":
+                st.markdown("**선택지:**")
+                for j, option in enumerate(problem.get("options", [])):
+                    st.markdown(f"{j+1}. {option}")
+                st.markdown(f"**정답:** {problem.get('correct_answer', '정답 없음')}")
+            else:
+                if "sample_answer" in problem:
+                    st.markdown(f"**예시 답안:** {problem.get('sample_answer', '답안 없음')}")
                 
-                if problem_type == "multiple_choice":
-                    st.markdown("**선택지:**")
-                    for j, option in enumerate(problem.get("options", [])):
-                        st.markdown(f"{j+1}. {option}")
-                    st.markdown(f"**정답:** {problem.get('correct_answer', '정답 없음')}")
-                else:
-                    if "sample_answer" in problem:
-                        st.markdown(f"**예시 답안:** {problem.get('sample_answer', '답안 없음')}")
-                    
-                    if "grading_criteria" in problem:
-                        st.markdown(f"**채점 기준:** {problem.get('grading_criteria', '채점 기준 없음')}")
+                if "grading_criteria" in problem:
+                    st.markdown(f"**채점 기준:** {problem.get('grading_criteria', '채점 기준 없음')}")
+        
+        with col2:
+            st.markdown(f"**시도 횟수:** {total_attempts}")
+            st.markdown(f"**제출 횟수:** {attempt_counts['submitted']}")
+            st.markdown(f"**완료 횟수:** {completed_count}")
+            if completed_count:
+                st.markdown(f"**평균 점수:** {record_stats.problem(problem.get('id'))['average_score']:.1f}")
+            st.markdown(f"**출제일:** {problem.get('created_at', '알 수 없음')[:10]}")
+            
+            # 문제 관리 버튼
+            if st.button("문제 수정", key=f"edit_{i}"):
+                st.session_state.edit_problem_id = problem.get("id")
+                st.rerun()
             
-            with col2:
-                st.markdown(f"**시도 횟수:** {total_attempts}")
-                st.markdown(f"**완료 횟수:** {completed_count}")
-                st.markdown(f"**출제일:** {problem.get('created_at', '알 수 없음')[:10]}")
-                
-                # 문제 관리 버튼
-                if st.button("문제 수정", key=f"edit_{i}"):
-                    st.session_state.edit_problem_id = problem.get("id")
-                    st.rerun()
-                
-                if st.button("문제 삭제", key=f"delete_{i}"):
-                    # 삭제 확인
-                    if st.button(f"정말 삭제하시겠습니까?", key=f"confirm_delete_{i}"):
-                        # 문제 삭제
-                        st.session_state.teacher_problems[st.session_state.username] = [
-                            p for p in st.session_state.teacher_problems[st.session_state.username] 
-                            if p.get("id") != problem.get("id")
-                        ]
+            if st.button("문제 삭제", key=f"delete_{i}"):
+                # 삭제 확인
+                if st.button(f"정말 삭제하시겠습니까?", key=f"confirm_delete_{i}"):
+                    # 문제 삭제
+                    with shared_data_lock():
+                        my_problems = owned_problems(st.session_state.teacher_problems, st.session_state.username)
+                        my_problems[:] = [p for p in my_problems if p.get("id") != problem.get("id")]
                         
                         # 변경사항 저장
-                        save_teacher_problems()
-                        
-                        st.success("문제가 삭제되었습니다.")
-                        time.sleep(2)
-                        st.rerun()
+                        save_teacher_problems([st.session_state.username])
+                    
+                    st.success("문제가 삭제되었습니다.")
+                    time.sleep(2)
+                    st.rerun()
+    
+    paginated_list(
+        filtered_problems, "teacher_problem_list", problem_header, problem_body,
+        sort_options={
+            "최신순": (lambda p: p.get("created_at", ""), True),
+            "난이도순": (lambda p: DIFFICULTY_ORDER.get(p.get("difficulty", "보통"), 1), False)
+        }
+    )
 
 # teacher_grading 함수 추가
 def teacher_grading():
     st.header("학생 답안 채점")
     
-    # 채점할 답안 찾기 (완료되지 않은 답안)
-    pending_submissions = []
+    # 채점 대기열 (오래된 제출물부터)
+    grading_queue = get_data_store().grading_queue
+    problems = get_problem_store()
+    pending_count = grading_queue.pending_count(st.session_state.username)
     
-    for student_id, student_record in st.session_state.student_records.items():
-        student_name = st.session_state.users.get(student_id, {}).get("name", student_id)
-        
-        for problem_id, problem_data in student_record.get("problems", {}).items():
-            if problem_data.get("status") == "submitted" and not problem_data.get("score"):
-                # 문제 정보 가져오기
-                problem_info = None
-                if problem_id in st.session_state.teacher_problems:
-                    problem_info = st.session_state.teacher_problems[problem_id]
-                else:
-                    # 교사별 문제 목록에서 찾기
-                    for teacher_id, problems in st.session_state.teacher_problems.items():
-                        for problem in problems:
-                            if problem.get("id") == problem_id:
-                                problem_info = problem
-                                break
-                        if problem_info:
-                            break
-                
-                if problem_info and problem_info.get("created_by") == st.session_state.username:
-                    # 내가 출제한 문제만 추가
-                    pending_submissions.append({
-                        "student_id": student_id,
-                        "student_name": student_name,
-                        "problem_id": problem_id,
-                        "problem_title": problem_info.get("title", "제목 없음"),
-                        "submitted_at": problem_data.get("submitted_at", "")
-                    })
+    if pending_count == 0:
+        st.info("현재 채점할 답안이 없습니다.")
+        return
+    
+    # 대기열 페이지 선택
+    page_size = 20
+    page_count = (pending_count + page_size - 1) // page_size
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.write(f"채점 대기 중인 답안: {pending_count}개")
+    with col2:
+        # 채점으로 대기열이 줄어든 경우 마지막 페이지로 조정
+        if st.session_state.get("grading_queue_page", 1) > page_count:
+            st.session_state.grading_queue_page = page_count
+        page = st.number_input("페이지:", min_value=1, max_value=page_count, key="grading_queue_page")
+    
+    # AI 사전 채점: 초안이 없는 서술형 답안을 백그라운드 작업으로 한꺼번에 채점
+    candidates = pregrade_candidates(st.session_state.username)
+    if candidates:
+        show_ai_budget()
+    if candidates and st.button(f"AI 사전 채점 (초안이 없는 서술형 답안 {len(candidates)}개)"):
+        success, message = submit_pregrade_job(candidates)
+        if success:
+            st.success("AI 사전 채점 작업이 등록되었습니다. 초안이 작성되는 대로 아래 목록에 표시됩니다.")
+            st.info("'내 작업' 메뉴에서 진행 상황을 확인할 수 있습니다.")
+        else:
+            st.error(message)
+    
+    pending_submissions = []
+    with shared_data_lock():
+        for item in grading_queue.page(st.session_state.username, (page - 1) * page_size, page_size):
+            problem_info = problems.get(item["problem_id"], {})
+            record = pending_record(item["student_id"], item["problem_id"])
+            if record is None:
+                continue
+            pending_submissions.append({
+                "student_id": item["student_id"],
+                "student_name": st.session_state.users.get(item["student_id"], {}).get("name", item["student_id"]),
+                "problem_id": item["problem_id"],
+                "problem_title": problem_info.get("title", "제목 없음"),
+                "submitted_at": item["submitted_at"],
+                "answer": record.get("answer", ""),
+                "ai_draft": record.get("ai_draft")
+            })
     
     if not pending_submissions:
         st.info("현재 채점할 답안이 없습니다.")
         return
     
+    # AI 초안 일괄 수락 (이 페이지에서 초안이 있는 답안을 AI 점수와 피드백으로 채점 완료)
+    drafted_submissions = [submission for submission in pending_submissions if submission["ai_draft"]]
+    if drafted_submissions:
+        with st.expander(f"AI 초안 일괄 수락 ({len(drafted_submissions)}개)"):
+            with st.form("accept_ai_drafts"):
+                st.caption("선택을 해제한 답안은 아래 채점 폼에서 하나씩 확인하고 수정할 수 있습니다.")
+                selected = []
+                for submission in drafted_submissions:
+                    label = f"{submission['student_name']} - {submission['problem_title']}: AI 점수 {submission['ai_draft']['score']}점"
+                    if st.checkbox(label, value=True, key=f"accept_draft_{submission['student_id']}_{submission['problem_id']}"):
+                        selected.append(submission)
+                
+                if st.form_submit_button("선택한 답안 AI 초안으로 채점 완료"):
+                    with shared_data_lock():
+                        changed = []
+                        for submission in selected:
+                            draft = submission["ai_draft"]
+                            # 화면을 그린 뒤 다른 교사가 채점했거나 학생이 답안을 바꾼 경우는 건너뜀
+                            record = pending_record(submission["student_id"], submission["problem_id"])
+                            if record is None or record.get("ai_draft") != draft or record.get("answer", "") != draft.get("answer", submission["answer"]):
+                                continue
+                            apply_grade(submission["student_id"], submission["problem_id"], draft["score"], draft_feedback(draft), ai_assisted=True)
+                            changed.append((submission["student_id"], submission["problem_id"]))
+                        
+                        if changed:
+                            save_student_records(changed)
+                    st.success(f"{len(changed)}개 답안의 채점이 완료되었습니다.")
+                    if len(changed) < len(selected):
+                        st.warning(f"{len(selected) - len(changed)}개 답안은 그사이 채점되었거나 답안이 바뀌어 건너뛰었습니다.")
+                    time.sleep(1)
+                    st.rerun()
+    
     # 채점할 답안 선택
     selected_submission_idx = st.selectbox(
         "채점할 답안 선택:",
         range(len(pending_submissions)),
-        format_func=lambda x: f"{pending_submissions[x]['student_name']} - {pending_submissions[x]['problem_title']} ({pending_submissions[x]['submitted_at'][:10]})"
+        format_func=lambda x: f"{'🤖 ' if pending_submissions[x]['ai_draft'] else ''}{pending_submissions[x]['student_name']} - {pending_submissions[x]['problem_title']} ({pending_submissions[x]['submitted_at'][:10]})"
     )
     
     selected_submission = pending_submissions[selected_submission_idx]
@@ -2229,20 +2589,13 @@ def teacher_grading():
     problem_id = selected_submission["problem_id"]
     
     # 문제 및 답안 정보 가져오기
-    problem_info = None
-    for teacher_id, problems in st.session_state.teacher_problems.items():
-        for problem in problems:
-            if problem.get("id") == problem_id:
-                problem_info = problem
-                break
-        if problem_info:
-            break
+    problem_info = problems.get(problem_id)
     
     if not problem_info:
         st.error("문제 정보를 찾을 수 없습니다.")
         return
     
-    student_answer = st.session_state.student_records[student_id]["problems"][problem_id].get("answer", "")
+    student_answer = selected_submission["answer"]
     
     # 채점 폼 표시
     st.subheader("채점 폼")
@@ -2268,26 +2621,64 @@ def teacher_grading():
     st.subheader("학생 답안")
     st.write(student_answer)
     
+    # AI 채점 초안 표시 (있으면 점수와 피드백 기본값으로 사용)
+    draft = selected_submission["ai_draft"]
+    if draft:
+        with st.expander(f"🤖 AI 채점 초안 (점수: {draft['score']}점)", expanded=True):
+            for name, label in SECTION_LABELS.items():
+                if draft["sections"].get(name):
+                    st.markdown(f"**{label}**")
+                    st.markdown(draft["sections"][name])
+    
     # 채점 입력
-    score = st.number_input("점수 (0-100):", min_value=0, max_value=100, value=80)
-    feedback = st.text_area("피드백:", value=generate_default_feedback(score))
+    score = st.number_input("점수 (0-100):", min_value=0, max_value=100, value=draft["score"] if draft else 80)
+    feedback = st.text_area("피드백:", value=draft_feedback(draft) if draft else generate_default_feedback(score), height=250 if draft else None)
     
-    # 채점 완료 버튼
+    # 채점 완료 버튼 (AI 초안이 있었으면 수정 여부와 관계없이 AI 보조 채점으로 기록)
     if st.button("채점 완료"):
         # 학생 기록 업데이트
-        st.session_state.student_records[student_id]["problems"][problem_id]["score"] = score
-        st.session_state.student_records[student_id]["problems"][problem_id]["feedback"] = feedback
-        st.session_state.student_records[student_id]["problems"][problem_id]["graded_by"] = st.session_state.username
-        st.session_state.student_records[student_id]["problems"][problem_id]["graded_at"] = datetime.now().isoformat()
-        st.session_state.student_records[student_id]["problems"][problem_id]["status"] = "completed"
-        
-        # 변경사항 저장
-        save_student_records()
+        with shared_data_lock():
+            record = pending_record(student_id, problem_id)
+            graded = record is not None and record.get("answer", "") == student_answer
+            if graded:
+                apply_grade(student_id, problem_id, score, feedback, ai_assisted=bool(draft))
+                
+                # 변경사항 저장
+                save_student_record(student_id, problem_id)
         
+        if not graded:
+            st.warning("그사이 다른 교사가 채점했거나 학생이 답안을 바꾸었습니다. 목록을 새로 불러옵니다.")
+            time.sleep(2)
+            st.rerun()
         st.success("채점이 완료되었습니다.")
         time.sleep(2)
         st.rerun()
 
+# 채점 대기 중인 학생 기록 (삭제되었거나 이미 채점된 경우 None, 공유 데이터 잠금 안에서 호출)
+def pending_record(student_id, problem_id):
+    record = st.session_state.student_records.get(student_id, {}).get("problems", {}).get(problem_id)
+    return record if record and is_pending_grading(record) else None
+
+# 학생 기록에 채점 결과 반영 (저장은 호출하는 쪽에서)
+def apply_grade(student_id, problem_id, score, feedback, ai_assisted=False):
+    record = st.session_state.student_records[student_id]["problems"][problem_id]
+    record["score"] = score
+    record["feedback"] = feedback
+    record["graded_by"] = st.session_state.username
+    record["graded_at"] = datetime.now().isoformat()
+    record["status"] = "completed"
+    if ai_assisted:
+        record["ai_assisted"] = True
+
+# AI 채점 초안의 교정 항목으로 학생에게 보여줄 피드백 구성
+def draft_feedback(draft):
+    sections = draft.get("sections", {})
+    parts = []
+    for name in ("overall", "corrected_version", "grammar", "vocabulary", "style"):
+        if sections.get(name):
+            parts.append(f"[{SECTION_LABELS[name]}]\n{sections[name]}")
+    return "\n\n".join(parts) or generate_default_feedback(draft.get("score", 0))
+
 # 기본 피드백 생성 함수
 def generate_default_feedback(score):
     if score >= 90:
@@ -2320,26 +2711,12 @@ def student_my_info():
     with col2:
         st.subheader("학습 통계")
         
-        # 학생 기록 불러오기
-        student_records = st.session_state.student_records.get(st.session_state.username, {})
-        problems = student_records.get("problems", {})
+        # 제출/채점 때마다 갱신되는 학생별 통계
+        stats = get_data_store().record_stats.student(st.session_state.username)
         
-        # 기본 통계 계산
-        problems_attempted = len(problems)
-        problems_completed = sum(1 for problem in problems.values() 
-                                if problem.get("status") == "completed")
-        
-        total_score = sum(problem.get("score", 0) for problem in problems.values() 
-                          if problem.get("status") == "completed")
-        
-        if problems_completed > 0:
-            average_score = total_score / problems_completed
-        else:
-            average_score = 0
-        
-        st.write(f"**시도한 문제 수:** {problems_attempted}")
-        st.write(f"**완료한 문제 수:** {problems_completed}")
-        st.write(f"**평균 점수:** {average_score:.1f}")
+        st.write(f"**시도한 문제 수:** {stats['attempted']}")
+        st.write(f"**완료한 문제 수:** {stats['completed']}")
+        st.write(f"**평균 점수:** {stats['average_score']:.1f}")
     
     # 비밀번호 변경 섹션
     st.markdown("---")
@@ -2366,30 +2743,38 @@ def student_my_info():
             if verify_password(student_data.get("password_hash", ""), current_password):
                 # 새 비밀번호로 업데이트
                 password_hash = hash_password(new_password)
-                st.session_state.users[st.session_state.username]["password_hash"] = password_hash
-                
-                # 비밀번호 초기화 플래그 제거 (교사가 초기화한 경우)
-                if "password_reset_by_teacher" in st.session_state.users[st.session_state.username]:
-                    st.session_state.users[st.session_state.username].pop("password_reset_by_teacher", None)
-                
-                save_users_data()
+                with shared_data_lock():
+                    st.session_state.users[st.session_state.username]["password_hash"] = password_hash
+                    
+                    # 비밀번호 초기화 플래그 제거 (교사가 초기화한 경우)
+                    if "password_reset_by_teacher" in st.session_state.users[st.session_state.username]:
+                        st.session_state.users[st.session_state.username].pop("password_reset_by_teacher", None)
+                    
+                    save_users_data([st.session_state.username])
                 st.success("비밀번호가 성공적으로 변경되었습니다.")
             else:
                 st.error("현재 비밀번호가 올바르지 않습니다.")
 
-# save_teacher_problems 함수 추가
-def save_teacher_problems():
+# save_teacher_problems 함수 추가 (changed: 변경된 교사 아이디/문제 ID 목록, 없으면 전체 저장)
+def save_teacher_problems(changed=None):
     try:
-        with open("data/teacher_problems.json", "w") as f:
-            json.dump(st.session_state.teacher_problems, f, indent=2)
+        get_data_store().save("teacher_problems", changed)
     except Exception as e:
         st.error(f"문제 데이터 저장 중 오류 발생: {str(e)}")
 
-# save_student_records 함수 추가
-def save_student_records():
+# save_student_records 함수 추가 (전체 기록을 다시 씀, 복원 등 일괄 변경용)
+# changed: 변경된 (학생 ID, 문제 ID) 목록 (없으면 전체 저장)
+def save_student_records(changed=None):
+    try:
+        get_data_store().save("student_records", changed)
+    except Exception as e:
+        st.error(f"학생 기록 저장 중 오류 발생: {str(e)}")
+
+# 변경된 학생 기록만 저장
+def save_student_record(student_id, problem_id=None):
+    """학생 기록 하나를 저장합니다. problem_id가 없으면 학생의 전체 기록을 저장합니다."""
     try:
-        with open("data/student_records.json", "w") as f:
-            json.dump(st.session_state.student_records, f, indent=2)
+        get_data_store().save("student_records", [(student_id, problem_id)])
     except Exception as e:
         st.error(f"학생 기록 저장 중 오류 발생: {str(e)}")
 
@@ -2518,7 +2903,7 @@ def admin_dashboard():
         st.header("관리자 메뉴")
         selected_menu = st.radio(
             "메뉴 선택:",
-            ["사용자 관리", "API 설정", "백업/복원"]
+            ["사용자 관리", "API 설정", "AI 사용량", "백업/복원"]
         )
         
         # 로그아웃 버튼
@@ -2531,6 +2916,8 @@ def admin_dashboard():
         admin_user_management()
     elif selected_menu == "API 설정":
         admin_api_settings()
+    elif selected_menu == "AI 사용량":
+        admin_llm_usage()
     elif selected_menu == "백업/복원":
         admin_backup_restore()
 
@@ -2592,8 +2979,9 @@ def admin_user_management():
                     with col1:
                         if st.button("승인", key=f"approve_{username}"):
                             # 교사로 승인
-                            st.session_state.users[username]["role"] = "teacher"
-                            save_users_data()
+                            with shared_data_lock():
+                                st.session_state.users[username]["role"] = "teacher"
+                                save_users_data([username])
                             st.success(f"{user_data.get('name', '')}님이 교사로 승인되었습니다.")
                             time.sleep(2)
                             st.rerun()
@@ -2601,8 +2989,9 @@ def admin_user_management():
                     with col2:
                         if st.button("거부", key=f"reject_{username}"):
                             # 사용자 삭제
-                            st.session_state.users.pop(username, None)
-                            save_users_data()
+                            with shared_data_lock():
+                                st.session_state.users.pop(username, None)
+                                save_users_data([username])
                             st.success(f"{user_data.get('name', '')}님의 교사 신청이 거부되었습니다.")
                             time.sleep(2)
                             st.rerun()
@@ -2621,8 +3010,9 @@ def admin_user_management():
                         
                         if st.button("역할 변경", key=f"change_role_{username}"):
                             # 역할 변경
-                            st.session_state.users[username]["role"] = new_role
-                            save_users_data()
+                            with shared_data_lock():
+                                st.session_state.users[username]["role"] = new_role
+                                save_users_data([username])
                             st.success(f"{user_data.get('name', '')}님의 역할이 {new_role}로 변경되었습니다.")
                             time.sleep(2)
                             st.rerun()
@@ -2633,20 +3023,21 @@ def admin_user_management():
                             
                             if confirmation == "삭제확인":
                                 # 사용자 삭제
-                                st.session_state.users.pop(username, None)
-                                
-                                # 교사인 경우 출제한 문제 삭제
-                                if user_data.get("role") == "teacher" and username in st.session_state.teacher_problems:
-                                    st.session_state.teacher_problems.pop(username, None)
-                                
-                                # 학생인 경우 학습 기록 삭제
-                                if user_data.get("role") == "student" and username in st.session_state.student_records:
-                                    st.session_state.student_records.pop(username, None)
-                                
-                                # 변경사항 저장
-                                save_users_data()
-                                save_teacher_problems()
-                                save_student_records()
+                                with shared_data_lock():
+                                    st.session_state.users.pop(username, None)
+                                    
+                                    # 교사인 경우 출제한 문제 삭제
+                                    if user_data.get("role") == "teacher" and username in st.session_state.teacher_problems:
+                                        st.session_state.teacher_problems.pop(username, None)
+                                    
+                                    # 학생인 경우 학습 기록 삭제
+                                    if user_data.get("role") == "student" and username in st.session_state.student_records:
+                                        st.session_state.student_records.pop(username, None)
+                                        save_student_record(username)
+                                    
+                                    # 변경사항 저장
+                                    save_users_data([username])
+                                    save_teacher_problems([username])
                                 
                                 st.success(f"{user_data.get('name', '')}님이 삭제되었습니다.")
                                 time.sleep(2)
@@ -2690,6 +3081,9 @@ def admin_api_settings():
     st.header("API 설정")
     st.info("API 키를 설정하고 관리합니다.")
     
+    if uses_fake_llm():
+        st.warning("⚠️ 가짜 AI 모델(LLM_PROVIDER=fake 또는 openai 패키지 없음)을 사용 중입니다. OpenAI API는 호출되지 않습니다.")
+    
     # 탭 생성
     tab1, tab2, tab3 = st.tabs(["OpenAI API 설정", "API 키 저장", "하드코딩된 키 설정"])
     
@@ -2704,7 +3098,10 @@ def admin_api_settings():
             st.code(masked_key)
             
             if st.button("API 키 초기화"):
+                # 이전 키의 공유 클라이언트와 연결 풀을 닫음 (같은 키를 다시 쓰면 새로 만듦)
+                get_openai_clients().discard(current_key)
                 st.session_state.openai_api_key = ""
+                st.session_state.pop("openai_client", None)
                 st.rerun()
         else:
             st.warning("⚠️ OpenAI API 키가 설정되지 않았습니다.")
@@ -2732,7 +3129,7 @@ def admin_api_settings():
                 with st.spinner("OpenAI API에 연결 중..."):
                     try:
                         # 실제로는 여기서 OpenAI API 호출
-                        client = openai.OpenAI(api_key=api_key)
+                        client = get_openai_client(api_key, "connection_test")
                         response = client.chat.completions.create(
                             model="gpt-3.5-turbo",
                             messages=[
@@ -2747,6 +3144,37 @@ def admin_api_settings():
                         st.markdown(response.choices[0].message.content)
                     except Exception as e:
                         st.error(f"❌ API 연결 실패: {str(e)}")
+        
+        # AI 응답 캐시 현황
+        st.subheader("AI 응답 캐시")
+        cache_stats = get_llm_cache().stats()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("적중률", f"{cache_stats['hit_rate'] * 100:.1f}%")
+        with col2:
+            st.metric("적중 / 미적중", f"{cache_stats['hits']} / {cache_stats['misses']}")
+        with col3:
+            st.metric("저장된 응답", f"{cache_stats['entries']}개 ({cache_stats['bytes'] / 1024:.1f} KB)")
+        
+        if st.button("캐시 비우기"):
+            get_llm_cache().clear()
+            st.success("✅ AI 응답 캐시를 비웠습니다.")
+            st.rerun()
+        
+        # AI 요청 스케줄러 현황
+        st.subheader("AI 요청 대기열")
+        scheduler_stats = get_llm_scheduler().stats()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("대기 중", scheduler_stats["queued"], help=f"최대 {scheduler_stats['max_queued']}")
+        with col2:
+            st.metric("처리 중", scheduler_stats["running"])
+        with col3:
+            st.metric("재시도 / 429", f"{scheduler_stats['retries']} / {scheduler_stats['rate_limited']}")
+        with col4:
+            st.metric("총 대기 시간", f"{scheduler_stats['wait_seconds']:.1f}초")
     
     # API 키 저장 탭
     with tab2:
@@ -2861,12 +3289,113 @@ DEFAULT_OPENAI_API_KEY = "your_default_openai_key_here"  # 이 부분을 실제
         
         st.warning("보안상의 이유로 이 환경에서는 하드코딩된 키를 직접 변경할 수 없습니다. 소스 코드를 직접 수정해야 합니다.")
 
+# 관리자 AI 사용량 대시보드 (교사별/기능별/모델별 토큰과 예상 비용, 교사별 월 예산)
+def admin_llm_usage():
+    st.header("AI 사용량")
+    
+    meter = get_usage_meter()
+    users = st.session_state.users
+    
+    periods = {"오늘": 0, "최근 7일": 7, "이번 달": None, "최근 90일": 90}
+    period = st.selectbox("기간:", list(periods.keys()), index=1)
+    now = datetime.now()
+    if periods[period] is None:
+        since = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        since = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=periods[period])
+    
+    totals = meter.summary(since, group_by=())
+    total = totals[0] if totals else {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "avg_latency": 0.0, "errors": 0}
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("호출 수", total["calls"], help=f"오류 {total['errors']}회")
+    with col2:
+        st.metric("토큰 (입력 / 출력)", f"{total['prompt_tokens']:,} / {total['completion_tokens']:,}")
+    with col3:
+        st.metric("예상 비용", f"${total['cost']:.4f}")
+    with col4:
+        st.metric("평균 응답 시간", f"{total['avg_latency']:.2f}초")
+    
+    if not total["calls"]:
+        st.info("이 기간에 기록된 AI 사용량이 없습니다.")
+    else:
+        # 일별 비용 추이
+        daily = sorted(meter.summary(since, group_by=("day",)), key=lambda row: row["day"])
+        st.subheader("일별 예상 비용 (USD)")
+        st.bar_chart({row["day"]: row["cost"] for row in daily})
+        
+        def usage_rows(rows, label_field, format_label):
+            return [
+                {
+                    label_field: format_label(row),
+                    "호출 수": row["calls"],
+                    "입력 토큰": row["prompt_tokens"],
+                    "출력 토큰": row["completion_tokens"],
+                    "예상 비용(USD)": round(row["cost"], 4),
+                    "평균 응답 시간(초)": round(row["avg_latency"], 2),
+                    "오류": row["errors"]
+                }
+                for row in rows
+            ]
+        
+        tab1, tab2, tab3 = st.tabs(["사용자별", "기능별", "모델별"])
+        with tab1:
+            st.dataframe(usage_rows(
+                meter.summary(since, group_by=("user",)), "사용자",
+                lambda row: f"{users.get(row['user'], {}).get('name', row['user'])} ({row['user']})"
+            ))
+        with tab2:
+            st.dataframe(usage_rows(
+                meter.summary(since, group_by=("feature",)), "기능",
+                lambda row: FEATURES.get(row["feature"], row["feature"])
+            ))
+        with tab3:
+            st.dataframe(usage_rows(meter.summary(since, group_by=("model",)), "모델", lambda row: row["model"]))
+    
+    # 교사별 월 예산 (예산을 넘길 요청은 AI를 호출하기 전에 거절)
+    st.subheader("교사별 월 예산")
+    teachers = sorted(username for username, user in users.items() if user.get("role") == "teacher")
+    if not teachers:
+        st.info("등록된 교사가 없습니다.")
+        return
+    
+    budgets = meter.budgets()
+    budget_rows = []
+    for username in teachers:
+        spent = meter.monthly_spend(username)
+        limit = budgets.get(username)
+        budget_rows.append({
+            "교사": f"{users[username].get('name', username)} ({username})",
+            "이번 달 사용액(USD)": round(spent, 4),
+            "월 예산(USD)": "없음" if limit is None else f"{limit:.2f}",
+            "사용률": "-" if not limit else f"{spent / limit * 100:.1f}%"
+        })
+    st.dataframe(budget_rows)
+    
+    with st.form("usage_budget_form"):
+        teacher = st.selectbox("교사 선택:", teachers, format_func=lambda username: f"{users[username].get('name', username)} ({username})")
+        amount = st.number_input("월 예산 (USD, 0이면 제한 없음):", min_value=0.0, value=0.0, step=1.0)
+        
+        if st.form_submit_button("예산 저장"):
+            meter.set_budget(teacher, amount if amount > 0 else None)
+            st.success("✅ 예산이 저장되었습니다.")
+            st.rerun()
+
 # 관리자 백업/복원 함수
+def describe_stored_backup(item):
+    """보관된 백업의 선택 목록 표시 문자열"""
+    manifest = item["manifest"] or {}
+    kind = "차등" if manifest.get("kind") == DIFF else "전체"
+    modified = datetime.fromtimestamp(item["modified"]).strftime('%Y-%m-%d %H:%M')
+    return f"{item['name']} ({kind}, {item['size'] / 1024:.1f} KB, {modified})"
+
+
 def admin_backup_restore():
     st.header("백업 및 복원")
     
     # cryptography 패키지 체크
-    crypto_available = is_package_available("cryptography")
+    crypto_available = encryption_available()
     
     # 탭 생성
     tab1, tab2 = st.tabs(["백업", "복원"])
@@ -2883,13 +3412,30 @@ def admin_backup_restore():
         include_repository = st.checkbox("문제 저장소 포함", value=True)
         
         # 파일 형식 선택
-        file_format = st.radio("백업 파일 형식", ["JSON", "CSV"])
+        file_format = st.radio("백업 파일 형식", ["백업 아카이브", "CSV"], help="백업 아카이브는 데이터셋별로 압축된 파일(.edubak)이며 서버의 백업 폴더에도 보관됩니다.")
+        
+        # 차등 백업: 기준 백업 이후 바뀐 레코드만 기록 (레코드 색인이 있는 보관 백업만 기준으로 사용 가능)
+        base_backup = None
+        if file_format == "백업 아카이브":
+            backup_type = st.radio("백업 종류", ["전체 백업", "차등 백업"], horizontal=True,
+                                   help="차등 백업은 기준 백업 이후 추가, 변경, 삭제된 레코드만 기록합니다. 복원할 때는 기준이 되는 백업들이 모두 필요합니다.")
+            if backup_type == "차등 백업":
+                base_candidates = [item for item in list_backup_files(BACKUP_DIR) if item["manifest"]]
+                if base_candidates:
+                    base_backup = st.selectbox(
+                        "기준 백업:",
+                        base_candidates,
+                        format_func=lambda item: f"{item['name']} ({'차등' if item['manifest'].get('kind') == DIFF else '전체'})"
+                    )
+                    st.caption("차등 백업에는 기준 백업에 포함된 데이터만 기록되며, 같은 암호화 키를 사용해야 합니다.")
+                else:
+                    st.warning("기준으로 사용할 보관된 백업이 없습니다. 먼저 전체 백업을 생성하세요.")
         
         # 암호화 옵션 (cryptography 라이브러리가 있는 경우에만)
         encrypt_backup = False
         encryption_key = ""
         
-        if crypto_available and file_format == "JSON":
+        if crypto_available and file_format == "백업 아카이브":
             encrypt_backup = st.checkbox("백업 파일 암호화", value=False)
             if encrypt_backup:
                 encryption_key = st.text_input("암호화 키 (복원 시 필요)", type="password")
@@ -2898,80 +3444,60 @@ def admin_backup_restore():
         elif crypto_available and file_format == "CSV":
             st.info("CSV 형식은 암호화를 지원하지 않습니다.")
         else:
-            if file_format == "JSON":
+            if file_format == "백업 아카이브":
                 st.warning("암호화 기능을 사용하려면 'cryptography' 라이브러리를 설치하세요: pip install cryptography")
         
         # 백업 버튼
         if st.button("백업 파일 생성"):
-            if encrypt_backup and not encryption_key and file_format == "JSON":
+            if encrypt_backup and not encryption_key and file_format == "백업 아카이브":
                 st.error("암호화를 위한 키를 입력해주세요.")
             else:
-                # 백업 데이터 생성
-                backup_data = {
-                    "timestamp": datetime.now().isoformat(),
-                    "version": "1.0"
-                }
-                
+                # 백업할 데이터
+                datasets = {}
                 if include_users:
-                    backup_data["users"] = st.session_state.users
+                    datasets["users"] = st.session_state.users
                 
                 if include_problems:
-                    backup_data["teacher_problems"] = st.session_state.teacher_problems
+                    datasets["teacher_problems"] = st.session_state.teacher_problems
                 
                 if include_records:
-                    backup_data["student_records"] = st.session_state.student_records
+                    datasets["student_records"] = st.session_state.student_records
                 
                 if include_repository:
-                    backup_data["problem_repository"] = st.session_state.problem_repository
+                    datasets["problem_repository"] = st.session_state.problem_repository
                 
-                if file_format == "JSON":
-                    # JSON 형식으로 백업
-                    backup_json = json.dumps(backup_data, indent=2)
-                    
-                    # 필요한 경우 암호화
-                    if encrypt_backup and crypto_available:
-                        try:
-                            import base64
-                            from cryptography.fernet import Fernet
-                            from cryptography.hazmat.primitives import hashes
-                            from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-                            
-                            # 비밀번호로부터 키 생성
-                            salt = b'salt_'  # 실제 운영에서는 랜덤 솔트 사용
-                            kdf = PBKDF2HMAC(
-                                algorithm=hashes.SHA256(),
-                                length=32,
-                                salt=salt,
-                                iterations=100000
+                if base_backup is not None:
+                    datasets = {
+                        dataset: getattr(st.session_state, dataset)
+                        for dataset in base_backup["manifest"]["datasets"]
+                    }
+                
+                if file_format == "백업 아카이브":
+                    # 서버의 백업 폴더에 스트리밍으로 기록 (데이터셋별 압축 JSON Lines, 선택 시 암호화)
+                    # 기록하는 동안 다른 세션이 데이터를 바꾸지 않도록 잠금
+                    try:
+                        with get_data_store().lock:
+                            path, manifest = create_backup_file(
+                                BACKUP_DIR, datasets, encryption_key if encrypt_backup else None,
+                                base_name=base_backup["name"] if base_backup else None
                             )
-                            key = base64.urlsafe_b64encode(kdf.derive(encryption_key.encode()))
-                            f = Fernet(key)
-                            encrypted_backup = f.encrypt(backup_json.encode())
-                            
-                            # 암호화된 백업 파일 다운로드
-                            st.download_button(
-                                label="암호화된 백업 파일 다운로드",
-                                data=encrypted_backup,
-                                file_name=f"backup_encrypted_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                                mime="application/octet-stream"
+                        
+                        if manifest["kind"] == DIFF:
+                            record_counts = ", ".join(
+                                f"{name} 변경 {info['records']}건 / 삭제 {info['deleted']}건" for name, info in manifest["datasets"].items()
                             )
-                        except Exception as e:
-                            st.error(f"암호화 중 오류 발생: {str(e)}")
-                            st.info("일반 백업 파일로 다운로드합니다.")
+                        else:
+                            record_counts = ", ".join(f"{name} {info['records']}건" for name, info in manifest["datasets"].items())
+                        st.success(f"백업 파일이 생성되었습니다 ({os.path.getsize(path) / 1024:.1f} KB, {manifest['compression']} 압축): {record_counts}")
+                        with open(path, "rb") as f:
                             st.download_button(
-                                label="백업 파일 다운로드",
-                                data=backup_json,
-                                file_name=f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                                mime="application/json"
+                                label="암호화된 백업 파일 다운로드" if encrypt_backup else "백업 파일 다운로드",
+                                data=f,
+                                file_name=os.path.basename(path),
+                                mime="application/octet-stream"
                             )
-                    else:
-                        # 일반 백업 파일 다운로드
-                        st.download_button(
-                            label="백업 파일 다운로드",
-                            data=backup_json,
-                            file_name=f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                            mime="application/json"
-                        )
+                    except Exception as e:
+                        st.error(f"백업 파일 생성 중 오류 발생: {str(e)}")
                 else:
                     # CSV 형식으로 백업
                     try:
@@ -2980,21 +3506,23 @@ def admin_backup_restore():
                         
                         # 각 데이터를 DataFrame으로 변환
                         dfs = {}
-                        if include_users:
-                            users_df = pd.DataFrame.from_dict(st.session_state.users, orient='index')
-                            dfs['users'] = users_df
-                        
-                        if include_problems:
-                            problems_df = pd.DataFrame.from_dict(st.session_state.teacher_problems, orient='index')
-                            dfs['problems'] = problems_df
-                        
-                        if include_records:
-                            records_df = pd.DataFrame.from_dict(st.session_state.student_records, orient='index')
-                            dfs['records'] = records_df
-                        
-                        if include_repository:
-                            repository_df = pd.DataFrame(st.session_state.problem_repository.get('problems', []))
-                            dfs['repository'] = repository_df
+                        # 데이터를 읽는 동안 다른 세션이 바꾸지 않도록 잠금
+                        with shared_data_lock():
+                            if include_users:
+                                users_df = pd.DataFrame.from_dict(st.session_state.users, orient='index')
+                                dfs['users'] = users_df
+                            
+                            if include_problems:
+                                problems_df = pd.DataFrame.from_dict(st.session_state.teacher_problems, orient='index')
+                                dfs['problems'] = problems_df
+                            
+                            if include_records:
+                                records_df = pd.DataFrame.from_dict(st.session_state.student_records, orient='index')
+                                dfs['records'] = records_df
+                            
+                            if include_repository:
+                                repository_df = pd.DataFrame(st.session_state.problem_repository.get('problems', []))
+                                dfs['repository'] = repository_df
                         
                         # CSV 파일 생성
                         output = io.BytesIO()
@@ -3011,135 +3539,228 @@ def admin_backup_restore():
                         )
                     except Exception as e:
                         st.error(f"CSV 파일 생성 중 오류 발생: {str(e)}")
+        
+        # 서버에 보관된 백업 아카이브
+        stored_backups = list_backup_files(BACKUP_DIR)
+        if stored_backups:
+            st.subheader("보관된 백업")
+            selected_backup = st.selectbox(
+                "백업 선택:",
+                stored_backups,
+                format_func=describe_stored_backup
+            )
+            backup_path = os.path.join(BACKUP_DIR, selected_backup["name"])
+            manifest = selected_backup["manifest"]
+            if manifest and manifest.get("kind") == DIFF:
+                st.caption(f"기준 백업: {manifest['parent_file']}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                with open(backup_path, "rb") as f:
+                    st.download_button("선택한 백업 다운로드", data=f, file_name=selected_backup["name"], mime="application/octet-stream")
+            with col2:
+                if st.button("선택한 백업 삭제"):
+                    try:
+                        delete_backup_file(BACKUP_DIR, selected_backup["name"])
+                        st.rerun()
+                    except ValueError as e:
+                        st.error(str(e))
     
     # 복원 탭
     with tab2:
         st.subheader("데이터 복원")
         st.warning("경고: 복원 작업은 현재 데이터를 덮어쓰게 됩니다. 복원 전에 백업을 권장합니다.")
+        st.caption("복원 미리보기로 백업을 검사하고 추가, 변경, 삭제될 레코드 수를 확인한 뒤 복원을 실행합니다.")
         
         # 파일 형식 선택
-        restore_format = st.radio("복원 파일 형식", ["JSON", "CSV"])
-        
-        # 복원 파일 업로드
-        if restore_format == "JSON":
-            uploaded_file = st.file_uploader("백업 파일 선택", type=["json"])
+        restore_format = st.radio("복원 파일 형식", ["보관된 백업 (시점 복원)", "백업 아카이브", "CSV"])
+        
+        # 복원 파일 업로드 (.json은 이전 형식의 백업)
+        stored_backup = None
+        if restore_format == "보관된 백업 (시점 복원)":
+            uploaded_file = None
+            stored_backups = list_backup_files(BACKUP_DIR)
+            if stored_backups:
+                stored_backup = st.selectbox("복원할 시점:", stored_backups, format_func=describe_stored_backup)
+            else:
+                st.info("보관된 백업이 없습니다.")
+        elif restore_format == "백업 아카이브":
+            uploaded_file = st.file_uploader("백업 파일 선택", type=["edubak", "json"])
         else:
             uploaded_file = st.file_uploader("백업 파일 선택", type=["xlsx"])
         
-        # 암호화 옵션 (JSON 형식이고 cryptography 라이브러리가 있는 경우에만)
+        # 암호화 옵션 (백업 아카이브 형식이고 cryptography 라이브러리가 있는 경우에만)
         is_encrypted = False
         decrypt_key = ""
         
-        if crypto_available and restore_format == "JSON":
+        if crypto_available and restore_format != "CSV":
             is_encrypted = st.checkbox("암호화된 백업 파일")
             if is_encrypted:
                 decrypt_key = st.text_input("암호화 키 입력", type="password")
         
         # 복원 옵션
-        if uploaded_file is not None:
+        if uploaded_file is not None or stored_backup is not None:
             st.info("복원할 데이터 선택:")
             restore_users = st.checkbox("사용자 데이터 복원", value=True)
             restore_problems = st.checkbox("문제 데이터 복원", value=True)
             restore_records = st.checkbox("학습 기록 복원", value=True)
             restore_repository = st.checkbox("문제 저장소 복원", value=True)
             
-            if st.button("데이터 복원"):
+            restore_datasets = [
+                dataset for dataset, selected in (
+                    ("users", restore_users),
+                    ("teacher_problems", restore_problems),
+                    ("student_records", restore_records),
+                    ("problem_repository", restore_repository)
+                ) if selected
+            ]
+            # 미리보기 결과는 같은 원본, 같은 선택에서만 유효
+            if stored_backup is not None:
+                restore_target = ("stored", stored_backup["name"], tuple(restore_datasets))
+            else:
+                restore_target = ("upload", uploaded_file.name, uploaded_file.size, tuple(restore_datasets))
+            preview = st.session_state.get("restore_preview")
+            if preview is not None and preview["target"] != restore_target:
+                preview = st.session_state.restore_preview = None
+            
+            # 1단계: 백업을 스트리밍으로 읽으며 검사하고 추가/변경/삭제 건수 계산 (데이터는 바꾸지 않음)
+            if st.button("복원 미리보기"):
                 try:
-                    if restore_format == "JSON":
-                        # JSON 파일 복원
-                        file_content = uploaded_file.read()
-                        
-                        # 암호화된 파일 복호화
-                        if is_encrypted and crypto_available:
-                            if not decrypt_key:
-                                st.error("암호화된 파일을 복원하려면 암호화 키가 필요합니다.")
-                                return
-                            
-                            try:
-                                import base64
-                                from cryptography.fernet import Fernet
-                                from cryptography.hazmat.primitives import hashes
-                                from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-                                
-                                salt = b'salt_'
-                                kdf = PBKDF2HMAC(
-                                    algorithm=hashes.SHA256(),
-                                    length=32,
-                                    salt=salt,
-                                    iterations=100000
-                                )
-                                key = base64.urlsafe_b64encode(kdf.derive(decrypt_key.encode()))
-                                f = Fernet(key)
-                                decrypted_content = f.decrypt(file_content)
-                                backup_data = json.loads(decrypted_content)
-                            except Exception as e:
-                                st.error(f"복호화 실패: {str(e)}")
-                                return
-                        else:
-                            backup_data = json.loads(file_content)
-                        
-                        # 데이터 복원
-                        if restore_users and "users" in backup_data:
-                            st.session_state.users = backup_data["users"]
-                            save_users_data()
-                        
-                        if restore_problems and "teacher_problems" in backup_data:
-                            st.session_state.teacher_problems = backup_data["teacher_problems"]
-                            save_teacher_problems()
-                        
-                        if restore_records and "student_records" in backup_data:
-                            st.session_state.student_records = backup_data["student_records"]
-                            save_student_records()
-                        
-                        if restore_repository and "problem_repository" in backup_data:
-                            st.session_state.problem_repository = backup_data["problem_repository"]
-                            save_problem_repository()
-                    else:
-                        # CSV(Excel) 파일 복원
+                    source, files = open_restore_source(restore_format, uploaded_file, stored_backup, decrypt_key if is_encrypted else None)
+                    try:
+                        plan = plan_restore(source, get_data_store(), restore_datasets)
+                    finally:
+                        close_restore_source(source, files)
+                    preview = st.session_state.restore_preview = {"target": restore_target, "plan": plan}
+                except (ValueError, ImportError) as e:
+                    st.error(f"백업을 읽을 수 없습니다: {str(e)}")
+                except Exception as e:
+                    st.error(f"복원 미리보기 중 오류 발생: {str(e)}")
+            
+            if preview is not None:
+                plan = preview["plan"]
+                if not plan["datasets"]:
+                    st.warning("백업에 선택한 데이터가 없습니다.")
+                else:
+                    st.table([
+                        {
+                            "데이터": RESTORE_DATASET_LABELS[dataset],
+                            "백업 레코드": summary["records"],
+                            "추가": summary["added"],
+                            "변경": summary["changed"],
+                            "삭제": summary["deleted"],
+                            "유지": summary["unchanged"],
+                            "오류": summary["error_count"]
+                        }
+                        for dataset, summary in plan["datasets"].items()
+                    ])
+                    
+                    if not plan_is_valid(plan):
+                        st.error("백업에 올바르지 않은 레코드가 있어 복원할 수 없습니다.")
+                        for dataset, summary in plan["datasets"].items():
+                            for key, message in summary["errors"]:
+                                st.write(f"- {RESTORE_DATASET_LABELS[dataset]} {key}: {message}")
+                    # 2단계: 다시 스트리밍하며 달라진 레코드만 한 번에 적용 (실패하면 전부 되돌림)
+                    elif st.button("복원 실행", type="primary"):
                         try:
-                            import pandas as pd
-                            
-                            # Excel 파일 읽기
-                            excel_data = pd.read_excel(uploaded_file, sheet_name=None)
-                            
-                            # 데이터 복원
-                            if restore_users and 'users' in excel_data:
-                                users_df = excel_data['users']
-                                st.session_state.users = users_df.to_dict(orient='index')
-                                save_users_data()
-                            
-                            if restore_problems and 'problems' in excel_data:
-                                problems_df = excel_data['problems']
-                                st.session_state.teacher_problems = problems_df.to_dict(orient='index')
-                                save_teacher_problems()
-                            
-                            if restore_records and 'records' in excel_data:
-                                records_df = excel_data['records']
-                                st.session_state.student_records = records_df.to_dict(orient='index')
-                                save_student_records()
-                            
-                            if restore_repository and 'repository' in excel_data:
-                                repository_df = excel_data['repository']
-                                st.session_state.problem_repository = {
-                                    'problems': repository_df.to_dict(orient='records'),
-                                    'metadata': {
-                                        'last_updated': datetime.now().isoformat(),
-                                        'version': '1.0'
-                                    }
-                                }
-                                save_problem_repository()
+                            source, files = open_restore_source(restore_format, uploaded_file, stored_backup, decrypt_key if is_encrypted else None)
+                            try:
+                                apply_restore(source, get_data_store(), plan)
+                            finally:
+                                close_restore_source(source, files)
+                            st.session_state.restore_preview = None
+                            st.success("데이터가 성공적으로 복원되었습니다.")
+                        except (ValueError, ImportError) as e:
+                            st.error(f"복원하지 못했습니다. 데이터는 변경되지 않았습니다: {str(e)}")
                         except Exception as e:
-                            st.error(f"CSV 파일 복원 중 오류 발생: {str(e)}")
-                            return
-                    
-                    st.success("데이터가 성공적으로 복원되었습니다.")
-                    st.info("변경사항을 적용하려면 앱을 새로고침하세요.")
-                    
-                    if st.button("앱 새로고침"):
-                        st.rerun()
-                    
-                except Exception as e:
-                    st.error(f"복원 중 오류 발생: {str(e)}")
+                            st.error(f"복원 중 오류 발생: {str(e)}")
+
+RESTORE_DATASET_LABELS = {
+    "users": "사용자",
+    "teacher_problems": "문제",
+    "student_records": "학습 기록",
+    "problem_repository": "문제 저장소"
+}
+
+def open_restore_source(restore_format, uploaded_file, stored_backup, decrypt_key):
+    """
+    복원할 백업을 엽니다.
+
+    Returns:
+        tuple: (원본, 닫아야 할 파일 목록). 원본은 datasets()/records()로 레코드를 스트리밍합니다.
+    """
+    if stored_backup is not None:
+        # 전체 백업부터 선택한 시점까지의 차등 백업을 차례로 적용
+        files = []
+        try:
+            for name in backup_chain(BACKUP_DIR, stored_backup["name"]):
+                files.append(open(os.path.join(BACKUP_DIR, name), "rb"))
+            return BackupChain(files, decrypt_key), files
+        except Exception:
+            for f in files:
+                f.close()
+            raise
+    
+    uploaded_file.seek(0)
+    if restore_format == "백업 아카이브" and uploaded_file.name.endswith(ARCHIVE_EXTENSION):
+        # 백업 아카이브 (암호화 여부는 파일에서 확인)
+        archive = BackupArchive(uploaded_file, decrypt_key)
+        if archive.manifest.get("kind") == DIFF:
+            archive.close()
+            raise ValueError("차등 백업 파일은 단독으로 복원할 수 없습니다. 보관된 백업에서 시점 복원을 사용하세요.")
+        return archive, []
+    
+    if restore_format == "백업 아카이브":
+        # 이전 형식(JSON) 백업
+        file_content = uploaded_file.read()
+        
+        # 암호화된 파일 복호화 (이전 형식은 고정 솔트로 암호화되어 있음)
+        if decrypt_key is not None:
+            import base64
+            from cryptography.fernet import Fernet, InvalidToken
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+            
+            salt = b'salt_'
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=100000
+            )
+            key = base64.urlsafe_b64encode(kdf.derive(decrypt_key.encode()))
+            try:
+                file_content = Fernet(key).decrypt(file_content)
+            except InvalidToken:
+                raise ValueError("복호화 실패: 암호화 키가 올바르지 않습니다.")
+        return MemoryBackup(json.loads(file_content)), []
+    
+    # CSV(Excel) 파일
+    import pandas as pd
+    
+    excel_data = pd.read_excel(uploaded_file, sheet_name=None)
+    data = {}
+    if 'users' in excel_data:
+        data["users"] = excel_data['users'].to_dict(orient='index')
+    if 'problems' in excel_data:
+        data["teacher_problems"] = excel_data['problems'].to_dict(orient='index')
+    if 'records' in excel_data:
+        data["student_records"] = excel_data['records'].to_dict(orient='index')
+    if 'repository' in excel_data:
+        data["problem_repository"] = {
+            'problems': excel_data['repository'].to_dict(orient='records'),
+            'metadata': {
+                'last_updated': datetime.now().isoformat(),
+                'version': '1.0'
+            }
+        }
+    return MemoryBackup(data), []
+
+def close_restore_source(source, files):
+    if hasattr(source, "close"):
+        source.close()
+    for f in files:
+        f.close()
 
 # 패키지 가용성 체크 함수 추가
 def is_package_available(package_name):
@@ -0,0 +1,634 @@
+"""
+Streaming, compressed and optionally encrypted backup archives, full or
+differential.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import struct
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:
+    AESGCM = None
+
+FORMAT = "edu-backup"
+FORMAT_VERSION = 2
+ARCHIVE_EXTENSION = ".edubak"
+MANIFEST_MEMBER = "manifest.json"
+# 보관 폴더에 아카이브와 함께 두는 암호화되지 않은 파일 (목록 표시용 매니페스트, 차등 백업용 레코드 해시)
+MANIFEST_EXTENSION = ".manifest.json"
+INDEX_EXTENSION = ".index.gz"
+
+FULL = "full"
+DIFF = "diff"
+
+ENCRYPTION_MAGIC = b"EDUENC1\0"
+KDF_ITERATIONS = 200000
+CHUNK_SIZE = 64 * 1024
+_HEADER = struct.Struct(">8s16s4sII")
+_FRAME = struct.Struct(">BI")
+
+# 압축 해제 후 메모리에 두는 최대 크기 (넘으면 임시 파일 사용)
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def encryption_available():
+    return AESGCM is not None
+
+
+def default_compression():
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def dataset_records(dataset, data):
+    """
+    Yield ``(key, value)`` records of a dataset at the granularity it is
+    backed up and compared at.
+
+    Keys are lists: ``[username]`` for users, ``[owner]`` for teacher
+    problems, ``[student_id, problem_id]`` for student records (with
+    ``[student_id, None]`` holding the student's other fields), and
+    ``["problem", id]`` / ``["metadata"]`` for the problem repository, plus
+    an ``["order"]`` record listing the problem keys in repository order so
+    differential backups also carry reorders.
+    """
+    if dataset == "student_records":
+        for student_id, student_record in data.items():
+            shell = {name: value for name, value in student_record.items() if name != "problems"}
+            yield [student_id, None], shell
+            for problem_id, record in student_record.get("problems", {}).items():
+                yield [student_id, problem_id], record
+    elif dataset == "problem_repository":
+        problems = data.get("problems", [])
+        keys = [str(problem.get("id", f"#{position}")) for position, problem in enumerate(problems)]
+        yield ["metadata"], data.get("metadata", {})
+        yield ["order"], keys
+        for key, problem in zip(keys, problems):
+            yield ["problem", key], problem
+    else:
+        for key, value in data.items():
+            yield [key], value
+
+
+def assemble_dataset(dataset, records):
+    """Inverse of ``dataset_records``: build the dataset from ``(key, value)`` pairs."""
+    if dataset == "student_records":
+        data = {}
+        for key, value in records:
+            student = data.setdefault(key[0], {"problems": {}})
+            if key[1] is None:
+                student.update(value)
+                student.setdefault("problems", {})
+            else:
+                student["problems"][key[1]] = value
+        return data
+    if dataset == "problem_repository":
+        data = {"problems": [], "metadata": {}}
+        for key, value in records:
+            if key[0] == "metadata":
+                data["metadata"] = value
+            elif key[0] == "problem":
+                data["problems"].append(value)
+        return data
+    return {key[0]: value for key, value in records}
+
+
+class EncryptedWriter:
+    """
+    File-like writer that encrypts everything written to it.
+
+    The key is derived from the password with PBKDF2-SHA256 and a random
+    salt stored in the header, so every backup has its own key. Data is
+    sealed with AES-GCM in ``CHUNK_SIZE`` frames; each frame's nonce holds
+    a counter and its associated data the header and a final-frame flag,
+    so reordered, dropped or truncated frames fail to decrypt.
+    """
+
+    def __init__(self, fileobj, password, iterations=KDF_ITERATIONS, chunk_size=CHUNK_SIZE):
+        if AESGCM is None:
+            raise ImportError("백업 암호화에는 cryptography 패키지가 필요합니다.")
+        salt = os.urandom(16)
+        self._prefix = os.urandom(4)
+        self._header = _HEADER.pack(ENCRYPTION_MAGIC, salt, self._prefix, iterations, chunk_size)
+        self._aead = AESGCM(_derive_key(password, salt, iterations))
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._counter = 0
+        self.closed = False
+        fileobj.write(self._header)
+
+    def _seal(self, data, final):
+        nonce = self._prefix + struct.pack(">Q", self._counter)
+        self._counter += 1
+        ciphertext = self._aead.encrypt(nonce, bytes(data), self._header + bytes([final]))
+        self._fileobj.write(_FRAME.pack(final, len(ciphertext)))
+        self._fileobj.write(ciphertext)
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) > self._chunk_size:
+            self._seal(self._buffer[:self._chunk_size], 0)
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self._seal(self._buffer, 1)
+            self._buffer = bytearray()
+            self.closed = True
+
+
+def _derive_key(password, salt, iterations):
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    return kdf.derive(password.encode("utf-8"))
+
+
+def is_encrypted(fileobj):
+    position = fileobj.tell()
+    magic = fileobj.read(len(ENCRYPTION_MAGIC))
+    fileobj.seek(position)
+    return magic == ENCRYPTION_MAGIC
+
+
+def decrypt_stream(fileobj, password):
+    """
+    Yield the plaintext chunks of an ``EncryptedWriter`` stream.
+
+    Raises:
+        ValueError: Wrong password, or a damaged or truncated file.
+    """
+    if AESGCM is None:
+        raise ImportError("암호화된 백업을 읽으려면 cryptography 패키지가 필요합니다.")
+    header = fileobj.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("암호화된 백업 파일이 손상되었습니다.")
+    magic, salt, prefix, iterations, chunk_size = _HEADER.unpack(header)
+    if magic != ENCRYPTION_MAGIC:
+        raise ValueError("암호화된 백업 파일이 아닙니다.")
+    aead = AESGCM(_derive_key(password, salt, iterations))
+
+    counter = 0
+    while True:
+        frame = fileobj.read(_FRAME.size)
+        if len(frame) < _FRAME.size:
+            raise ValueError("암호화된 백업 파일이 중간에 끊겼습니다.")
+        final, length = _FRAME.unpack(frame)
+        ciphertext = fileobj.read(length)
+        nonce = prefix + struct.pack(">Q", counter)
+        counter += 1
+        try:
+            yield aead.decrypt(nonce, ciphertext, header + bytes([final]))
+        except InvalidTag:
+            raise ValueError("암호화 키가 올바르지 않거나 백업 파일이 손상되었습니다.")
+        if final:
+            return
+
+
+def _compressed_writer(member, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).stream_writer(member, closefd=False)
+    return gzip.GzipFile(fileobj=member, mode="wb", compresslevel=6)
+
+
+def _decompressed_reader(member, compression):
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd로 압축된 백업을 읽으려면 zstandard 패키지가 필요합니다.")
+        return zstandard.ZstdDecompressor().stream_reader(member)
+    return gzip.GzipFile(fileobj=member, mode="rb")
+
+
+def encode_record(key, value):
+    """One JSON Lines record of an archive member, as bytes."""
+    return (json.dumps([key, value], ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def record_hash(line):
+    """Content hash of an encoded record, compared by differential backups and restores."""
+    return hashlib.blake2b(line, digest_size=12).hexdigest()
+
+
+def write_backup(fileobj, datasets, password=None, compression=None, created_at=None, base=None):
+    """
+    Stream ``datasets`` into a backup archive written to ``fileobj``.
+
+    The archive is a zip file with one compressed JSON Lines member per
+    dataset (one ``[key, value]`` record per line, see
+    ``dataset_records``) and a ``manifest.json`` with record counts and
+    SHA-256 digests. Records are serialized and compressed one buffer at a
+    time, so memory stays bounded by the buffer size rather than the data.
+    With a ``password`` the whole archive is encrypted by
+    ``EncryptedWriter``.
+
+    With ``base`` the backup is differential: only records whose content
+    hash differs from the base's are written, and records missing since
+    the base are written as ``[key]`` deletion lines.
+
+    Args:
+        fileobj: Binary file object to write to.
+        datasets (dict): Dataset name -> data.
+        password (str): Encryption password, ``None`` for no encryption.
+        compression (str): ``"zstd"`` or ``"gzip"``, default zstd when installed.
+        created_at (str): Timestamp stored in the manifest.
+        base (dict): ``{"manifest": ..., "hashes": ...}`` of the snapshot
+            to diff against (see ``read_index``).
+
+    Returns:
+        tuple: ``(manifest, hashes)``; ``hashes`` maps dataset -> record
+        key (JSON text) -> content hash of every record now present.
+    """
+    compression = compression or default_compression()
+    extension = ".zst" if compression == "zstd" else ".gz"
+    manifest = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "backup_id": uuid.uuid4().hex,
+        "created_at": created_at or datetime.now().isoformat(),
+        "kind": DIFF if base else FULL,
+        "parent": base["manifest"]["backup_id"] if base else None,
+        "parent_file": base["manifest"]["file"] if base else None,
+        "compression": compression,
+        "encrypted": password is not None,
+        "datasets": {}
+    }
+    hashes = {}
+
+    target = EncryptedWriter(fileobj, password) if password is not None else fileobj
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for dataset, data in datasets.items():
+            member_name = dataset + ".jsonl" + extension
+            previous = base["hashes"].get(dataset, {}) if base else None
+            current = hashes[dataset] = {}
+            digest = hashlib.sha256()
+            count = deleted = 0
+            with archive.open(member_name, "w", force_zip64=True) as member:
+                writer = _compressed_writer(member, compression)
+                buffer = []
+                size = 0
+
+                def emit(line):
+                    nonlocal size
+                    digest.update(line)
+                    buffer.append(line)
+                    size += len(line)
+
+                for key, value in dataset_records(dataset, data):
+                    key_text = json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+                    line = encode_record(key, value)
+                    current[key_text] = record_hash(line)
+                    if previous is not None and previous.get(key_text) == current[key_text]:
+                        continue
+                    emit(line)
+                    count += 1
+                    if size >= CHUNK_SIZE:
+                        writer.write(b"".join(buffer))
+                        buffer = []
+                        size = 0
+
+                # 기준 백업 이후 없어진 레코드
+                for key_text in (previous or {}):
+                    if key_text not in current:
+                        emit(("[" + key_text + "]\n").encode("utf-8"))
+                        deleted += 1
+                writer.write(b"".join(buffer))
+                writer.close()
+            manifest["datasets"][dataset] = {
+                "member": member_name,
+                "records": count,
+                "deleted": deleted,
+                "total": len(current),
+                "sha256": digest.hexdigest()
+            }
+        archive.writestr(MANIFEST_MEMBER, json.dumps(manifest, ensure_ascii=False, indent=2))
+    if target is not fileobj:
+        target.close()
+    return manifest, hashes
+
+
+class BackupArchive:
+    """
+    Read access to a backup archive written by ``write_backup``.
+
+    Encrypted archives are decrypted chunk by chunk into a spooled
+    temporary file (kept in memory up to ``SPOOL_SIZE``, on disk beyond),
+    since the zip directory is at the end of the file. Records are then
+    decompressed and parsed one line at a time.
+
+    Args:
+        fileobj: Seekable binary file object of the archive.
+        password (str): Key of an encrypted archive.
+
+    Raises:
+        ValueError: Not a backup archive, wrong password or damaged file.
+    """
+
+    def __init__(self, fileobj, password=None):
+        self._spool = None
+        if is_encrypted(fileobj):
+            if not password:
+                raise ValueError("암호화된 백업 파일입니다. 암호화 키를 입력하세요.")
+            self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+            for chunk in decrypt_stream(fileobj, password):
+                self._spool.write(chunk)
+            self._spool.seek(0)
+            fileobj = self._spool
+
+        try:
+            self._zip = zipfile.ZipFile(fileobj)
+            self.manifest = json.loads(self._zip.read(MANIFEST_MEMBER))
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            self.close()
+            raise ValueError("백업 아카이브 형식이 아닙니다.")
+        if self.manifest.get("format") != FORMAT:
+            self.close()
+            raise ValueError("백업 아카이브 형식이 아닙니다.")
+
+    def datasets(self):
+        return list(self.manifest.get("datasets", {}))
+
+    def entries(self, dataset):
+        """
+        Yield ``(key, value, deleted)`` for every line of ``dataset``; keys
+        are tuples and deletion lines (differential backups) have
+        ``value`` ``None``.
+
+        Raises:
+            ValueError: If the member does not match the manifest's record
+                count or digest (checked once the member is fully read).
+        """
+        info = self.manifest["datasets"][dataset]
+        digest = hashlib.sha256()
+        count = deleted = 0
+        with self._zip.open(info["member"]) as member:
+            reader = io.BufferedReader(_decompressed_reader(member, self.manifest.get("compression", "gzip")))
+            for line in reader:
+                digest.update(line)
+                entry = json.loads(line)
+                if len(entry) == 1:
+                    deleted += 1
+                    yield tuple(entry[0]), None, True
+                else:
+                    count += 1
+                    yield tuple(entry[0]), entry[1], False
+        if count != info["records"] or deleted != info.get("deleted", 0) or digest.hexdigest() != info["sha256"]:
+            raise ValueError(f"백업의 {dataset} 데이터가 손상되었습니다.")
+
+    def records(self, dataset):
+        """Yield the ``(key, value)`` records of a full backup's ``dataset``."""
+        for key, value, deleted in self.entries(dataset):
+            if not deleted:
+                yield key, value
+
+    def load(self, dataset):
+        """Return the whole dataset of a full backup assembled in memory."""
+        return assemble_dataset(dataset, self.records(dataset))
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def backup_file_name(manifest):
+    created_at = datetime.fromisoformat(manifest["created_at"]).strftime("%Y%m%d_%H%M%S")
+    kind = "diff" if manifest.get("kind") == DIFF else "backup"
+    return f"{kind}_{created_at}_{manifest['backup_id'][:8]}{ARCHIVE_EXTENSION}"
+
+
+def _sidecar(backup_dir, name, extension):
+    return os.path.join(backup_dir, name[:-len(ARCHIVE_EXTENSION)] + extension)
+
+
+def read_manifest(backup_dir, name):
+    """Return the stored manifest of archive ``name`` (``None`` if it has none)."""
+    try:
+        with open(_sidecar(backup_dir, name, MANIFEST_EXTENSION), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_index(backup_dir, name):
+    """
+    Return ``{"manifest", "hashes"}`` of archive ``name``, the base needed
+    for a differential backup on top of it.
+
+    Raises:
+        ValueError: If the archive has no record index (older backups).
+    """
+    manifest = read_manifest(backup_dir, name)
+    try:
+        with gzip.open(_sidecar(backup_dir, name, INDEX_EXTENSION), "rt", encoding="utf-8") as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        manifest = None
+    if manifest is None:
+        raise ValueError(f"{name}에는 차등 백업에 필요한 레코드 색인이 없습니다.")
+    return {"manifest": manifest, "hashes": hashes}
+
+
+def create_backup_file(backup_dir, datasets, password=None, compression=None, base_name=None):
+    """
+    Write a backup archive into ``backup_dir``.
+
+    The archive is streamed to a temporary file and renamed into place, so
+    a failed backup never leaves a partial archive behind. Next to it go
+    its manifest and the content hash of every record, which later
+    differential backups compare against. With ``base_name`` the backup is
+    a differential one on top of that archive.
+
+    Returns:
+        tuple: ``(path, manifest)``.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    base = read_index(backup_dir, base_name) if base_name else None
+    temp_path = os.path.join(backup_dir, f".{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            manifest, hashes = write_backup(f, datasets, password, compression, base=base)
+        name = backup_file_name(manifest)
+        manifest["file"] = name
+        manifest["size"] = os.path.getsize(temp_path)
+
+        with gzip.open(_sidecar(backup_dir, name, INDEX_EXTENSION), "wt", encoding="utf-8") as f:
+            json.dump(hashes, f, separators=(",", ":"))
+        with open(_sidecar(backup_dir, name, MANIFEST_EXTENSION), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        path = os.path.join(backup_dir, name)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path, manifest
+
+
+def list_backup_files(backup_dir):
+    """
+    Return the archives in ``backup_dir``, newest first, as dicts with
+    ``name``, ``size``, ``modified`` and ``manifest`` (``None`` for archives
+    without a stored manifest).
+    """
+    if not os.path.isdir(backup_dir):
+        return []
+    files = []
+    for name in os.listdir(backup_dir):
+        if name.endswith(ARCHIVE_EXTENSION):
+            stat = os.stat(os.path.join(backup_dir, name))
+            files.append({"name": name, "size": stat.st_size, "modified": stat.st_mtime, "manifest": read_manifest(backup_dir, name)})
+    return sorted(files, key=lambda item: item["modified"], reverse=True)
+
+
+def backup_chain(backup_dir, name):
+    """
+    Return the archive names needed to restore ``name``: its full base
+    followed by every differential backup up to and including ``name``.
+
+    Raises:
+        ValueError: If a backup of the chain is missing.
+    """
+    chain = []
+    while name:
+        if not os.path.exists(os.path.join(backup_dir, name)):
+            raise ValueError(f"복원에 필요한 백업 {name}이(가) 없습니다.")
+        chain.append(name)
+        manifest = read_manifest(backup_dir, name) or {}
+        name = manifest.get("parent_file")
+        if name in chain:
+            raise ValueError("백업 체인이 순환합니다.")
+    return list(reversed(chain))
+
+
+def dependent_backups(backup_dir, name):
+    """Names of the differential backups built directly on ``name``."""
+    return [
+        item["name"] for item in list_backup_files(backup_dir)
+        if item["manifest"] and item["manifest"].get("parent_file") == name
+    ]
+
+
+def delete_backup_file(backup_dir, name):
+    """Delete an archive and its sidecar files; refused while other backups depend on it."""
+    dependents = dependent_backups(backup_dir, name)
+    if dependents:
+        raise ValueError(f"이 백업을 기준으로 한 차등 백업이 있어 삭제할 수 없습니다: {', '.join(dependents)}")
+    for path in (os.path.join(backup_dir, name), _sidecar(backup_dir, name, MANIFEST_EXTENSION), _sidecar(backup_dir, name, INDEX_EXTENSION)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class BackupChain:
+    """
+    Point-in-time view of a chain of archives (a full backup and the
+    differential backups on top of it, oldest first).
+
+    ``records`` merges the chain without materializing the full backup:
+    the changes of the differential backups (small by design) are collected
+    first, newest wins, then the full backup is streamed with those changes
+    applied and the remaining new records appended. When a differential
+    backup changed the repository order, the problem records are gathered
+    and yielded in that order instead.
+
+    Args:
+        sources (list): Binary file objects of the archives, oldest first.
+        password (str): Key of encrypted archives (the same for the chain).
+    """
+
+    def __init__(self, sources, password=None):
+        self.archives = []
+        try:
+            for source in sources:
+                self.archives.append(BackupArchive(source, password))
+        except Exception:
+            self.close()
+            raise
+        if self.archives[0].manifest.get("kind", FULL) != FULL:
+            self.close()
+            raise ValueError("백업 체인은 전체 백업으로 시작해야 합니다.")
+        self.manifest = self.archives[-1].manifest
+
+    def datasets(self):
+        names = []
+        for archive in self.archives:
+            for dataset in archive.datasets():
+                if dataset not in names:
+                    names.append(dataset)
+        return names
+
+    def records(self, dataset):
+        """Yield the ``(key, value)`` records of ``dataset`` as of the last archive."""
+        changes = {}
+        for archive in reversed(self.archives[1:]):
+            if dataset not in archive.datasets():
+                continue
+            for key, value, deleted in archive.entries(dataset):
+                changes.setdefault(key, (value, deleted))
+
+        order, deleted = changes.get(("order",), (None, True))
+        if dataset != "problem_repository" or deleted:
+            yield from self._merge(dataset, changes)
+            return
+
+        # 순서가 바뀐 경우 문제 레코드를 모아 마지막 순서대로 내보냄
+        problems = {}
+        for key, value in self._merge(dataset, changes):
+            if key[0] == "problem":
+                problems[key] = value
+            else:
+                yield key, value
+        for problem_key in order:
+            key = ("problem", problem_key)
+            if key in problems:
+                yield key, problems.pop(key)
+        yield from problems.items()
+
+    def _merge(self, dataset, changes):
+        base = self.archives[0]
+        if dataset in base.datasets():
+            for key, value in base.records(dataset):
+                if key in changes:
+                    value, deleted = changes.pop(key)
+                    if deleted:
+                        continue
+                yield key, value
+        for key, (value, deleted) in changes.items():
+            if not deleted:
+                yield key, value
+
+    def load(self, dataset):
+        return assemble_dataset(dataset, self.records(dataset))
+
+    def close(self):
+        for archive in self.archives:
+            archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,127 @@
+"""
+Process-wide shared, versioned copy of the app data.
+"""
+
+import threading
+
+from facets import PROBLEM_FACETS, FacetIndex
+from problem_store import ProblemStore
+from record_index import AttemptIndex, GradingQueue, RecordStats
+from search_index import RepositorySearchIndex
+from storage import empty_repository
+
+DATASETS = ("users", "teacher_problems", "student_records", "problem_repository")
+
+
+class SharedDataStore:
+    """
+    One in-memory copy of every dataset, shared by all browser sessions.
+
+    Sessions hold references to these dicts instead of their own copies, so
+    memory does not grow with the number of sessions. The dict objects are
+    never replaced: bulk changes go through ``replace`` which updates them
+    in place, keeping every session's reference valid.
+
+    Sessions mutate the dicts only while holding ``lock`` and save before
+    releasing it, since ``save``, the index updates and backups iterate
+    them under the same lock.
+
+    Every save bumps ``version`` and the per-dataset counter in
+    ``versions`` so derived indexes can tell when to rebuild. Indexes over
+    student records (``attempt_index``, ``grading_queue``, ``record_stats``)
+    and the repository (``repository_search``) are updated incrementally
+    from the keys passed to ``save``.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.RLock()
+        self.version = 0
+        self.versions = {dataset: 0 for dataset in DATASETS}
+        self.users = storage.load_users()
+        self.teacher_problems = storage.load_teacher_problems()
+        self.student_records = storage.load_student_records()
+
+        repository = storage.load_problem_repository()
+        if repository is None:
+            repository = empty_repository()
+            storage.save_problem_repository(repository)
+        self.problem_repository = repository
+        self._problem_store = ProblemStore()
+        self._problem_facets = None
+        self._problem_facets_version = None
+        self.attempt_index = AttemptIndex(self.student_records)
+        self.grading_queue = GradingQueue(self._problem_creator, self.student_records)
+        self.record_stats = RecordStats(self.student_records)
+        self.repository_search = RepositorySearchIndex()
+        self.repository_search.rebuild(self.problem_repository.get("problems", []))
+
+    def save(self, dataset, changed=None):
+        """
+        Persist ``dataset`` through the storage backend and bump its version.
+
+        Args:
+            dataset (str): One of ``DATASETS``.
+            changed (list): Keys changed since the last save, passed on to
+                the backend for row-level updates. ``None`` saves everything.
+        """
+        with self.lock:
+            save = getattr(self.storage, "save_" + dataset)
+            save(getattr(self, dataset), changed)
+            if dataset == "student_records":
+                self._update_record_indexes(changed)
+            elif dataset == "problem_repository":
+                self._update_repository_search(changed)
+            self.bump(dataset)
+            if dataset in ("teacher_problems", "problem_repository"):
+                # 문제를 몰라 채점 대기열에 넣지 못한 제출 답안을 다시 배정
+                self.grading_queue.assign_unresolved()
+
+    def replace(self, dataset, value):
+        """Replace the contents of ``dataset`` in place and persist it."""
+        with self.lock:
+            current = getattr(self, dataset)
+            current.clear()
+            current.update(value)
+            self.save(dataset)
+
+    def _update_record_indexes(self, changed):
+        for index in (self.attempt_index, self.grading_queue, self.record_stats):
+            if changed is None:
+                index.rebuild(self.student_records)
+            else:
+                index.update(self.student_records, changed)
+
+    def _update_repository_search(self, changed):
+        problems = self.problem_repository.get("problems", [])
+        if changed is None:
+            self.repository_search.rebuild(problems)
+        else:
+            self.repository_search.update(problems, changed)
+
+    def _problem_creator(self, problem_id):
+        problem = self.problem_store().get(problem_id)
+        return problem.get("created_by") if problem else None
+
+    def bump(self, dataset):
+        with self.lock:
+            self.versions[dataset] += 1
+            self.version += 1
+
+    def problem_store(self):
+        """Return the problem index, rebuilt only if the problem data changed."""
+        self._problem_store.refresh(
+            (self.versions["teacher_problems"], self.versions["problem_repository"]),
+            self.teacher_problems,
+            self.problem_repository
+        )
+        return self._problem_store
+
+    def problem_facets(self):
+        """Return the facet index over teacher problems, rebuilt only if the problem data changed."""
+        with self.lock:
+            version = (self.versions["teacher_problems"], self.versions["problem_repository"])
+            if self._problem_facets is None or self._problem_facets_version != version:
+                self._problem_facets = FacetIndex(self.problem_store().find(source="teacher"), PROBLEM_FACETS)
+                self._problem_facets_version = version
+            return self._problem_facets
@@ -0,0 +1,106 @@
+"""
+Bitset-based faceted filtering for problem lists.
+"""
+
+from problem_store import problem_kind
+
+
+def _grade(problem):
+    grade = problem.get("grade")
+    return None if grade in (None, "") else str(grade)
+
+
+# 학생 문제 풀기 화면의 필터 항목
+PROBLEM_FACETS = {
+    "teacher": lambda problem: problem.get("created_by") or None,
+    "difficulty": lambda problem: problem.get("difficulty") or None,
+    "type": lambda problem: "객관식" if problem_kind(problem) == "multiple_choice" else "주관식",
+    "school_type": lambda problem: problem.get("school_type") or None,
+    "grade": _grade,
+    "topic": lambda problem: problem.get("topic_category") or None,
+}
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+class FacetIndex:
+    """
+    One bitset per facet value over a fixed list of items.
+
+    Bit ``i`` of a bitset is set when item ``i`` has that value. Filtering
+    ANDs the bitsets of the selected values; option counts AND every
+    other selection with each value's bitset, so a count tells how many
+    items the option would leave given the rest of the filters.
+
+    Args:
+        items (list): ``(item_id, item)`` pairs, in display order.
+        facets (dict): facet name -> function returning the item's value
+            (or ``None`` when the item has no value for that facet).
+    """
+
+    def __init__(self, items, facets):
+        self.ids = []
+        self.items = []
+        self.positions = {}
+        self.bitsets = {facet: {} for facet in facets}
+
+        for position, (item_id, item) in enumerate(items):
+            self.ids.append(item_id)
+            self.items.append(item)
+            self.positions[item_id] = position
+            bit = 1 << position
+            for facet, value_of in facets.items():
+                value = value_of(item)
+                if value is not None:
+                    bitsets = self.bitsets[facet]
+                    bitsets[value] = bitsets.get(value, 0) | bit
+
+        self.all_mask = (1 << len(self.ids)) - 1
+
+    def values(self, facet):
+        """Return the values of ``facet`` in first-seen order."""
+        return list(self.bitsets[facet])
+
+    def mask_of(self, item_ids):
+        """Return a bitset with the bits of ``item_ids`` set (unknown ids are ignored)."""
+        mask = 0
+        for item_id in item_ids:
+            position = self.positions.get(item_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def mask(self, selections, base=None, exclude=None):
+        """
+        AND together the bitsets of every selected value.
+
+        Args:
+            selections (dict): facet -> selected value, ``None`` for no filter.
+            base (int): Extra bitset to start from (e.g. a per-user status filter).
+            exclude (str): Facet to leave out, used for option counts.
+        """
+        mask = self.all_mask if base is None else base
+        for facet, value in selections.items():
+            if value is None or facet == exclude:
+                continue
+            mask &= self.bitsets[facet].get(value, 0)
+            if not mask:
+                break
+        return mask
+
+    def counts(self, facet, selections, base=None):
+        """Return value -> number of items left if that value were selected."""
+        mask = self.mask(selections, base, exclude=facet)
+        return {value: popcount(mask & bitset) for value, bitset in self.bitsets[facet].items()}
+
+    def select(self, mask):
+        """Return the ``(item_id, item)`` pairs whose bits are set, in order."""
+        selected = []
+        while mask:
+            lowest = mask & -mask
+            position = lowest.bit_length() - 1
+            selected.append((self.ids[position], self.items[position]))
+            mask ^= lowest
+        return selected
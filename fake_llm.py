@@ -0,0 +1,343 @@
+"""
+Offline stand-in for the OpenAI chat API, for tests and load benchmarks.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from problem_schema import OPTION_COUNT, PROBLEM_TYPES
+
+# (영어 단어, 뜻) - 가짜 문제와 답안에 사용
+WORDS = [
+    ("abundant", "풍부한"), ("borrow", "빌리다"), ("careful", "조심스러운"), ("decide", "결정하다"),
+    ("environment", "환경"), ("festival", "축제"), ("journey", "여행"), ("knowledge", "지식"),
+    ("library", "도서관"), ("neighbor", "이웃"), ("opinion", "의견"), ("protect", "보호하다"),
+    ("recycle", "재활용하다"), ("schedule", "일정"), ("tradition", "전통"), ("volunteer", "자원봉사자"),
+    ("weather", "날씨"), ("healthy", "건강한"), ("invent", "발명하다"), ("prepare", "준비하다")
+]
+
+SENTENCES = [
+    "I usually go to the library after school.",
+    "My family visited a traditional festival last weekend.",
+    "We should protect the environment for the next generation.",
+    "She decided to volunteer at the animal shelter.",
+    "Recycling is a simple way to help our planet.",
+    "He prepared carefully for the science contest."
+]
+
+_GENERATION = re.compile(r"(\d+)학년 (\S+) 교과 (.+?) 관련 (\S+) 수준의 (객관식|주관식|서술식) 문제를 (\d+)개")
+_REPAIR = re.compile(r"다음 (객관식|주관식|서술식) 문제 JSON이 스키마에 맞지 않습니다")
+_STUDENT_ANSWER = re.compile(r"STUDENT'S ANSWER:(.*?)\n\s*\n", re.DOTALL)
+
+
+def count_tokens(text):
+    """Rough token count (about three characters per token)."""
+    return len(text or "") // 3 + 1
+
+
+class RateLimitError(Exception):
+    """Fake 429 with the attributes the scheduler reads (``status_code``, ``response.headers``)."""
+
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Error code: 429 - Rate limit reached (fake)")
+        self.response = _Namespace(status_code=429, headers={"retry-after": f"{retry_after:.2f}"})
+
+
+class _Namespace:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def _problem(rng, problem_type, topic, number):
+    word, meaning = rng.choice(WORDS)
+    title = f"{topic} {number}: {word}"
+    if problem_type == "multiple_choice":
+        wrong = rng.sample([other for _, other in WORDS if other != meaning], OPTION_COUNT - 1)
+        correct = rng.randint(1, OPTION_COUNT)
+        options = wrong[:correct - 1] + [meaning] + wrong[correct - 1:]
+        return {
+            "title": title,
+            "description": f"다음 문장에서 밑줄 친 '{word}'의 뜻으로 알맞은 것은?\n\n{rng.choice(SENTENCES)}",
+            "options": options,
+            "correct_answer": correct,
+            "explanation": f"'{word}'는 '{meaning}'라는 뜻입니다.",
+            "expected_time": rng.randint(1, 3)
+        }
+    if problem_type == "essay":
+        return {
+            "title": title,
+            "description": f"'{word}'({meaning})를 사용하여 {topic}에 관한 영어 문장을 하나 쓰세요.",
+            "sample_answer": f"It is important to be {word} when we talk about {topic}.",
+            "grading_criteria": f"'{word}'를 올바르게 사용했는지, 문법이 정확한지 평가합니다.",
+            "expected_time": rng.randint(3, 8)
+        }
+    return {
+        "title": title,
+        "description": f"{topic}에 대한 자신의 경험을 '{word}'를 포함하여 영어로 4~5문장 쓰세요.",
+        "sample_answer": " ".join(rng.sample(SENTENCES, 4)),
+        "grading_criteria": "내용의 충실성(40점), 문장 구성(30점), 문법과 어휘(30점)",
+        "expected_time": rng.randint(10, 20)
+    }
+
+
+def fake_problems(rng, problem_type, count, topic="임의대로", offset=0):
+    """
+    Return ``count`` problems of a 객관식/주관식/서술식 request in the stored schema.
+
+    ``offset`` numbers the titles so batches of one request stay distinct.
+    """
+    kind = PROBLEM_TYPES.get(problem_type, "essay")
+    return [_problem(rng, kind, topic, offset + number + 1) for number in range(count)]
+
+
+def fake_correction(rng, answer, with_score=True):
+    """Return a correction text in the numbered format of ``prompts.get_correction_prompt``."""
+    answer = (answer or "").strip() or "(empty)"
+    words = len(answer.split())
+    sections = [
+        "1. PROBLEM ANALYSIS:\nThis is a short writing task testing sentence structure and vocabulary.\n\n"
+        "한국어 설명:\n문장 구성과 어휘 사용을 평가하는 쓰기 과제입니다.",
+        f"2. CORRECTED VERSION:\n{answer[0].upper()}{answer[1:]}",
+        "3. GRAMMAR FEEDBACK:\nCheck subject-verb agreement and article use.\n\n"
+        "한국어 문법 피드백:\n주어와 동사의 수 일치, 관사 사용을 확인하세요.",
+        f"4. VOCABULARY SUGGESTIONS:\nTry using '{rng.choice(WORDS)[0]}' for a more natural expression.\n\n"
+        "한국어 어휘 제안:\n더 자연스러운 표현을 위해 제안한 단어를 사용해 보세요.",
+        "5. STYLE AND STRUCTURE:\nThe ideas are clear; add a linking word between sentences.\n\n"
+        "한국어 스타일 및 구조 피드백:\n문장 사이에 연결어를 넣으면 더 매끄럽습니다.",
+        f"6. OVERALL COMMENTS:\nGood effort with {words} words. Keep practicing longer sentences.\n\n"
+        "한국어 총평:\n잘했습니다. 조금 더 긴 문장을 연습해 보세요.",
+        f"7. MODEL ANSWER (100점 답변):\n{rng.choice(SENTENCES)}\n\n한국어 설명:\n정확한 문법과 자연스러운 어휘를 사용한 답변입니다."
+    ]
+    if with_score:
+        sections.append(f"8. SCORE:\n{min(100, 50 + min(words, 20) * 2 + rng.randint(0, 10))}")
+    return "\n\n".join(sections)
+
+
+class FakeLLM:
+    """
+    Deterministic local model answering like ``chat.completions.create``.
+
+    The reply is chosen from the prompt: problem generation and repair
+    prompts get a ``{"problems": [...]}`` JSON object in the stored problem
+    schema, correction prompts get the numbered correction sections, and
+    anything else gets a short echo. Replies depend only on ``seed`` and
+    the request, so runs are reproducible.
+
+    Latency follows a log-normal factor around ``first_token_ms`` plus
+    ``tokens_per_second``; streamed replies are sent as small chunks at that
+    pace. 429 errors are raised at random (``rate_limit_rate``) and when
+    the calls of the last minute exceed ``requests_per_minute``, with a
+    ``retry-after`` header like the real API.
+
+    Args:
+        seed (int): Seed of replies, latencies and random 429s.
+        first_token_ms (float): Median time to the first token.
+        tokens_per_second (float): Median output speed.
+        latency_sigma (float): Spread of the log-normal latency factor.
+        rate_limit_rate (float): Probability of a random 429 per call.
+        requests_per_minute (int): Calls per minute before 429s, ``0`` for none.
+        sleep (callable): Used for the simulated latency.
+    """
+
+    def __init__(self, seed=0, first_token_ms=400, tokens_per_second=80, latency_sigma=0.4,
+                 rate_limit_rate=0.0, requests_per_minute=0, sleep=time.sleep):
+        self.seed = seed
+        self.first_token_ms = first_token_ms
+        self.tokens_per_second = tokens_per_second
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._recent = collections.deque()
+
+    def client(self, api_key=None, **kwargs):
+        """Client factory for ``OpenAIClientRegistry``; connection options are ignored."""
+        return FakeOpenAI(self)
+
+    def reply(self, messages, temperature=0.7):
+        """Return the reply text of a request (no latency, no errors)."""
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}:{temperature}:{prompt}".encode("utf-8")).hexdigest()
+        rng = random.Random(digest)
+
+        match = _GENERATION.search(prompt)
+        if match:
+            grade, subject, topic, difficulty, problem_type, count = match.groups()
+            batch = re.search(r"문제 묶음 (\d+)/", prompt)
+            offset = (int(batch.group(1)) - 1) * 100 if batch else 0
+            return json.dumps({"problems": fake_problems(rng, problem_type, int(count), topic, offset)}, ensure_ascii=False)
+        match = _REPAIR.search(prompt)
+        if match:
+            return json.dumps({"problems": fake_problems(rng, match.group(1), 1, "수정")}, ensure_ascii=False)
+        if "CORRECTED VERSION" in prompt:
+            answer = _STUDENT_ANSWER.search(prompt)
+            return fake_correction(rng, answer.group(1) if answer else "", "8. SCORE" in prompt)
+        return f"(fake) {prompt.strip()[-200:]}"
+
+    def _admit(self):
+        # 호출마다 다른 난수 (지연 시간, 무작위 429) - 같은 순서로 호출하면 같은 결과
+        with self._lock:
+            self._calls += 1
+            rng = random.Random(f"{self.seed}:call:{self._calls}")
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if self.requests_per_minute and len(self._recent) >= self.requests_per_minute:
+                raise RateLimitError(60 - (now - self._recent[0]))
+            if rng.random() < self.rate_limit_rate:
+                raise RateLimitError(rng.uniform(0.5, 2.0))
+            self._recent.append(now)
+        return rng
+
+    def create(self, model="gpt-3.5-turbo", messages=None, temperature=0.7, max_tokens=None,
+               stream=False, stream_options=None, **kwargs):
+        messages = messages or []
+        rng = self._admit()
+        factor = rng.lognormvariate(0, self.latency_sigma)
+        content = self.reply(messages, temperature)
+        prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+        completion_tokens = count_tokens(content)
+        usage = _Namespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+        completion_id = "chatcmpl-fake-" + uuid.uuid4().hex[:12]
+
+        if not stream:
+            self.sleep(factor * (self.first_token_ms / 1000 + completion_tokens / self.tokens_per_second))
+            message = _Namespace(role="assistant", content=content)
+            choice = _Namespace(index=0, message=message, finish_reason="stop")
+            return _Namespace(id=completion_id, model=model, choices=[choice], usage=usage)
+
+        include_usage = bool((stream_options or {}).get("include_usage"))
+        return self._stream(completion_id, model, content, usage, factor, include_usage)
+
+    def _stream(self, completion_id, model, content, usage, factor, include_usage):
+        def chunk(text=None, finish_reason=None, chunk_usage=None):
+            choices = []
+            if text is not None or finish_reason is not None:
+                choices = [_Namespace(index=0, delta=_Namespace(content=text), finish_reason=finish_reason)]
+            return _Namespace(id=completion_id, model=model, choices=choices, usage=chunk_usage)
+
+        self.sleep(factor * self.first_token_ms / 1000)
+        size = 12
+        for start in range(0, len(content), size):
+            piece = content[start:start + size]
+            self.sleep(factor * count_tokens(piece) / self.tokens_per_second)
+            yield chunk(piece)
+        yield chunk(finish_reason="stop")
+        if include_usage:
+            yield chunk(chunk_usage=usage)
+
+
+class _FakeCompletions:
+    def __init__(self, llm):
+        self._llm = llm
+
+    def create(self, **kwargs):
+        return self._llm.create(**kwargs)
+
+
+class FakeOpenAI:
+    """Client object shaped like ``openai.OpenAI`` (only ``chat.completions``)."""
+
+    def __init__(self, llm=None, **kwargs):
+        self.chat = _Namespace(completions=_FakeCompletions(llm or FakeLLM()))
+
+
+def create_fake_llm():
+    """
+    Build the fake model from the environment.
+
+    ``FAKE_LLM_SEED``, ``FAKE_LLM_FIRST_TOKEN_MS``,
+    ``FAKE_LLM_TOKENS_PER_SECOND``, ``FAKE_LLM_LATENCY_SIGMA``,
+    ``FAKE_LLM_RATE_LIMIT_RATE`` and ``FAKE_LLM_REQUESTS_PER_MINUTE``
+    override the defaults.
+    """
+    return FakeLLM(
+        seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+        first_token_ms=float(os.getenv("FAKE_LLM_FIRST_TOKEN_MS", "400")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "80")),
+        latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.4")),
+        rate_limit_rate=float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+        requests_per_minute=int(os.getenv("FAKE_LLM_REQUESTS_PER_MINUTE", "0"))
+    )
+
+
+def benchmark(num_problems=50, problem_type="객관식", num_answers=20):
+    """
+    Run problem generation and pre-grading against the fake model through
+    the real scheduler, parser and fan-out code, and return timings.
+    """
+    from generation import IncrementalJsonParser, fan_out
+    from llm_scheduler import create_scheduler
+    from pregrading import build_pregrade_prompt, parse_correction, pregrade_all
+    from problem_schema import validate_problem
+
+    scheduler = create_scheduler()
+    client = scheduler.wrap("benchmark", create_fake_llm().client())
+
+    def generate(count, index, batch_count, on_text):
+        prompt = f"3학년 영어 교과 임의대로 관련 보통 수준의 {problem_type} 문제를 {count}개 만들어주세요. (문제 묶음 {index + 1}/{batch_count})"
+        stream = client.chat.completions.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}],
+            stream=True, stream_options={"include_usage": True}
+        )
+        parts = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_text(chunk.choices[0].delta.content)
+        return True, "".join(parts)
+
+    started = time.monotonic()
+    result = fan_out(generate, lambda: IncrementalJsonParser(lambda item: validate_problem(item, problem_type)), num_problems)
+    generation_seconds = time.monotonic() - started
+
+    def grade_one(number):
+        problem = {"title": f"Benchmark {number}", "description": "Write about your weekend."}
+        prompt = build_pregrade_prompt(problem, SENTENCES[number % len(SENTENCES)])
+        response = client.chat.completions.create(model="gpt-3.5-turbo", messages=[{"role": "user", "content": prompt}])
+        return parse_correction(response.choices[0].message.content)
+
+    started = time.monotonic()
+    drafted, failed = pregrade_all(grade_one, list(range(num_answers)))
+    pregrade_seconds = time.monotonic() - started
+
+    return {
+        "problems": len(result["problems"]),
+        "generation_errors": len(result["errors"]),
+        "generation_seconds": round(generation_seconds, 2),
+        "drafted": drafted,
+        "pregrade_failed": failed,
+        "pregrade_seconds": round(pregrade_seconds, 2),
+        "scheduler": scheduler.stats()
+    }
+
+
+if __name__ == "__main__":
+    # 사용법: python fake_llm.py bench [문제 수] [객관식|주관식|서술식] [답안 수]
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        print("사용법: python fake_llm.py bench [문제 수] [객관식|주관식|서술식] [답안 수]")
+        sys.exit(1)
+    args = sys.argv[2:5]
+    report = benchmark(
+        int(args[0]) if len(args) > 0 else 50,
+        args[1] if len(args) > 1 else "객관식",
+        int(args[2]) if len(args) > 2 else 20
+    )
+    for name, value in report.items():
+        print(f"{name}: {value}")
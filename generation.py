@@ -0,0 +1,233 @@
+"""
+Fan-out of large AI problem generation requests over a thread pool.
+"""
+
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from search_index import normalize
+
+MAX_PROBLEMS = 100
+
+
+def split_batches(total, batch_size):
+    """Split ``total`` problems into batch sizes, e.g. 12 by 5 -> [5, 5, 2]."""
+    total = max(0, min(int(total), MAX_PROBLEMS))
+    return [min(batch_size, total - start) for start in range(0, total, batch_size)]
+
+
+def problem_fingerprint(problem):
+    """Key used to drop duplicate problems across batches."""
+    return (normalize(problem.get("title")), normalize(problem.get("description") or problem.get("question")))
+
+
+class IncrementalJsonParser:
+    """
+    Parse a streamed ``{"problems": [...]}`` response item by item.
+
+    The parser tracks brace/bracket depth (ignoring braces inside strings)
+    and hands every array element to ``validate`` as soon as its closing
+    brace arrives, so items are emitted while the response is still
+    streaming. A bare top-level array is accepted too. Items that fail to
+    decode or validate are kept in ``rejected`` for individual repair.
+
+    Args:
+        validate (callable): ``validate(item)`` -> ``(problem, errors)``,
+            ``problem`` being ``None`` when the item is invalid.
+    """
+
+    def __init__(self, validate):
+        self.validate = validate
+        self.received = False
+        self.rejected = []
+        self.item_count = 0
+        self._text = ""
+        self._position = 0
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+
+    def feed(self, text):
+        """Add streamed text, return the valid problems completed by it."""
+        if not text:
+            return []
+        self.received = True
+        self._text += text
+        problems = []
+
+        while self._position < len(self._text):
+            char = self._text[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._at_item_level():
+                    self._item_start = self._position
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._item_start is not None and self._at_item_level():
+                    problem = self._finish_item(self._text[self._item_start:self._position + 1])
+                    if problem is not None:
+                        problems.append(problem)
+                    self._item_start = None
+            self._position += 1
+
+        return problems
+
+    def _at_item_level(self):
+        # {"problems": [ <항목> ]} 또는 [ <항목> ]
+        return self._stack == ["{", "["] or self._stack == ["["]
+
+    def _finish_item(self, text):
+        self.item_count += 1
+        try:
+            item = json.loads(text)
+        except ValueError:
+            self.rejected.append((text, ["JSON 형식이 올바르지 않습니다."]))
+            return None
+        problem, errors = self.validate(item)
+        if problem is None:
+            self.rejected.append((item, errors))
+        return problem
+
+    def close(self):
+        """
+        Finish the stream.
+
+        A response holding a single problem object (no array) is validated
+        here; an unfinished item is rejected.
+        """
+        if self.item_count == 0:
+            start, end = self._text.find("{"), self._text.rfind("}")
+            if start != -1 and end > start:
+                try:
+                    item = json.loads(self._text[start:end + 1])
+                except ValueError:
+                    item = None
+                if isinstance(item, dict) and not isinstance(item.get("problems"), list):
+                    problem = self._finish_item(self._text[start:end + 1])
+                    return [problem] if problem is not None else []
+        if self._item_start is not None:
+            self.rejected.append((self._text[self._item_start:], ["응답이 중간에 끊겼습니다."]))
+            self._item_start = None
+        return []
+
+
+def fan_out(generate, make_parser, total, batch_size=5, max_workers=8,
+            on_progress=None, on_problem=None, repair=None):
+    """
+    Generate ``total`` problems as parallel batches and merge the results.
+
+    Problems are parsed while each batch streams and are deduplicated as
+    they arrive, so callers can show or save them before the whole set is
+    done. After a batch ends, its rejected items and any shortfall go to
+    ``repair`` once; the batch is never re-requested as a whole.
+
+    Args:
+        generate (callable): ``generate(count, batch_index, batch_count, on_text)``
+            returning ``(success, content)``; called from worker threads.
+            ``on_text`` receives streamed text (it may never be called, e.g.
+            for cached responses).
+        make_parser (callable): Returns a fresh parser (see
+            ``IncrementalJsonParser``) for one batch.
+        total (int): Number of problems wanted (capped at ``MAX_PROBLEMS``).
+        batch_size (int): Problems per sub-request.
+        max_workers (int): Concurrent sub-requests.
+        on_progress (callable): ``on_progress(done, batch_count, problem_count)``,
+            called from the calling thread after every finished batch.
+        on_problem (callable): ``on_problem(problem)``, called from the
+            calling thread for every new (non-duplicate) problem.
+        repair (callable): ``repair(rejected, missing)`` returning a list of
+            valid problems; ``rejected`` is the parser's ``(item, errors)``
+            list and ``missing`` the number of items the batch fell short by.
+
+    Returns:
+        dict: ``problems`` (deduplicated, arrival order, at most ``total``),
+        ``contents`` (response texts in batch order), ``errors``,
+        ``duplicates`` (dropped duplicates) and ``repaired`` (problems
+        returned by ``repair``).
+    """
+    batches = split_batches(total, batch_size)
+    limit = sum(batches)
+    contents = [None] * len(batches)
+    events = queue.Queue()
+
+    def run(index, count):
+        parser = make_parser()
+        emitted = [0]
+
+        def emit(problem):
+            emitted[0] += 1
+            events.put(("problem", index, problem))
+
+        def on_text(text):
+            for problem in parser.feed(text):
+                emit(problem)
+
+        try:
+            success, content = generate(count, index, len(batches), on_text)
+            if success:
+                if not parser.received:
+                    on_text(content)
+                for problem in parser.close():
+                    emit(problem)
+
+                missing = max(0, count - emitted[0] - len(parser.rejected))
+                if repair is not None and (parser.rejected or missing):
+                    for problem in repair(parser.rejected, missing):
+                        events.put(("repaired", index, problem))
+        except Exception as e:
+            success, content = False, str(e)
+        events.put(("done", index, (success, content)))
+
+    problems = []
+    errors = []
+    seen = set()
+    duplicates = 0
+    repaired = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+        for index, count in enumerate(batches):
+            pool.submit(run, index, count)
+
+        done = 0
+        while done < len(batches):
+            kind, index, payload = events.get()
+            if kind in ("problem", "repaired"):
+                fingerprint = problem_fingerprint(payload)
+                if fingerprint in seen:
+                    duplicates += 1
+                    continue
+                seen.add(fingerprint)
+                if len(problems) < limit:
+                    problems.append(payload)
+                    if kind == "repaired":
+                        repaired += 1
+                    if on_problem is not None:
+                        on_problem(payload)
+            else:
+                done += 1
+                success, content = payload
+                if success:
+                    contents[index] = content
+                else:
+                    errors.append(content)
+                if on_progress is not None:
+                    on_progress(done, len(batches), len(problems))
+
+    return {
+        "problems": problems,
+        "contents": [content for content in contents if content is not None],
+        "errors": errors,
+        "duplicates": duplicates,
+        "repaired": repaired
+    }
@@ -0,0 +1,200 @@
+"""
+Local background job queue with durable job state.
+"""
+
+import json
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+
+class JobQueue:
+    """
+    Runs long tasks (AI generation) on a worker pool outside the Streamlit
+    script run.
+
+    Each job is a JSON file in ``jobs_dir`` holding its owner, kind,
+    parameters, status, progress and result, rewritten atomically on every
+    state change, so results survive reruns, navigation and restarts.
+    Handlers are registered per kind and called as
+    ``handler(params, context, report)``; ``context`` holds in-memory
+    objects (clients, keys) that are never written to disk, and
+    ``report(progress, partial_result=None)`` updates the job while it runs.
+
+    Jobs that were queued or running when the process stopped cannot be
+    resumed without their context; they are marked failed on startup and
+    can be resubmitted.
+
+    Args:
+        jobs_dir (str): Directory of the job files.
+        max_workers (int): Jobs run at the same time.
+    """
+
+    def __init__(self, jobs_dir="data/jobs", max_workers=4):
+        self.jobs_dir = jobs_dir
+        self._lock = threading.RLock()
+        self._handlers = {}
+        self._jobs = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, job_id + ".json")
+
+    def _load(self):
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._jobs[job["id"]] = job
+            if job.get("status") in ACTIVE_STATUSES:
+                job["status"] = FAILED
+                job["error"] = "서버가 재시작되어 작업이 중단되었습니다."
+                job["finished_at"] = datetime.now().isoformat()
+                self._write(job)
+
+    def _write(self, job):
+        path = self._path(job["id"])
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def submit(self, owner, kind, params, title="", context=None):
+        """
+        Queue a job and return its id.
+
+        Args:
+            owner (str): User id the job belongs to.
+            kind (str): Registered handler name.
+            params (dict): JSON-serializable parameters, stored with the job.
+            title (str): Label shown in the job list.
+            context (dict): In-memory objects passed to the handler only.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"알 수 없는 작업 종류입니다: {kind}")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "owner": owner,
+            "kind": kind,
+            "title": title,
+            "params": params,
+            "status": QUEUED,
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "collected": 0,
+            "collected_at": None
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._write(job)
+        self._pool.submit(self._run, job["id"], context or {})
+        return job["id"]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            self._write(job)
+
+    def _run(self, job_id, context):
+        job = self.get(job_id)
+        if job is None:
+            return
+        self._update(job_id, status=RUNNING, started_at=datetime.now().isoformat())
+
+        def report(progress, partial_result=None):
+            fields = {"progress": progress}
+            if partial_result is not None:
+                fields["result"] = partial_result
+            self._update(job_id, **fields)
+
+        try:
+            result = self._handlers[job["kind"]](job["params"], context, report)
+            self._update(job_id, status=DONE, result=result, finished_at=datetime.now().isoformat())
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status=FAILED, error=str(e), finished_at=datetime.now().isoformat())
+
+    def get(self, job_id):
+        """Return a copy of the job, or ``None``."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def list(self, owner=None):
+        """Return the owner's jobs (all jobs if ``owner`` is ``None``), newest first."""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if owner is None or job.get("owner") == owner]
+            jobs = json.loads(json.dumps(jobs))
+        return sorted(jobs, key=lambda job: job.get("created_at", ""), reverse=True)
+
+    def claim_results(self, job_id, available):
+        """
+        Claim the result items not taken yet, so each is collected once even
+        while the job is still running.
+
+        Args:
+            available (int): Number of result items the caller sees.
+
+        Returns:
+            tuple: ``(start, end)`` slice of the newly claimed items (empty
+            if there are none). Once a finished job is claimed its
+            ``collected_at`` is set.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.get("collected_at"):
+                return 0, 0
+            start = job.get("collected", 0)
+            end = max(start, available)
+            job["collected"] = end
+            if job.get("status") == DONE:
+                job["collected_at"] = datetime.now().isoformat()
+            self._write(job)
+            return start, end
+
+    def delete(self, job_id):
+        """Remove a finished job; active jobs are kept."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.get("status") in ACTIVE_STATUSES:
+                return False
+            del self._jobs[job_id]
+        try:
+            os.remove(self._path(job_id))
+        except OSError:
+            pass
+        return True
+
+    def active_count(self, owner=None):
+        with self._lock:
+            return sum(
+                1 for job in self._jobs.values()
+                if job.get("status") in ACTIVE_STATUSES and (owner is None or job.get("owner") == owner)
+            )
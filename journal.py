@@ -0,0 +1,184 @@
+"""
+Append-only journal for student records.
+"""
+
+import json
+import os
+import threading
+
+
+class RecordJournal:
+    """
+    Write-ahead journal on top of the student_records JSON snapshot.
+
+    Every mutation is appended as one compact JSON line instead of rewriting
+    the whole file. Once the journal grows past ``compact_threshold`` entries
+    it is sealed and folded into the snapshot by a background thread. On
+    startup the snapshot is loaded and the journal tail is replayed on top.
+
+    All operations are absolute (set / put / delete), so replaying an entry
+    that already made it into the snapshot is harmless.
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, compact_threshold=500, fsync=True):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".journal"
+        self.sealed_path = self.journal_path + ".compacting"
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._compactor = None
+        self._entries = self._count_entries(self.journal_path)
+
+    # 기록 변경 연산
+    def set_record(self, student_id, problem_id, record):
+        """Record the full state of one student's problem record."""
+        self._append({"op": "set", "s": student_id, "p": problem_id, "r": record})
+
+    def put_student(self, student_id, student_record):
+        """Record the full state of one student's entry."""
+        self._append({"op": "put", "s": student_id, "v": student_record})
+
+    def delete_student(self, student_id):
+        """Record the removal of one student's entry."""
+        self._append({"op": "del", "s": student_id})
+
+    def load(self):
+        """
+        Rebuild the records from the snapshot plus the journal tail.
+
+        Returns:
+            dict: student_id -> student record, in the same shape as the
+            original student_records.json.
+        """
+        with self._lock:
+            records = self._read_snapshot()
+            for path in (self.sealed_path, self.journal_path):
+                self._replay(path, records)
+            return records
+
+    def write_snapshot(self, records):
+        """
+        Replace the snapshot with ``records`` and discard the journal.
+
+        Used for bulk changes (e.g. restore) where a full rewrite is expected.
+        """
+        while True:
+            # 압축 스레드는 마무리에 잠금이 필요하므로 잠금 밖에서 기다린 뒤 다시 확인
+            self._wait_for_compactor()
+            with self._lock:
+                if self._compactor_running():
+                    continue
+                self._write_snapshot_file(records)
+                for path in (self.sealed_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._entries = 0
+                return
+
+    def compact(self, wait=False):
+        """
+        Fold the current journal into the snapshot.
+
+        The journal is sealed under the lock so new appends go to a fresh
+        file while the snapshot is rebuilt in a background thread.
+        """
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                compactor = self._compactor
+            else:
+                if not os.path.exists(self.sealed_path):
+                    if not os.path.exists(self.journal_path):
+                        return
+                    os.replace(self.journal_path, self.sealed_path)
+                    self._entries = 0
+                compactor = threading.Thread(target=self._compact_sealed, daemon=True)
+                self._compactor = compactor
+                compactor.start()
+        if wait:
+            compactor.join()
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self._entries += 1
+            if self._entries >= self.compact_threshold:
+                self.compact()
+
+    def _compact_sealed(self):
+        with self._lock:
+            records = self._read_snapshot()
+            self._replay(self.sealed_path, records)
+        # 스냅샷 쓰기는 잠금 밖에서 수행하여 추가 기록을 막지 않음
+        self._write_snapshot_file(records)
+        with self._lock:
+            if os.path.exists(self.sealed_path):
+                os.remove(self.sealed_path)
+
+    def _compactor_running(self, compactor=None):
+        compactor = compactor or self._compactor
+        return compactor is not None and compactor.is_alive() and compactor is not threading.current_thread()
+
+    def _wait_for_compactor(self):
+        compactor = self._compactor
+        if self._compactor_running(compactor):
+            compactor.join()
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_snapshot_file(self, records):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    @staticmethod
+    def _replay(path, records):
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 비정상 종료로 마지막 줄이 잘린 경우 무시
+                    continue
+                apply_entry(records, entry)
+
+    @staticmethod
+    def _count_entries(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+
+def apply_entry(records, entry):
+    """Apply one journal entry to an in-memory student_records dict."""
+    op = entry.get("op")
+    student_id = entry.get("s")
+    if op == "set":
+        student_record = records.setdefault(student_id, {"problems": {}})
+        student_record.setdefault("problems", {})[entry["p"]] = entry["r"]
+    elif op == "put":
+        records[student_id] = entry["v"]
+    elif op == "del":
+        records.pop(student_id, None)
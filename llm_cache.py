@@ -0,0 +1,178 @@
+"""
+Content-addressed on-disk cache for LLM responses.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text):
+    """Collapse whitespace so re-indented copies of a prompt share one cache entry."""
+    return _WHITESPACE.sub(" ", str(text or "")).strip()
+
+
+def cache_key(model, messages, temperature):
+    """
+    Return the cache key of a chat request.
+
+    The key is the SHA-256 of the model, the temperature rounded to two
+    decimals and the role/content of every message with normalized
+    whitespace.
+    """
+    payload = {
+        "model": model,
+        "temperature": round(float(temperature or 0), 2),
+        "messages": [[message.get("role"), normalize_prompt(message.get("content"))] for message in messages]
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Disk cache of chat completion texts with a TTL and an LRU size limit.
+
+    Each response is stored as ``<key>.json`` in ``cache_dir``. Entries older
+    than ``ttl`` seconds are treated as misses and removed. When the files
+    exceed ``max_bytes`` in total, the least recently used ones are deleted;
+    reads refresh an entry's modification time so recency survives
+    restarts. Hit and miss counters are kept for the admin page.
+
+    Args:
+        cache_dir (str): Directory holding the cache files.
+        ttl (int): Seconds an entry stays valid, ``0`` for no expiry.
+        max_bytes (int): Total size the cache is trimmed to.
+    """
+
+    def __init__(self, cache_dir="data/llm_cache", ttl=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> [크기, 마지막 사용 시각]
+        self._entries = {}
+        self._total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            self._entries[name[:-5]] = [stat.st_size, stat.st_mtime]
+            self._total_bytes += stat.st_size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, model, messages, temperature):
+        """Return the cached response text, or ``None`` on a miss."""
+        key = cache_key(model, messages, temperature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            now = time.time()
+            if self.ttl and now - data.get("created_at", 0) > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            entry[1] = now
+            try:
+                os.utime(self._path(key), (now, now))
+            except OSError:
+                pass
+            self.hits += 1
+            return data.get("content")
+
+    def put(self, model, messages, temperature, content):
+        """Store a response text and trim the cache to ``max_bytes``."""
+        key = cache_key(model, messages, temperature)
+        data = {"model": model, "created_at": time.time(), "content": content}
+        encoded = json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+        with self._lock:
+            path = self._path(key)
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(encoded)
+            os.replace(temp_path, path)
+
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = [len(encoded), time.time()]
+            self._total_bytes += len(encoded)
+            self._evict()
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[0]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Delete every entry and reset the counters."""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return ``{"hits", "misses", "hit_rate", "entries", "bytes"}``."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes
+            }
+
+
+def create_llm_cache(cache_dir=None):
+    """
+    Build the response cache from the environment.
+
+    ``LLM_CACHE_DIR``, ``LLM_CACHE_TTL_HOURS`` and ``LLM_CACHE_MAX_MB``
+    override the defaults.
+    """
+    cache_dir = cache_dir or os.getenv("LLM_CACHE_DIR", os.path.join("data", "llm_cache"))
+    ttl = int(float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600)
+    max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "50")) * 1024 * 1024)
+    return LLMResponseCache(cache_dir, ttl=ttl, max_bytes=max_bytes)
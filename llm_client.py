@@ -0,0 +1,112 @@
+"""
+Process-wide registry of pooled OpenAI clients.
+"""
+
+import hashlib
+import importlib.util
+import os
+import threading
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def http2_available():
+    """HTTP/2 needs the optional ``h2`` package next to httpx."""
+    return httpx is not None and importlib.util.find_spec("h2") is not None
+
+
+class OpenAIClientRegistry:
+    """
+    One OpenAI client per API key, shared by every session and AI feature.
+
+    Each client owns an ``httpx.Client`` with a bounded keep-alive
+    connection pool and explicit timeouts, so repeated calls reuse TCP and
+    TLS sessions instead of opening new ones. HTTP/2 is enabled when the
+    ``h2`` package is installed. Keys are stored hashed.
+
+    Args:
+        client_factory (callable): Builds a client, normally ``openai.OpenAI``.
+        max_connections (int): Pool size per API key.
+        max_keepalive (int): Idle connections kept open per API key.
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait for a response.
+        max_retries (int): Retries done by the OpenAI client itself.
+    """
+
+    def __init__(self, client_factory, max_connections=20, max_keepalive=10,
+                 connect_timeout=10.0, read_timeout=120.0, max_retries=2):
+        self.client_factory = client_factory
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    @staticmethod
+    def _key(api_key):
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _http_client(self):
+        if httpx is None:
+            return None
+        return httpx.Client(
+            http2=http2_available(),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=60.0
+            ),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+        )
+
+    def get(self, api_key):
+        """Return the shared client for ``api_key``, creating it on first use."""
+        if not api_key:
+            return None
+        key = self._key(api_key)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                http_client = self._http_client()
+                kwargs = {"api_key": api_key, "max_retries": self.max_retries}
+                if http_client is not None:
+                    kwargs["http_client"] = http_client
+                else:
+                    kwargs["timeout"] = self.read_timeout
+                entry = (self.client_factory(**kwargs), http_client)
+                self._clients[key] = entry
+            return entry[0]
+
+    def discard(self, api_key):
+        """Close and forget the client of ``api_key`` (e.g. after the key is reset)."""
+        if not api_key:
+            return
+        with self._lock:
+            entry = self._clients.pop(self._key(api_key), None)
+        if entry is not None and entry[1] is not None:
+            entry[1].close()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+def create_client_registry(client_factory, max_retries=0):
+    """
+    Build the registry from the environment.
+
+    ``OPENAI_MAX_CONNECTIONS``, ``OPENAI_CONNECT_TIMEOUT`` and
+    ``OPENAI_READ_TIMEOUT`` override the defaults. Retries are left to the
+    request scheduler, so the clients themselves do not retry by default.
+    """
+    return OpenAIClientRegistry(
+        client_factory,
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+        connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10")),
+        read_timeout=float(os.getenv("OPENAI_READ_TIMEOUT", "120")),
+        max_retries=max_retries
+    )
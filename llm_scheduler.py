@@ -0,0 +1,283 @@
+"""
+Rate-limit aware scheduler for every LLM request.
+"""
+
+import hashlib
+import os
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at ``rate`` per second.
+
+    ``acquire`` blocks until ``amount`` tokens are available. Requests larger
+    than the capacity are clamped to it so they can still run once the
+    bucket is full.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1):
+        """Take ``amount`` tokens, sleeping until they are available. Returns seconds waited."""
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+def retry_after_seconds(error):
+    """Return the server's ``Retry-After`` hint of an API error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error):
+    """429s, 5xx responses, timeouts and dropped connections are retried."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError")
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """Rough token estimate (Korean text is about two characters per token)."""
+    characters = sum(len(str(message.get("content", ""))) for message in messages)
+    return characters // 2 + max_tokens
+
+
+class RequestScheduler:
+    """
+    Throttles and retries LLM requests per API key.
+
+    Every key has two token buckets, one for requests per minute and one for
+    tokens per minute. A call first waits on both buckets (the waiting calls
+    are the queue counted in ``stats``), then runs; rate-limit and transient
+    errors are retried with exponential backoff and full jitter, using the
+    server's ``Retry-After`` when it sends one.
+
+    Args:
+        requests_per_minute (int): Request budget per key.
+        tokens_per_minute (int): Token budget per key.
+        max_retries (int): Retries after the first attempt.
+        base_delay (float): First backoff delay in seconds.
+        max_delay (float): Longest backoff delay in seconds.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=90000,
+                 max_retries=5, base_delay=1.0, max_delay=30.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = {
+            "queued": 0, "max_queued": 0, "running": 0, "requests": 0,
+            "retries": 0, "rate_limited": 0, "failures": 0, "wait_seconds": 0.0
+        }
+
+    def _buckets_for(self, api_key):
+        key = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if buckets is None:
+                buckets = (
+                    TokenBucket(self.requests_per_minute / 60.0, max(1, self.requests_per_minute // 6)),
+                    TokenBucket(self.tokens_per_minute / 60.0, self.tokens_per_minute)
+                )
+                self._buckets[key] = buckets
+            return buckets
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+            if name == "queued":
+                self._stats["max_queued"] = max(self._stats["max_queued"], self._stats["queued"])
+
+    def backoff_delay(self, attempt, error=None):
+        """Delay before retry ``attempt`` (0-based): Retry-After, else jittered exponential."""
+        hinted = retry_after_seconds(error) if error is not None else None
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, api_key, request, estimated_tokens=0):
+        """
+        Run ``request()`` within the key's budgets, retrying transient errors.
+
+        Args:
+            api_key (str): Key whose budgets are charged.
+            request (callable): Makes the API call and returns its result.
+            estimated_tokens (int): Tokens reserved up front for each attempt;
+                a failed attempt gives its reservation back, a successful one
+                is trued up with ``settle``.
+
+        Returns:
+            The result of ``request()``; the last error is raised when the
+            retries are exhausted.
+        """
+        request_bucket, token_bucket = self._buckets_for(api_key)
+        attempt = 0
+        while True:
+            self._count("queued")
+            try:
+                waited = request_bucket.acquire(1)
+                waited += token_bucket.acquire(estimated_tokens) if estimated_tokens else 0
+            finally:
+                self._count("queued", -1)
+            self._count("wait_seconds", waited)
+
+            self._count("running")
+            self._count("requests")
+            try:
+                return request()
+            except Exception as e:
+                # 실패한 요청은 토큰을 쓰지 않았으므로 예약분을 돌려주고 다음 시도에서 다시 예약
+                if estimated_tokens:
+                    token_bucket.refund(estimated_tokens)
+                if is_rate_limit_error(e):
+                    self._count("rate_limited")
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    self._count("failures")
+                    raise
+                delay = self.backoff_delay(attempt, e)
+            finally:
+                self._count("running", -1)
+
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def settle(self, api_key, estimated_tokens, used_tokens):
+        """Refund the part of a reservation the response did not use."""
+        if used_tokens is not None and estimated_tokens > used_tokens:
+            self._buckets_for(api_key)[1].refund(estimated_tokens - used_tokens)
+
+    def wrap(self, api_key, client):
+        """Return ``client`` with its completions routed through this scheduler."""
+        return None if client is None else ScheduledClient(self, api_key, client)
+
+    def stats(self):
+        """Return queue depth (current/max), running calls and retry counters."""
+        with self._lock:
+            return dict(self._stats)
+
+
+class _ScheduledCompletions:
+    def __init__(self, scheduler, api_key, completions):
+        self._scheduler = scheduler
+        self._api_key = api_key
+        self._completions = completions
+
+    def create(self, **kwargs):
+        estimated = estimate_tokens(kwargs.get("messages", []), kwargs.get("max_tokens") or 0)
+        if kwargs.get("stream"):
+            # 스트림은 마지막 청크에만 사용량이 오므로 요청해 두고 다 읽은 뒤 정산
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        response = self._scheduler.call(self._api_key, lambda: self._completions.create(**kwargs), estimated)
+        if kwargs.get("stream"):
+            return _SettledStream(response, lambda used: self._scheduler.settle(self._api_key, estimated, used))
+        usage = getattr(response, "usage", None)
+        self._scheduler.settle(self._api_key, estimated, getattr(usage, "total_tokens", None))
+        return response
+
+
+class _SettledStream:
+    """
+    Iterates a streamed response and settles its reservation from the usage
+    of the final chunk. A stream that is abandoned or sends no usage keeps
+    the full reservation.
+    """
+
+    def __init__(self, stream, settle):
+        self._stream = stream
+        self._settle = settle
+
+    def __iter__(self):
+        used = None
+        for chunk in self._stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                used = getattr(usage, "total_tokens", None)
+            yield chunk
+        self._settle(used)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _ScheduledChat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class ScheduledClient:
+    """
+    OpenAI client proxy whose ``chat.completions.create`` goes through a
+    ``RequestScheduler``; every other attribute is the wrapped client's.
+
+    For streamed calls the scheduler covers opening the stream, which is
+    where rate-limit errors are raised; a stream that fails midway is not
+    retried, since part of it has already been consumed. Streams ask for
+    their usage in the final chunk and are settled once fully read.
+    """
+
+    def __init__(self, scheduler, api_key, client):
+        self._client = client
+        self.chat = _ScheduledChat(_ScheduledCompletions(scheduler, api_key, client.chat.completions))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def create_scheduler():
+    """
+    Build the scheduler from the environment.
+
+    ``LLM_REQUESTS_PER_MINUTE``, ``LLM_TOKENS_PER_MINUTE`` and
+    ``LLM_MAX_RETRIES`` override the defaults.
+    """
+    return RequestScheduler(
+        requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "5"))
+    )
@@ -0,0 +1,337 @@
+"""
+Token, latency and cost metering of LLM calls with per-user budgets.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# 1,000 토큰당 미국 달러 (입력, 출력). 목록에 없는 모델은 "default" 단가로 계산
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo": (0.01, 0.03),
+    "default": (0.0005, 0.0015)
+}
+
+FEATURES = {
+    "generation": "문제 생성",
+    "correction": "사전 채점",
+    "connection_test": "연결 테스트"
+}
+
+# 집계 행: 호출 수, 입력 토큰, 출력 토큰, 비용, 지연 시간 합계(ms), 오류 수
+_CALLS, _PROMPT, _COMPLETION, _COST, _LATENCY, _ERRORS = range(6)
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised instead of calling the model when a user's budget is used up."""
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["default"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _bucket_of(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%dT%H")
+
+
+def _month_of(bucket):
+    return bucket[:7]
+
+
+class UsageMeter:
+    """
+    Hourly aggregates of LLM usage, tagged by user, feature and model.
+
+    Calls are not stored one by one: each ``record`` adds to the row of its
+    hour and ``user|feature|model`` key, so the store grows with the number
+    of distinct users and features rather than with traffic. Rows older
+    than ``retention_days`` are dropped. The aggregates and the monthly
+    budgets live in one JSON file that is rewritten at most every
+    ``flush_interval`` seconds.
+
+    A user's monthly spend is kept in memory, so ``check`` is a dictionary
+    lookup; it refuses a call whose estimated cost would take the user over
+    budget.
+
+    Args:
+        path (str): JSON file of the aggregates and budgets.
+        retention_days (int): Days of hourly rows kept.
+        flush_interval (float): Minimum seconds between writes.
+    """
+
+    def __init__(self, path="data/llm_usage.json", retention_days=90, flush_interval=5.0):
+        self.path = path
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._budgets = {}
+        self._monthly = {}
+        self._dirty = False
+        self._flushed_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._buckets = data.get("buckets", {})
+        self._budgets = data.get("budgets", {})
+        for bucket, rows in self._buckets.items():
+            for key, row in rows.items():
+                user = key.split("|", 1)[0]
+                month_key = (_month_of(bucket), user)
+                self._monthly[month_key] = self._monthly.get(month_key, 0.0) + row[_COST]
+
+    def _prune(self):
+        cutoff = _bucket_of(time.time() - self.retention_days * 86400)
+        for bucket in [bucket for bucket in self._buckets if bucket < cutoff]:
+            del self._buckets[bucket]
+
+    def flush(self, force=False):
+        """Write the aggregates if they changed (and ``flush_interval`` has passed)."""
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._flushed_at < self.flush_interval):
+                return
+            self._prune()
+            data = json.dumps({"buckets": self._buckets, "budgets": self._budgets}, ensure_ascii=False)
+            self._dirty = False
+            self._flushed_at = time.monotonic()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+
+    def record(self, user, feature, model, prompt_tokens, completion_tokens, latency, error=False):
+        """
+        Add one call to its hourly row.
+
+        Args:
+            user (str): User the call is charged to.
+            feature (str): One of ``FEATURES`` (or any other tag).
+            model (str): Model name, used for pricing.
+            prompt_tokens (int): Input tokens.
+            completion_tokens (int): Output tokens.
+            latency (float): Seconds from request to the last byte.
+            error (bool): The call failed.
+
+        Returns:
+            float: Estimated cost of the call in USD.
+        """
+        user = user or "system"
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        bucket = _bucket_of(time.time())
+        key = f"{user}|{feature}|{model}"
+        with self._lock:
+            row = self._buckets.setdefault(bucket, {}).setdefault(key, [0, 0, 0, 0.0, 0, 0])
+            row[_CALLS] += 1
+            row[_PROMPT] += int(prompt_tokens)
+            row[_COMPLETION] += int(completion_tokens)
+            row[_COST] += cost
+            row[_LATENCY] += int(latency * 1000)
+            row[_ERRORS] += 1 if error else 0
+            month_key = (_month_of(bucket), user)
+            self._monthly[month_key] = self._monthly.get(month_key, 0.0) + cost
+            self._dirty = True
+        self.flush()
+        return cost
+
+    def monthly_spend(self, user, month=None):
+        """USD spent by ``user`` in ``month`` (``YYYY-MM``, default the current month)."""
+        month = month or datetime.now().strftime("%Y-%m")
+        with self._lock:
+            return self._monthly.get((month, user or "system"), 0.0)
+
+    def budget(self, user):
+        """Monthly budget of ``user`` in USD, or ``None`` for no limit."""
+        with self._lock:
+            return self._budgets.get(user)
+
+    def set_budget(self, user, amount):
+        """Set (``amount`` in USD) or remove (``None``) a user's monthly budget."""
+        with self._lock:
+            if amount is None:
+                self._budgets.pop(user, None)
+            else:
+                self._budgets[user] = float(amount)
+            self._dirty = True
+        self.flush(force=True)
+
+    def budgets(self):
+        with self._lock:
+            return dict(self._budgets)
+
+    def check(self, user, estimated_cost=0.0):
+        """Raise ``BudgetExceededError`` if the call would exceed ``user``'s monthly budget."""
+        limit = self.budget(user)
+        if limit is None:
+            return
+        spent = self.monthly_spend(user)
+        if spent + estimated_cost > limit:
+            raise BudgetExceededError(
+                f"이번 달 AI 사용 예산(${limit:.2f})을 모두 사용했습니다 (사용액 ${spent:.2f}). 관리자에게 문의하세요."
+            )
+
+    def summary(self, since=None, group_by=("user",)):
+        """
+        Aggregate rows newer than ``since`` by the given fields.
+
+        Args:
+            since (datetime): Start of the period, ``None`` for all rows.
+            group_by (tuple): Any of ``"user"``, ``"feature"``, ``"model"``,
+                ``"day"`` and ``"hour"``.
+
+        Returns:
+            list: dicts with the ``group_by`` fields plus ``calls``,
+            ``prompt_tokens``, ``completion_tokens``, ``cost``,
+            ``avg_latency`` (seconds) and ``errors``, highest cost first.
+        """
+        start = since.strftime("%Y-%m-%dT%H") if since is not None else ""
+        groups = {}
+        with self._lock:
+            for bucket, rows in self._buckets.items():
+                if bucket < start:
+                    continue
+                for key, row in rows.items():
+                    user, feature, model = key.split("|", 2)
+                    fields = {"user": user, "feature": feature, "model": model, "day": bucket[:10], "hour": bucket}
+                    group = tuple(fields[name] for name in group_by)
+                    total = groups.setdefault(group, [0, 0, 0, 0.0, 0, 0])
+                    for position, value in enumerate(row):
+                        total[position] += value
+
+        result = []
+        for group, total in groups.items():
+            item = dict(zip(group_by, group))
+            item.update({
+                "calls": total[_CALLS],
+                "prompt_tokens": total[_PROMPT],
+                "completion_tokens": total[_COMPLETION],
+                "cost": total[_COST],
+                "avg_latency": total[_LATENCY] / total[_CALLS] / 1000 if total[_CALLS] else 0.0,
+                "errors": total[_ERRORS]
+            })
+            result.append(item)
+        return sorted(result, key=lambda item: item["cost"], reverse=True)
+
+    def wrap(self, client, user, feature):
+        """Return ``client`` with its completions metered and charged to ``user``."""
+        return None if client is None else MeteredClient(self, client, user, feature)
+
+
+def _count_tokens(text):
+    # 사용량 정보가 없는 응답용 대략적인 추정 (한국어는 두 글자에 약 1토큰)
+    return len(text or "") // 2
+
+
+class _MeteredStream:
+    """Passes a streamed response through and records it when it ends."""
+
+    def __init__(self, stream, finish):
+        self._stream = stream
+        self._finish = finish
+        self._parts = []
+        self._usage = None
+
+    def __iter__(self):
+        error = False
+        try:
+            for chunk in self._stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self._usage = chunk.usage
+                if getattr(chunk, "choices", None):
+                    delta = getattr(chunk.choices[0].delta, "content", None)
+                    if delta:
+                        self._parts.append(delta)
+                yield chunk
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._finish(self._usage, "".join(self._parts), error)
+
+
+class _MeteredCompletions:
+    def __init__(self, meter, completions, user, feature):
+        self._meter = meter
+        self._completions = completions
+        self._user = user
+        self._feature = feature
+
+    def create(self, **kwargs):
+        model = kwargs.get("model", "default")
+        messages = kwargs.get("messages", [])
+        prompt_estimate = sum(_count_tokens(str(message.get("content", ""))) for message in messages)
+        self._meter.check(self._user, estimate_cost(model, prompt_estimate, kwargs.get("max_tokens") or 0))
+
+        started = time.monotonic()
+
+        def finish(usage, text, error):
+            prompt_tokens = getattr(usage, "prompt_tokens", None)
+            completion_tokens = getattr(usage, "completion_tokens", None)
+            self._meter.record(
+                self._user, self._feature, model,
+                prompt_tokens if prompt_tokens is not None else prompt_estimate,
+                completion_tokens if completion_tokens is not None else _count_tokens(text),
+                time.monotonic() - started, error
+            )
+
+        if kwargs.get("stream"):
+            # 스트리밍 응답의 마지막 조각으로 실제 사용량을 받음
+            kwargs.setdefault("stream_options", {"include_usage": True})
+        try:
+            response = self._completions.create(**kwargs)
+        except Exception:
+            # 거절된 요청(429 등)은 청구되지 않으므로 오류만 기록 (스케줄러의 재시도마다 이 경로를 지남)
+            self._meter.record(self._user, self._feature, model, 0, 0, time.monotonic() - started, True)
+            raise
+
+        if kwargs.get("stream"):
+            return _MeteredStream(response, finish)
+        choices = getattr(response, "choices", None) or []
+        text = getattr(choices[0].message, "content", "") if choices else ""
+        finish(getattr(response, "usage", None), text, False)
+        return response
+
+
+class _MeteredChat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class MeteredClient:
+    """
+    OpenAI client proxy that meters ``chat.completions.create`` for one
+    user and feature; every other attribute is the wrapped client's.
+    """
+
+    def __init__(self, meter, client, user, feature):
+        self._client = client
+        self.chat = _MeteredChat(_MeteredCompletions(meter, client.chat.completions, user, feature))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def create_usage_meter():
+    """
+    Build the meter from the environment.
+
+    ``LLM_USAGE_PATH`` and ``LLM_USAGE_RETENTION_DAYS`` override the
+    defaults.
+    """
+    return UsageMeter(
+        path=os.getenv("LLM_USAGE_PATH", os.path.join("data", "llm_usage.json")),
+        retention_days=int(os.getenv("LLM_USAGE_RETENTION_DAYS", "90"))
+    )
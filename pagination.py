@@ -0,0 +1,82 @@
+"""
+Cursor-based pagination over in-memory lists.
+"""
+
+import heapq
+
+
+class Page:
+    """
+    One slice of a list.
+
+    ``cursor`` is the offset of the first item on the page; ``prev_cursor``
+    and ``next_cursor`` are the cursors of the neighbouring pages, or
+    ``None`` at either end.
+    """
+
+    def __init__(self, items, cursor, page_size, total):
+        self.items = items
+        self.cursor = cursor
+        self.page_size = page_size
+        self.total = total
+
+    @property
+    def number(self):
+        return self.cursor // self.page_size + 1
+
+    @property
+    def page_count(self):
+        return max(1, -(-self.total // self.page_size))
+
+    @property
+    def prev_cursor(self):
+        return None if self.cursor <= 0 else max(0, self.cursor - self.page_size)
+
+    @property
+    def next_cursor(self):
+        next_cursor = self.cursor + self.page_size
+        return next_cursor if next_cursor < self.total else None
+
+
+def clamp_cursor(cursor, page_size, total):
+    """Snap ``cursor`` to the start of a page that exists."""
+    if total <= 0:
+        return 0
+    cursor = min(max(0, int(cursor or 0)), total - 1)
+    return cursor - cursor % page_size
+
+
+def paginate(items, cursor=0, page_size=20, sort_key=None, reverse=False):
+    """
+    Return the page of ``items`` starting at ``cursor``.
+
+    With a ``sort_key`` only the first ``cursor + page_size`` items in sort
+    order are selected (a heap instead of a full sort), so early pages of
+    a long list stay cheap. The order is the same as ``sorted``.
+
+    Args:
+        items (list): Items to page through.
+        cursor (int): Offset of the first item, snapped to a page start.
+        page_size (int): Items per page.
+        sort_key (callable): Sort key, ``None`` keeps the given order.
+        reverse (bool): Sort descending.
+
+    Returns:
+        Page: The visible slice.
+    """
+    if not isinstance(items, list):
+        items = list(items)
+    total = len(items)
+    cursor = clamp_cursor(cursor, page_size, total)
+    end = cursor + page_size
+
+    if sort_key is None:
+        window = items[cursor:end]
+    elif end >= total:
+        window = sorted(items, key=sort_key, reverse=reverse)[cursor:end]
+    elif reverse:
+        window = heapq.nlargest(end, items, key=sort_key)[cursor:]
+    else:
+        window = heapq.nsmallest(end, items, key=sort_key)[cursor:]
+
+    return Page(window, cursor, page_size, total)
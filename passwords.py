@@ -0,0 +1,70 @@
+"""
+Password hashing, including batched hashing over a process pool.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 비밀번호 관련 기능
+try:
+    from passlib.hash import pbkdf2_sha256
+    USING_PASSLIB = True
+except ImportError:
+    USING_PASSLIB = False
+    pbkdf2_sha256 = None
+
+
+def hash_password(password):
+    """비밀번호를 해싱합니다."""
+    if USING_PASSLIB and pbkdf2_sha256:
+        try:
+            return pbkdf2_sha256.hash(password)
+        except Exception:
+            # 실패하면 기본 방식 사용
+            return hashlib.sha256(password.encode()).hexdigest()
+    else:
+        return hashlib.sha256(password.encode()).hexdigest()
+
+
+def verify_password(plain_password, hashed_password):
+    """평문 비밀번호가 해시된 비밀번호와 일치하는지 검증합니다."""
+    if USING_PASSLIB and pbkdf2_sha256 and '$' in hashed_password:
+        try:
+            return pbkdf2_sha256.verify(plain_password, hashed_password)
+        except Exception:
+            # 실패하면 기본 방식으로 비교
+            return hash_password(plain_password) == hashed_password
+    else:
+        # 기본 방식으로 비교
+        return hash_password(plain_password) == hashed_password
+
+
+def hash_passwords(passwords, max_workers=None):
+    """
+    Hash many passwords, in order.
+
+    pbkdf2 is CPU bound, so large batches are spread over a process pool
+    (started with ``spawn``, which is safe from the app's threads). Small
+    batches, the plain SHA-256 fallback and environments where worker
+    processes cannot start are hashed in this process.
+
+    Args:
+        passwords (list): Plain passwords.
+        max_workers (int): Worker processes, defaults to the CPU count.
+
+    Returns:
+        list: Hashes in the order of ``passwords``.
+    """
+    passwords = list(passwords)
+    workers = min(max_workers or os.cpu_count() or 1, len(passwords))
+    if not USING_PASSLIB or workers < 2 or len(passwords) < 8:
+        return [hash_password(password) for password in passwords]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    except (OSError, BrokenProcessPool):
+        return [hash_password(password) for password in passwords]
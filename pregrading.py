@@ -0,0 +1,137 @@
+"""
+AI pre-grading of essay answers with the correction prompt.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from prompts import get_correction_prompt
+
+# 교정 프롬프트의 번호별 항목 (8번 점수는 사전 채점용으로 덧붙임)
+SECTIONS = {
+    1: "analysis",
+    2: "corrected_version",
+    3: "grammar",
+    4: "vocabulary",
+    5: "style",
+    6: "overall",
+    7: "model_answer",
+    8: "score"
+}
+
+SECTION_LABELS = {
+    "analysis": "문제 분석",
+    "corrected_version": "교정본",
+    "grammar": "문법 피드백",
+    "vocabulary": "어휘 제안",
+    "style": "스타일 및 구조",
+    "overall": "총평",
+    "model_answer": "모범 답안"
+}
+
+SCORE_INSTRUCTION = """
+8. SCORE:
+[A single integer from 0 to 100 grading the student's answer. Follow the grading criteria in the CONTEXT if there are any. Write only the number.]
+"""
+
+# 항목 제목 (번호와 제목이 모두 맞는 줄만 항목 시작으로 인정해 항목 안의 번호 목록과 구분)
+SECTION_TITLES = {
+    1: "PROBLEM ANALYSIS",
+    2: "CORRECTED VERSION",
+    3: "GRAMMAR FEEDBACK",
+    4: "VOCABULARY SUGGESTIONS",
+    5: "STYLE AND STRUCTURE",
+    6: "OVERALL COMMENTS",
+    7: "MODEL ANSWER",
+    8: "SCORE"
+}
+
+_HEADING = re.compile(
+    r"^[ \t*#]*([1-8])\.[ \t]*(" + "|".join(re.escape(title) for title in SECTION_TITLES.values()) + r")"
+    r"(?:[ \t]*\([^)\n]*\))?[ \t*]*(?::|$)[ \t*]*",
+    re.MULTILINE | re.IGNORECASE
+)
+
+
+def correction_problem(problem):
+    """
+    Adapt a stored problem to the ``question``/``context`` shape the
+    correction prompt expects.
+    """
+    context = [f"Title: {problem.get('title', '')}"]
+    if problem.get("subject"):
+        context.append(f"Subject: {problem['subject']}")
+    if problem.get("grading_criteria"):
+        context.append(f"Grading criteria: {problem['grading_criteria']}")
+    sample_answer = problem.get("sample_answer") or problem.get("answer")
+    if sample_answer:
+        context.append(f"Sample answer: {sample_answer}")
+    return {"question": problem.get("description") or problem.get("question", ""), "context": "\n".join(context)}
+
+
+def build_pregrade_prompt(problem, answer):
+    return get_correction_prompt(correction_problem(problem), answer).rstrip() + "\n" + SCORE_INSTRUCTION
+
+
+def parse_correction(text):
+    """
+    Split a correction response into its numbered sections.
+
+    Returns:
+        dict: ``sections`` (section name -> text, see ``SECTION_LABELS``)
+        and ``score`` (0-100, or ``None`` if the response had none).
+    """
+    matches = [
+        match for match in _HEADING.finditer(text or "")
+        if SECTION_TITLES[int(match.group(1))] == match.group(2).upper()
+    ]
+    sections = {}
+    for position, match in enumerate(matches):
+        name = SECTIONS[int(match.group(1))]
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        if body and name not in sections:
+            sections[name] = body
+
+    score = None
+    score_match = re.search(r"\d+", sections.pop("score", ""))
+    if score_match:
+        score = min(max(int(score_match.group()), 0), 100)
+    return {"sections": sections, "score": score}
+
+
+def pregrade_all(grade_one, items, max_workers=8, on_result=None):
+    """
+    Draft grades for ``items`` concurrently.
+
+    Args:
+        grade_one (callable): ``grade_one(item)`` returning a draft dict;
+            called from worker threads, may raise.
+        items (list): Submissions to grade.
+        max_workers (int): Concurrent requests.
+        on_result (callable): ``on_result(item, draft, error)``, called from
+            the calling thread as each submission finishes; ``error`` is the
+            exception raised by ``grade_one``, if any.
+
+    Returns:
+        tuple: ``(drafted, failed)`` counts.
+    """
+    drafted = failed = 0
+    if not items:
+        return drafted, failed
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = {pool.submit(grade_one, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                draft, error = future.result(), None
+            except Exception as e:
+                draft, error = None, e
+            if draft is None:
+                failed += 1
+            else:
+                drafted += 1
+            if on_result is not None:
+                on_result(item, draft, error)
+    return drafted, failed
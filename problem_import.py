@@ -0,0 +1,154 @@
+"""
+Chunked, vectorized import of problem CSV files.
+
+Rows are checked before import: ``difficulty`` must be one of
+``DIFFICULTIES``, ``type`` one of ``PROBLEM_TYPES``, and 객관식 rows need
+at least two options and an answer number within them. Rows that fail
+are not imported but reported with their data row number.
+"""
+
+import uuid
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+REQUIRED_COLUMNS = ("title", "description", "difficulty", "type")
+OPTIONAL_COLUMNS = {"subject": "기타", "grade": "1", "options": "", "answer": ""}
+PROBLEM_TYPES = ("객관식", "주관식", "서술식")
+DIFFICULTIES = ("쉬움", "보통", "중간", "어려움")
+
+CHUNK_SIZE = 5000
+
+
+def missing_columns(columns):
+    return [column for column in REQUIRED_COLUMNS if column not in columns]
+
+
+def _id_factory():
+    # 가져오기마다 uuid4 하나를 만들고 하위 32비트에 행 번호를 넣어 고유한 ID를 만듦
+    base = uuid.uuid4().int & ~0xFFFFFFFF
+    return lambda rows: [str(uuid.UUID(int=base | row)) for row in rows]
+
+
+def validate_chunk(chunk):
+    """
+    Check every row of a chunk at once.
+
+    Args:
+        chunk (DataFrame): Rows read as strings, with the optional columns
+            filled in.
+
+    Returns:
+        Series: Error message per row, ``""`` for valid rows.
+    """
+    errors = pd.Series("", index=chunk.index)
+
+    def flag(mask, message):
+        return errors.where(~mask, errors + message + "; ")
+
+    for column in REQUIRED_COLUMNS:
+        errors = flag(chunk[column] == "", f"{column} 누락")
+
+    types = chunk["type"]
+    errors = flag((types != "") & ~types.isin(PROBLEM_TYPES), f"type은 {'/'.join(PROBLEM_TYPES)} 중 하나여야 합니다")
+    difficulty = chunk["difficulty"]
+    errors = flag((difficulty != "") & ~difficulty.isin(DIFFICULTIES), f"difficulty는 {'/'.join(DIFFICULTIES)} 중 하나여야 합니다")
+
+    # 객관식: 선택지 2개 이상, 정답은 1부터 선택지 수까지의 번호
+    choice = types == "객관식"
+    option_count = chunk["options"].str.split(",").map(lambda options: sum(1 for option in options if option.strip()))
+    answer = pd.to_numeric(chunk["answer"], errors="coerce")
+    errors = flag(choice & (option_count < 2), "객관식 선택지(options)가 2개 이상 필요합니다")
+    errors = flag(choice & (option_count >= 2) & ~((answer >= 1) & (answer <= option_count) & (answer % 1 == 0)),
+                  "객관식 정답(answer)은 1부터 선택지 수까지의 번호여야 합니다")
+    return errors.str.rstrip("; ")
+
+
+def import_problems(file, owner, created_at, chunksize=CHUNK_SIZE, total_rows=None, on_progress=None):
+    """
+    Read a problem CSV in chunks and convert the valid rows.
+
+    Each chunk is validated column-wise (see ``validate_chunk``), so
+    memory use is bounded by ``chunksize`` plus the resulting problems.
+    Nothing is saved here; the caller commits the returned problems once.
+
+    Args:
+        file: Path or file object of the CSV.
+        owner (str): Teacher id stored as ``created_by``.
+        created_at (str): Timestamp stored on every problem.
+        chunksize (int): Rows per chunk.
+        total_rows (int): Expected row count, only used for progress.
+        on_progress (callable): ``on_progress(rows_read, total_rows)`` after
+            every chunk.
+
+    Returns:
+        dict: ``problems`` (list), ``rows`` (rows read), ``rejected``
+        (DataFrame of rejected rows with their data ``row`` number, 1 for
+        the first row after the header, and ``error``, or ``None``) and ``missing_answers`` (주관식/서술식
+        problems without a sample answer).
+    """
+    if pd is None:
+        raise ImportError("CSV 가져오기에는 pandas 패키지가 필요합니다.")
+
+    make_ids = _id_factory()
+    problems = []
+    rejected = []
+    rows = 0
+    missing_answers = 0
+
+    for chunk in pd.read_csv(file, chunksize=chunksize, dtype=str, keep_default_na=False, skipinitialspace=True):
+        missing = missing_columns(chunk.columns)
+        if missing:
+            raise ValueError(f"필수 필드가 누락되었습니다: {', '.join(missing)}")
+        for column, default in OPTIONAL_COLUMNS.items():
+            if column not in chunk.columns:
+                chunk[column] = ""
+        chunk = chunk.apply(lambda column: column.str.strip())
+        chunk.index = range(rows, rows + len(chunk))
+        rows += len(chunk)
+
+        errors = validate_chunk(chunk)
+        invalid = errors != ""
+        if invalid.any():
+            report = chunk[invalid].copy()
+            # 파일 줄 번호가 아닌 데이터 행 번호 (값 안에 줄바꿈이 있으면 둘이 다름)
+            report.insert(0, "row", report.index + 1)
+            report["error"] = errors[invalid]
+            rejected.append(report)
+
+        valid = chunk[~invalid]
+        if len(valid):
+            choice = valid["type"] == "객관식"
+            missing_answers += int(((~choice) & (valid["answer"] == "")).sum())
+            frame = pd.DataFrame({
+                "id": make_ids(valid.index),
+                "title": valid["title"],
+                "description": valid["description"],
+                "difficulty": valid["difficulty"],
+                "type": valid["type"],
+                "subject": valid["subject"].where(valid["subject"] != "", OPTIONAL_COLUMNS["subject"]),
+                "grade": valid["grade"].where(valid["grade"] != "", OPTIONAL_COLUMNS["grade"]),
+                "answer": valid["answer"].where(~choice, pd.to_numeric(valid["answer"], errors="coerce").fillna(0).astype(int).astype(str)),
+                "created_by": owner,
+                "created_at": created_at
+            }, index=valid.index)
+            frame["options"] = valid["options"].str.split(",").map(
+                lambda options: [option.strip() for option in options if option.strip()]
+            )
+
+            for problem, is_choice in zip(frame.to_dict("records"), choice):
+                if not is_choice:
+                    del problem["options"]
+                problems.append(problem)
+
+        if on_progress is not None:
+            on_progress(rows, total_rows)
+
+    return {
+        "problems": problems,
+        "rows": rows,
+        "rejected": pd.concat(rejected) if rejected else None,
+        "missing_answers": missing_answers
+    }
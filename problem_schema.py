@@ -0,0 +1,172 @@
+"""
+Schema of AI generated problems, with per-item validation and repair.
+"""
+
+import json
+import re
+
+# 생성 요청 유형 -> 저장되는 problem_type
+PROBLEM_TYPES = {"객관식": "multiple_choice", "주관식": "essay", "서술식": "long_essay"}
+
+OPTION_COUNT = 4
+
+_COMMON_PROPERTIES = {
+    "title": {"type": "string", "description": "짧은 문제 제목"},
+    "description": {"type": "string", "description": "문제 내용 (지문과 질문)"},
+    "expected_time": {"type": "integer", "minimum": 1, "maximum": 120, "description": "예상 풀이 시간(분)"}
+}
+
+PROBLEM_SCHEMAS = {
+    "multiple_choice": {
+        "type": "object",
+        "properties": dict(_COMMON_PROPERTIES, **{
+            "options": {
+                "type": "array", "items": {"type": "string"},
+                "minItems": OPTION_COUNT, "maxItems": OPTION_COUNT,
+                "description": "선택지 4개 (번호 없이)"
+            },
+            "correct_answer": {"type": "integer", "minimum": 1, "maximum": OPTION_COUNT, "description": "정답 선택지 번호"},
+            "explanation": {"type": "string", "description": "정답 해설"}
+        }),
+        "required": ["title", "description", "options", "correct_answer"]
+    },
+    "essay": {
+        "type": "object",
+        "properties": dict(_COMMON_PROPERTIES, **{
+            "sample_answer": {"type": "string", "description": "정답 또는 예시 답안"},
+            "grading_criteria": {"type": "string", "description": "채점 기준"}
+        }),
+        "required": ["title", "description", "sample_answer"]
+    }
+}
+PROBLEM_SCHEMAS["long_essay"] = PROBLEM_SCHEMAS["essay"]
+
+# 모델이 자주 쓰는 다른 이름 -> 저장 필드
+_ALIASES = {
+    "description": ("question", "content", "problem", "내용", "문제"),
+    "title": ("제목",),
+    "options": ("choices", "보기", "선택지"),
+    "correct_answer": ("answer", "정답"),
+    "sample_answer": ("answer", "model_answer", "정답", "모범답안", "예시 답안"),
+    "grading_criteria": ("criteria", "채점 기준"),
+    "explanation": ("해설",),
+    "expected_time": ("time", "예상 시간")
+}
+
+_OPTION_PREFIX = re.compile(r"^\s*(?:\(?[1-9①②③④⑤][.)]?|[A-Da-d][.)])\s+")
+
+
+def schema_for(problem_type):
+    """Return the JSON schema of one problem for a 객관식/주관식/서술식 request."""
+    return PROBLEM_SCHEMAS[PROBLEM_TYPES.get(problem_type, "essay")]
+
+
+def schema_text(problem_type):
+    return json.dumps(schema_for(problem_type), ensure_ascii=False, indent=2)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_text(item) for item in value).strip()
+    return str(value).strip()
+
+
+def _int(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.search(r"\d+", str(value or ""))
+    return int(match.group()) if match else None
+
+
+def _options(value):
+    if isinstance(value, dict):
+        value = [value[key] for key in sorted(value, key=lambda key: (_int(key) is None, _int(key) or 0, str(key)))]
+    if isinstance(value, str):
+        value = [line for line in value.splitlines() if line.strip()]
+    if not isinstance(value, list):
+        return []
+    return [_OPTION_PREFIX.sub("", _text(option)) for option in value]
+
+
+def _answer_number(value, options):
+    number = _int(value)
+    if number is None and isinstance(value, str):
+        text = value.strip()
+        if len(text) == 1 and text.upper() in "ABCD":
+            number = "ABCD".index(text.upper()) + 1
+        elif text in options:
+            number = options.index(text) + 1
+    return number
+
+
+def validate_problem(item, problem_type):
+    """
+    Check one generated item against the schema, repairing what is safe.
+
+    Field aliases are renamed, numbers given as text ("2번", "10분") are
+    converted, option numbering is stripped and a missing title is taken
+    from the description. Anything still wrong is reported.
+
+    Args:
+        item (dict): One element of the model's ``problems`` array.
+        problem_type (str): 객관식 / 주관식 / 서술식.
+
+    Returns:
+        tuple: ``(problem, errors)``; ``problem`` is ``None`` when invalid.
+    """
+    if not isinstance(item, dict):
+        return None, ["항목이 JSON 객체가 아닙니다."]
+
+    kind = PROBLEM_TYPES.get(problem_type, "essay")
+    schema = PROBLEM_SCHEMAS[kind]
+    item = dict(item)
+    for field, aliases in _ALIASES.items():
+        if field in schema["properties"] and item.get(field) in (None, "", []):
+            for alias in aliases:
+                if item.get(alias) not in (None, "", []):
+                    item[field] = item[alias]
+                    break
+
+    problem = {"problem_type": kind}
+    errors = []
+
+    problem["description"] = _text(item.get("description"))
+    if not problem["description"]:
+        errors.append("description(문제 내용)이 없습니다.")
+
+    problem["title"] = _text(item.get("title")) or problem["description"][:30]
+    if not problem["title"]:
+        errors.append("title(제목)이 없습니다.")
+
+    expected_time = _int(item.get("expected_time"))
+    if expected_time is not None:
+        problem["expected_time"] = min(max(expected_time, 1), 120)
+
+    if kind == "multiple_choice":
+        options = _options(item.get("options"))
+        if len(options) != OPTION_COUNT or not all(options):
+            errors.append(f"options(선택지)는 비어 있지 않은 {OPTION_COUNT}개여야 합니다.")
+        problem["options"] = options
+
+        answer = _answer_number(item.get("correct_answer"), options)
+        if answer is None or not 1 <= answer <= OPTION_COUNT:
+            errors.append(f"correct_answer(정답)는 1~{OPTION_COUNT} 사이의 번호여야 합니다.")
+        problem["correct_answer"] = answer
+
+        explanation = _text(item.get("explanation"))
+        if explanation:
+            problem["explanation"] = explanation
+    else:
+        problem["sample_answer"] = _text(item.get("sample_answer"))
+        if not problem["sample_answer"]:
+            errors.append("sample_answer(예시 답안)이 없습니다.")
+
+        criteria = _text(item.get("grading_criteria"))
+        if criteria:
+            problem["grading_criteria"] = criteria
+
+    return (None if errors else problem), errors
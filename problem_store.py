@@ -0,0 +1,166 @@
+"""
+Unified, indexed view over teacher problems and the shared problem repository.
+"""
+
+import threading
+
+REPOSITORY_PREFIX = "repo_"
+
+
+def problem_kind(problem):
+    """
+    Normalize the two type fields the app uses into one value.
+
+    Problems created through the solving flow carry ``problem_type``
+    (multiple_choice / essay / long_essay), the ones created by teachers
+    carry ``type`` (객관식 / 주관식 / 서술식).
+    """
+    problem_type = problem.get("problem_type")
+    if problem_type:
+        return problem_type
+    return {"객관식": "multiple_choice", "서술식": "long_essay"}.get(problem.get("type"), "essay")
+
+
+def repository_problem_as_teacher_problem(problem):
+    """Convert a repository item into the teacher problem shape used for solving."""
+    teacher_problem = {
+        "id": REPOSITORY_PREFIX + str(problem.get("id")),
+        "title": problem.get("title", ""),
+        "description": problem.get("content", ""),
+        "difficulty": problem.get("difficulty", "보통"),
+        "created_by": problem.get("created_by", "system"),
+        "created_at": problem.get("created_at", ""),
+        "problem_type": "multiple_choice" if problem.get("type") == "객관식" else "essay",
+        "subject": problem.get("subject", "기타"),
+        "from_repository": True
+    }
+
+    # 문제 유형에 따라 추가 필드 추가
+    if problem.get("type") == "객관식":
+        teacher_problem["options"] = problem.get("options", [])
+        teacher_problem["correct_answer"] = problem.get("answer", "")
+    else:
+        teacher_problem["answer"] = problem.get("answer", "")
+
+    if "explanation" in problem:
+        teacher_problem["explanation"] = problem.get("explanation", "")
+
+    return teacher_problem
+
+
+def owned_problems(teacher_problems, username):
+    """
+    Return the mutable problem list a teacher owns, creating it if needed.
+
+    Older data stored some teachers as ``{"problems": [...]}``; that shape
+    is accepted and its inner list is returned.
+    """
+    owned = teacher_problems.setdefault(username, [])
+    if isinstance(owned, dict):
+        owned = owned.setdefault("problems", [])
+    return owned
+
+
+class ProblemStore:
+    """
+    Hash index over every problem the app can look up by id.
+
+    ``teacher_problems`` may mix three shapes: teacher id -> list of
+    problems, teacher id -> ``{"problems": [...]}`` and problem id ->
+    problem. Repository items are exposed under ``repo_<id>``. Secondary
+    indexes map owner, created_by, kind, difficulty, grade, subject and
+    source ("teacher" / "repository") to problem ids in insertion order.
+
+    The index is rebuilt by ``refresh`` only when the dataset versions
+    change.
+    """
+
+    FACETS = ("owner", "created_by", "kind", "difficulty", "grade", "subject", "source")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_id = {}
+        self._indexes = {facet: {} for facet in self.FACETS}
+
+    def refresh(self, version, teacher_problems, repository):
+        """Rebuild the indexes if ``version`` differs from the indexed one."""
+        with self._lock:
+            if version == self._version:
+                return
+            self._build(teacher_problems, repository)
+            self._version = version
+
+    def _build(self, teacher_problems, repository):
+        self._by_id = {}
+        self._indexes = {facet: {} for facet in self.FACETS}
+
+        for key, value in list(teacher_problems.items()):
+            if isinstance(value, dict) and isinstance(value.get("problems"), list):
+                value = value["problems"]
+            if isinstance(value, list):
+                for position, problem in enumerate(value):
+                    if isinstance(problem, dict):
+                        self._add(problem.get("id") or f"{key}:{position}", problem, key, "teacher")
+            elif isinstance(value, dict):
+                self._add(value.get("id") or key, value, None, "teacher")
+
+        for problem in (repository or {}).get("problems", []):
+            if problem.get("id"):
+                teacher_problem = repository_problem_as_teacher_problem(problem)
+                self._add(teacher_problem["id"], teacher_problem, None, "repository")
+
+    def _add(self, problem_id, problem, owner, source):
+        if problem_id in self._by_id:
+            return
+        self._by_id[problem_id] = problem
+        values = {
+            "owner": owner,
+            "created_by": problem.get("created_by"),
+            "kind": problem_kind(problem),
+            "difficulty": problem.get("difficulty"),
+            "grade": None if problem.get("grade") is None else str(problem.get("grade")),
+            "subject": problem.get("subject"),
+            "source": source
+        }
+        for facet, value in values.items():
+            if value is not None:
+                self._indexes[facet].setdefault(value, []).append(problem_id)
+
+    def get(self, problem_id, default=None):
+        return self._by_id.get(problem_id, default)
+
+    def __contains__(self, problem_id):
+        return problem_id in self._by_id
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def ids(self, **criteria):
+        """
+        Return problem ids matching every given facet value, in insertion order.
+
+        Example:
+            store.ids(source="teacher", difficulty="보통")
+        """
+        if not criteria:
+            return list(self._by_id)
+
+        # 가장 짧은 목록부터 교집합
+        postings = sorted(
+            (self._indexes[facet].get(str(value) if facet == "grade" else value, []) for facet, value in criteria.items()),
+            key=len
+        )
+        result = postings[0]
+        for posting in postings[1:]:
+            allowed = set(posting)
+            result = [problem_id for problem_id in result if problem_id in allowed]
+        return list(result)
+
+    def find(self, **criteria):
+        """Return ``(problem_id, problem)`` pairs matching ``criteria``."""
+        return [(problem_id, self._by_id[problem_id]) for problem_id in self.ids(**criteria)]
+
+    def values(self, facet):
+        """Return the distinct indexed values of ``facet``."""
+        return list(self._indexes[facet])
@@ -0,0 +1,295 @@
+"""
+Incrementally maintained indexes derived from student records.
+"""
+
+import bisect
+
+STATUSES = ("in_progress", "submitted", "completed")
+
+
+class AttemptIndex:
+    """
+    Inverted index from problem id to attempt counters.
+
+    ``counts(problem_id)`` returns how many students attempted the problem
+    and how many records are in each status. The index keeps each
+    record's last seen status so updates only touch the changed records.
+    """
+
+    def __init__(self, student_records=None):
+        self._counts = {}
+        self._statuses = {}
+        if student_records is not None:
+            self.rebuild(student_records)
+
+    def rebuild(self, student_records):
+        """Recompute every counter from scratch."""
+        self._counts = {}
+        self._statuses = {}
+        for student_id, student_record in student_records.items():
+            for problem_id, record in student_record.get("problems", {}).items():
+                self._set(student_id, problem_id, record)
+
+    def update(self, student_records, changed):
+        """
+        Apply record changes.
+
+        Args:
+            student_records (dict): The current student_records.
+            changed (list): ``(student_id, problem_id)`` pairs; ``problem_id``
+                of ``None`` means every record of that student changed.
+        """
+        for student_id, problem_id in changed:
+            student_record = student_records.get(student_id) or {}
+            problems = student_record.get("problems", {})
+            if problem_id is None:
+                for old_problem_id in list(self._statuses.get(student_id, {})):
+                    self._unset(student_id, old_problem_id)
+                for new_problem_id, record in problems.items():
+                    self._set(student_id, new_problem_id, record)
+            else:
+                self._unset(student_id, problem_id)
+                if problem_id in problems:
+                    self._set(student_id, problem_id, problems[problem_id])
+
+    def counts(self, problem_id):
+        """Return ``{"attempts", "in_progress", "submitted", "completed"}`` counters."""
+        counts = self._counts.get(problem_id)
+        if counts is None:
+            return {"attempts": 0, "in_progress": 0, "submitted": 0, "completed": 0}
+        return dict(counts)
+
+    def _set(self, student_id, problem_id, record):
+        status = record.get("status")
+        self._statuses.setdefault(student_id, {})[problem_id] = status
+        counts = self._counts.setdefault(
+            problem_id, {"attempts": 0, "in_progress": 0, "submitted": 0, "completed": 0}
+        )
+        counts["attempts"] += 1
+        if status in STATUSES:
+            counts[status] += 1
+
+    def _unset(self, student_id, problem_id):
+        statuses = self._statuses.get(student_id, {})
+        if problem_id not in statuses:
+            return
+        status = statuses.pop(problem_id)
+        counts = self._counts[problem_id]
+        counts["attempts"] -= 1
+        if status in STATUSES:
+            counts[status] -= 1
+        if not statuses:
+            self._statuses.pop(student_id, None)
+
+
+def is_pending_grading(record):
+    """A submitted answer that has not been scored yet."""
+    return record.get("status") == "submitted" and not record.get("score")
+
+
+class GradingQueue:
+    """
+    Per-teacher FIFO of submitted answers waiting to be graded.
+
+    Items are ordered oldest submission first. Submissions are enqueued
+    when a record becomes pending and dequeued as soon as it is graded
+    (or removed), so teachers page through the queue without rescanning
+    every student record.
+
+    Submissions whose problem is unknown when they are synced are kept
+    aside and assigned by ``assign_unresolved`` once the problem data
+    changes.
+
+    Args:
+        resolve_teacher (callable): Maps a problem id to the id of the
+            teacher who grades it, or ``None`` if the problem is unknown.
+    """
+
+    def __init__(self, resolve_teacher, student_records=None):
+        self.resolve_teacher = resolve_teacher
+        self._queues = {}
+        self._owners = {}
+        self._unresolved = {}
+        if student_records is not None:
+            self.rebuild(student_records)
+
+    def rebuild(self, student_records):
+        """Recompute every queue from scratch."""
+        self._queues = {}
+        self._owners = {}
+        self._unresolved = {}
+        for student_id, student_record in student_records.items():
+            for problem_id, record in student_record.get("problems", {}).items():
+                self._sync(student_id, problem_id, record)
+
+    def update(self, student_records, changed):
+        """Apply record changes, see ``AttemptIndex.update``."""
+        for student_id, problem_id in changed:
+            problems = (student_records.get(student_id) or {}).get("problems", {})
+            if problem_id is None:
+                stale = [key for key in self._owners if key[0] == student_id and key[1] not in problems]
+                for key in stale:
+                    self._dequeue(key)
+                for new_problem_id, record in problems.items():
+                    self._sync(student_id, new_problem_id, record)
+            else:
+                self._sync(student_id, problem_id, problems.get(problem_id))
+
+    def assign_unresolved(self):
+        """Retry the submissions whose problem was unknown; call after problems change."""
+        for key, item in list(self._unresolved.items()):
+            teacher_id = self.resolve_teacher(key[1])
+            if teacher_id is not None:
+                del self._unresolved[key]
+                self._enqueue(key, teacher_id, item)
+
+    def pending_count(self, teacher_id):
+        return len(self._queues.get(teacher_id, []))
+
+    def page(self, teacher_id, offset=0, limit=20):
+        """
+        Return one page of a teacher's queue, oldest first.
+
+        Returns:
+            list: dicts with ``student_id``, ``problem_id`` and ``submitted_at``.
+        """
+        queue = self._queues.get(teacher_id, [])
+        return [
+            {"student_id": student_id, "problem_id": problem_id, "submitted_at": submitted_at}
+            for submitted_at, student_id, problem_id in queue[offset:offset + limit]
+        ]
+
+    def _sync(self, student_id, problem_id, record):
+        key = (student_id, problem_id)
+        if record is None or not is_pending_grading(record):
+            self._dequeue(key)
+            return
+        if key in self._owners:
+            return
+        item = (record.get("submitted_at", ""), student_id, problem_id)
+        teacher_id = self.resolve_teacher(problem_id)
+        if teacher_id is None:
+            self._unresolved[key] = item
+            return
+        self._unresolved.pop(key, None)
+        self._enqueue(key, teacher_id, item)
+
+    def _enqueue(self, key, teacher_id, item):
+        bisect.insort(self._queues.setdefault(teacher_id, []), item)
+        self._owners[key] = (teacher_id, item)
+
+    def _dequeue(self, key):
+        self._unresolved.pop(key, None)
+        owner = self._owners.pop(key, None)
+        if owner is None:
+            return
+        teacher_id, item = owner
+        queue = self._queues[teacher_id]
+        position = bisect.bisect_left(queue, item)
+        if position < len(queue) and queue[position] == item:
+            del queue[position]
+
+
+def _empty_stats():
+    return {"attempted": 0, "in_progress": 0, "submitted": 0, "completed": 0, "score_total": 0}
+
+
+def _with_average(stats):
+    stats = dict(stats)
+    completed = stats["completed"]
+    stats["average_score"] = stats["score_total"] / completed if completed else 0
+    return stats
+
+
+class RecordStats:
+    """
+    Materialized per-student, per-problem and overall record statistics.
+
+    Each table keeps attempted / in_progress / submitted / completed
+    counters and the total score of completed records, so reading a
+    student's or a problem's averages is a dictionary lookup. Every
+    record's last counted status and score is remembered, which lets
+    ``update`` subtract the old contribution and add the new one when an
+    answer is submitted or graded instead of re-summing all records.
+    """
+
+    def __init__(self, student_records=None):
+        self._students = {}
+        self._problems = {}
+        self._totals = _empty_stats()
+        self._contributions = {}
+        if student_records is not None:
+            self.rebuild(student_records)
+
+    def rebuild(self, student_records):
+        """Recompute every table from scratch."""
+        self._students = {}
+        self._problems = {}
+        self._totals = _empty_stats()
+        self._contributions = {}
+        for student_id, student_record in student_records.items():
+            for problem_id, record in student_record.get("problems", {}).items():
+                self._set(student_id, problem_id, record)
+
+    def update(self, student_records, changed):
+        """Apply record changes, see ``AttemptIndex.update``."""
+        for student_id, problem_id in changed:
+            problems = (student_records.get(student_id) or {}).get("problems", {})
+            if problem_id is None:
+                for old_problem_id in list(self._contributions.get(student_id, {})):
+                    self._unset(student_id, old_problem_id)
+                for new_problem_id, record in problems.items():
+                    self._set(student_id, new_problem_id, record)
+            else:
+                self._unset(student_id, problem_id)
+                if problem_id in problems:
+                    self._set(student_id, problem_id, problems[problem_id])
+
+    def student(self, student_id):
+        """Return a student's counters plus ``average_score`` over completed records."""
+        return _with_average(self._students.get(student_id) or _empty_stats())
+
+    def problem(self, problem_id):
+        """Return a problem's counters plus ``average_score`` over completed records."""
+        return _with_average(self._problems.get(problem_id) or _empty_stats())
+
+    def totals(self):
+        """Return the counters over every student record."""
+        return _with_average(self._totals)
+
+    def _set(self, student_id, problem_id, record):
+        status = record.get("status")
+        score = 0
+        if status == "completed":
+            try:
+                score = float(record.get("score") or 0)
+            except (TypeError, ValueError):
+                score = 0
+        self._contributions.setdefault(student_id, {})[problem_id] = (status, score)
+        self._apply(student_id, problem_id, status, score, 1)
+
+    def _unset(self, student_id, problem_id):
+        contributions = self._contributions.get(student_id, {})
+        if problem_id not in contributions:
+            return
+        status, score = contributions.pop(problem_id)
+        if not contributions:
+            self._contributions.pop(student_id, None)
+        self._apply(student_id, problem_id, status, score, -1)
+
+    def _apply(self, student_id, problem_id, status, score, sign):
+        tables = (
+            self._students.setdefault(student_id, _empty_stats()),
+            self._problems.setdefault(problem_id, _empty_stats()),
+            self._totals
+        )
+        for stats in tables:
+            stats["attempted"] += sign
+            if status in STATUSES:
+                stats[status] += sign
+            stats["score_total"] += sign * score
+        if sign < 0:
+            if not self._students[student_id]["attempted"]:
+                del self._students[student_id]
+            if not self._problems[problem_id]["attempted"]:
+                del self._problems[problem_id]
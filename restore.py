@@ -0,0 +1,317 @@
+"""
+Validating, incremental restore of backups into the shared data store.
+"""
+
+from backup import dataset_records, encode_record, record_hash
+
+USER_ROLES = ("admin", "teacher", "pending_teacher", "student")
+
+# 검사 오류는 데이터셋마다 이 개수까지만 보관
+MAX_ERRORS = 20
+
+_MISSING = object()
+
+
+def _line_hash(key, value):
+    return record_hash(encode_record(list(key), value))
+
+
+def validate_record(dataset, key, value):
+    """
+    Check one backup record against the shape the app stores.
+
+    Returns:
+        str: Error message, ``None`` if the record is valid.
+    """
+    if not key or not all(part is None or isinstance(part, str) for part in key):
+        return "키 형식이 올바르지 않습니다."
+
+    if dataset == "users":
+        if len(key) != 1 or not key[0]:
+            return "사용자 아이디가 없습니다."
+        if not isinstance(value, dict):
+            return "사용자 정보가 객체가 아닙니다."
+        if value.get("role") not in USER_ROLES:
+            return f"알 수 없는 역할입니다: {value.get('role')}"
+        if not isinstance(value.get("password_hash", value.get("password")), str):
+            return "비밀번호 해시가 없습니다."
+    elif dataset == "teacher_problems":
+        if len(key) != 1 or not key[0]:
+            return "교사 문제의 키가 없습니다."
+        problems = value if isinstance(value, list) else [value]
+        if not all(isinstance(problem, dict) for problem in problems):
+            return "문제가 객체가 아닙니다."
+    elif dataset == "student_records":
+        if len(key) != 2 or not key[0]:
+            return "학생 기록의 키는 [학생 아이디, 문제 ID]여야 합니다."
+        if not isinstance(value, dict):
+            return "학생 기록이 객체가 아닙니다."
+        if key[1] is None and "problems" in value:
+            return "학생 정보에 문제 기록이 섞여 있습니다."
+    elif dataset == "problem_repository":
+        if key[0] == "metadata" and len(key) == 1:
+            if not isinstance(value, dict):
+                return "저장소 메타데이터가 객체가 아닙니다."
+        elif key[0] == "order" and len(key) == 1:
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                return "저장소 문제 순서가 문자열 목록이 아닙니다."
+        elif key[0] == "problem" and len(key) == 2:
+            if not isinstance(value, dict) or not value.get("id"):
+                return "저장소 문제에 ID가 없습니다."
+        else:
+            return "알 수 없는 저장소 레코드입니다."
+    else:
+        return f"알 수 없는 데이터셋입니다: {dataset}"
+    return None
+
+
+class MemoryBackup:
+    """
+    Backup source over datasets already in memory (legacy JSON and Excel
+    backups), with the same ``datasets``/``records`` interface as
+    ``backup.BackupArchive`` and ``backup.BackupChain``.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def datasets(self):
+        return list(self.data)
+
+    def records(self, dataset):
+        for key, value in dataset_records(dataset, self.data[dataset]):
+            yield tuple(key), value
+
+
+def _current_hashes(dataset, data):
+    return {tuple(key): _line_hash(key, value) for key, value in dataset_records(dataset, data)}
+
+
+def _is_order(dataset, key):
+    # 저장소 순서 레코드는 문제 레코드의 순서로 복원되므로 따로 세지 않음
+    return dataset == "problem_repository" and key == ("order",)
+
+
+def plan_restore(source, store, datasets):
+    """
+    Dry run: stream ``datasets`` of ``source`` once, validate every record
+    and count what restoring them would add, change and delete.
+
+    Only the content hashes of the current records are kept in memory, not
+    a second copy of the backup.
+
+    Args:
+        source: ``BackupArchive``, ``BackupChain`` or ``MemoryBackup``.
+        store (SharedDataStore): Data the backup would be restored into.
+        datasets (list): Datasets to restore; ones missing from the backup
+            are skipped.
+
+    Returns:
+        dict: ``datasets``: dataset -> ``{"added", "changed", "deleted",
+        "unchanged", "records", "error_count", "errors"}`` where ``errors``
+        lists up to ``MAX_ERRORS`` ``(key, message)`` pairs; ``versions``:
+        the store versions the plan was made against.
+    """
+    plan = {}
+    available = source.datasets()
+    with store.lock:
+        versions = dict(store.versions)
+    for dataset in datasets:
+        if dataset not in available:
+            continue
+        with store.lock:
+            current = _current_hashes(dataset, getattr(store, dataset))
+        summary = {"added": 0, "changed": 0, "deleted": 0, "unchanged": 0, "records": 0, "errors": []}
+        error_count = 0
+        seen = set()
+        for key, value in source.records(dataset):
+            summary["records"] += 1
+            error = validate_record(dataset, key, value)
+            if error is None and key in seen:
+                error = "같은 키의 레코드가 두 번 있습니다."
+            if error:
+                error_count += 1
+                if len(summary["errors"]) < MAX_ERRORS:
+                    summary["errors"].append((list(key), error))
+                continue
+            seen.add(key)
+            previous = current.pop(key, None)
+            if _is_order(dataset, key):
+                continue
+            if previous is None:
+                summary["added"] += 1
+            elif previous != _line_hash(key, value):
+                summary["changed"] += 1
+            else:
+                summary["unchanged"] += 1
+        summary["deleted"] = sum(1 for key in current if not _is_order(dataset, key))
+        summary["error_count"] = error_count
+        plan[dataset] = summary
+    plan_versions = {dataset: versions[dataset] for dataset in plan}
+    return {"datasets": plan, "versions": plan_versions}
+
+
+def plan_is_valid(plan):
+    return all(summary["error_count"] == 0 for summary in plan["datasets"].values())
+
+
+class _Transaction:
+    """
+    In-place changes to one dataset, with an undo log of the values they
+    replaced so a failed restore can be rolled back without having copied
+    the dataset beforehand.
+    """
+
+    def __init__(self, dataset, data):
+        self.dataset = dataset
+        self.data = data
+        self.undo = []
+        self.changed = []
+
+    def _set(self, container, name, value):
+        self.undo.append((container, name, container.get(name, _MISSING)))
+        if value is _MISSING:
+            del container[name]
+        else:
+            container[name] = value
+
+    def put(self, key, value):
+        if self.dataset == "student_records":
+            student_id, problem_id = key
+            student = self.data.get(student_id)
+            if student is None:
+                self._set(self.data, student_id, {"problems": {}})
+                student = self.data[student_id]
+            if problem_id is None:
+                for name in [name for name in student if name != "problems" and name not in value]:
+                    self._set(student, name, _MISSING)
+                for name, field in value.items():
+                    self._set(student, name, field)
+            else:
+                self._set(student["problems"], problem_id, value)
+            self.changed.append((student_id, problem_id))
+        elif self.dataset == "problem_repository":
+            # 문제 목록은 replace_problems에서 한 번에 교체
+            self._set(self.data, "metadata", value)
+        else:
+            self._set(self.data, key[0], value)
+            self.changed.append(key[0])
+
+    def delete(self, key):
+        if self.dataset == "student_records":
+            student_id, problem_id = key
+            student = self.data.get(student_id)
+            if student is None:
+                return
+            if problem_id is None:
+                self._set(self.data, student_id, _MISSING)
+            elif problem_id in student.get("problems", {}):
+                self._set(student["problems"], problem_id, _MISSING)
+            # 문제 기록 하나의 삭제는 학생 전체를 다시 저장 (기록 저널은 학생 단위 삭제만 지원)
+            self.changed.append((student_id, None))
+        elif self.dataset != "problem_repository":
+            self._set(self.data, key[0], _MISSING)
+            self.changed.append(key[0])
+
+    def replace_problems(self, problems):
+        self._set(self.data, "problems", problems)
+
+    def rollback(self):
+        for container, name, previous in reversed(self.undo):
+            if previous is _MISSING:
+                container.pop(name, None)
+            else:
+                container[name] = previous
+        self.undo = []
+
+
+def _apply_dataset(source, dataset, data, transaction):
+    current = _current_hashes(dataset, data)
+    if dataset == "problem_repository":
+        by_id = {key[1]: problem for key, problem in dataset_records(dataset, data) if key[0] == "problem"}
+        problems = []
+        changed = []
+        for key, value in source.records(dataset):
+            error = validate_record(dataset, key, value)
+            if error:
+                raise ValueError(f"{dataset} {list(key)}: {error}")
+            previous = current.pop(key, None)
+            if _is_order(dataset, key):
+                continue
+            if key[0] == "metadata":
+                if previous != _line_hash(key, value):
+                    transaction.put(key, value)
+                continue
+            if previous == _line_hash(key, value):
+                # 바뀌지 않은 문제는 현재 객체를 그대로 사용
+                problems.append(by_id[key[1]])
+            else:
+                problems.append(value)
+                changed.append(key[1])
+        changed.extend(key[1] for key in current if key[0] == "problem")
+        # 문제가 추가, 삭제되거나 순서가 바뀌면 위치가 달라지므로 저장소 전체를 저장
+        order = [key[1] for key, _ in dataset_records(dataset, {"problems": problems}) if key[0] == "problem"]
+        structural = order != list(by_id)
+        if changed or structural:
+            transaction.replace_problems(problems)
+        transaction.changed = None if structural else changed
+        return
+
+    for key, value in source.records(dataset):
+        error = validate_record(dataset, key, value)
+        if error:
+            raise ValueError(f"{dataset} {list(key)}: {error}")
+        previous = current.pop(key, None)
+        if previous != _line_hash(key, value):
+            transaction.put(key, value)
+    # 학생 전체 삭제가 그 학생의 문제 기록 삭제보다 나중에 되도록 정렬
+    for key in sorted(current, key=lambda key: key[-1] is None):
+        transaction.delete(key)
+
+
+def apply_restore(source, store, plan):
+    """
+    Restore the datasets of ``plan`` from ``source`` as one transaction.
+
+    The backup is streamed a second time and only records whose content
+    differs are written into the store's dicts in place, under the store
+    lock. If a record fails validation, the backup turns out damaged or
+    saving fails, every change is rolled back from the undo log. Each
+    dataset is then persisted with the changed keys, so backends with
+    row-level saves only write what the restore changed.
+
+    Raises:
+        ValueError: The plan has errors, the data changed since the dry
+            run, or the backup is invalid.
+    """
+    if not plan_is_valid(plan):
+        raise ValueError("검사 오류가 있는 백업은 복원할 수 없습니다.")
+
+    with store.lock:
+        if any(store.versions[dataset] != version for dataset, version in plan["versions"].items()):
+            raise ValueError("미리보기 이후 데이터가 변경되었습니다. 다시 미리보기를 실행하세요.")
+
+        transactions = []
+        try:
+            for dataset in plan["datasets"]:
+                transaction = _Transaction(dataset, getattr(store, dataset))
+                transactions.append(transaction)
+                _apply_dataset(source, dataset, transaction.data, transaction)
+        except Exception:
+            for transaction in reversed(transactions):
+                transaction.rollback()
+            raise
+
+        saved = []
+        try:
+            for transaction in transactions:
+                if transaction.undo:
+                    store.save(transaction.dataset, transaction.changed)
+                    saved.append(transaction)
+        except Exception:
+            for transaction in reversed(transactions):
+                transaction.rollback()
+            # 이미 저장한 데이터셋은 되돌린 내용으로 다시 저장
+            for transaction in saved:
+                store.save(transaction.dataset, transaction.changed)
+            raise
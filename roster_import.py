@@ -0,0 +1,177 @@
+"""
+Bulk student registration from a roster CSV or XLSX file.
+"""
+
+import csv
+import io
+import re
+import secrets
+import string
+
+from passwords import hash_passwords
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# 명단 열 이름 -> 다른 이름 (한국어 헤더 허용)
+COLUMN_ALIASES = {
+    "name": ("이름", "성명", "학생 이름"),
+    "username": ("아이디", "id", "학생 아이디"),
+    "email": ("이메일", "e-mail"),
+    "password": ("비밀번호", "초기 비밀번호")
+}
+
+MIN_PASSWORD_LENGTH = 4
+_USERNAME = re.compile(r"^[A-Za-z0-9_.-]{3,30}$")
+# 자동 생성 아이디 접두어 (뒤에 네 자리 이상 번호가 붙으므로 아이디 규칙보다 짧게)
+_PREFIX = re.compile(r"^[A-Za-z0-9_.-]{1,26}$")
+
+
+def read_roster(file, file_name):
+    """
+    Read a roster file into a DataFrame of strings with canonical columns.
+
+    Raises:
+        ValueError: If the ``name`` column is missing.
+    """
+    if pd is None:
+        raise ImportError("명단 가져오기에는 pandas 패키지가 필요합니다.")
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        frame = pd.read_excel(file, dtype=str)
+    else:
+        frame = pd.read_csv(file, dtype=str, keep_default_na=False, skipinitialspace=True)
+    frame = frame.fillna("")
+
+    renames = {}
+    for column in frame.columns:
+        key = str(column).strip().lower()
+        for canonical, aliases in COLUMN_ALIASES.items():
+            if key == canonical or key in aliases:
+                renames[column] = canonical
+    frame = frame.rename(columns=renames)
+
+    if "name" not in frame.columns:
+        raise ValueError("명단에 이름(name) 열이 필요합니다.")
+    for column in COLUMN_ALIASES:
+        if column not in frame.columns:
+            frame[column] = ""
+    return frame[list(COLUMN_ALIASES)].apply(lambda column: column.astype(str).str.strip())
+
+
+class UsernameIndex:
+    """
+    Case-insensitive set of taken user ids, built once per import so each
+    roster row is checked with one lookup.
+    """
+
+    def __init__(self, usernames):
+        self._taken = {username.lower() for username in usernames}
+
+    def __contains__(self, username):
+        return username.lower() in self._taken
+
+    def add(self, username):
+        self._taken.add(username.lower())
+
+    def next_free(self, prefix, start=1):
+        """Return the first free ``<prefix><number>`` id (e.g. ``student0001``), starting at ``start``."""
+        number = start
+        while f"{prefix}{number:04d}" in self:
+            number += 1
+        return f"{prefix}{number:04d}", number
+
+
+def generate_password(length=8):
+    alphabet = string.ascii_letters + string.digits
+    return "".join(secrets.choice(alphabet) for _ in range(length))
+
+
+def prepare_roster(frame, usernames, prefix="student"):
+    """
+    Validate roster rows and fill in missing ids and passwords.
+
+    Args:
+        frame (DataFrame): Output of ``read_roster``.
+        usernames (iterable): Ids already registered.
+        prefix (str): Prefix of generated ids.
+
+    Raises:
+        ValueError: If ``prefix`` cannot form a valid id.
+
+    Returns:
+        tuple: ``(accounts, rejected)``. ``accounts`` are dicts with
+        ``name``, ``username``, ``email``, ``password`` and
+        ``generated_password``; ``rejected`` are the invalid rows with
+        their file ``line`` and ``error``.
+    """
+    if not _PREFIX.match(prefix):
+        raise ValueError("아이디 접두어는 영문, 숫자, _ . - 로 26자 이하여야 합니다.")
+    index = UsernameIndex(usernames)
+    accounts = []
+    rejected = []
+    next_number = 1
+
+    for position, row in enumerate(frame.to_dict("records")):
+        line = position + 2
+        name, username, password = row["name"], row["username"], row["password"]
+        error = None
+        if not name:
+            error = "이름이 없습니다."
+        elif username and not _USERNAME.match(username):
+            error = "아이디는 영문, 숫자, _ . - 로 3~30자여야 합니다."
+        elif username and username in index:
+            error = f"아이디 '{username}'는 이미 사용 중입니다."
+        elif password and len(password) < MIN_PASSWORD_LENGTH:
+            error = f"비밀번호는 최소 {MIN_PASSWORD_LENGTH}자 이상이어야 합니다."
+        if error:
+            rejected.append(dict(row, line=line, error=error))
+            continue
+
+        if not username:
+            username, next_number = index.next_free(prefix, next_number)
+            if not _USERNAME.match(username):
+                rejected.append(dict(row, line=line, error=f"자동 생성한 아이디 '{username}'가 아이디 규칙에 맞지 않습니다."))
+                continue
+        index.add(username)
+        accounts.append({
+            "name": name,
+            "username": username,
+            "email": row["email"],
+            "password": password or generate_password(),
+            "generated_password": not password
+        })
+
+    return accounts, rejected
+
+
+def build_student_users(accounts, created_by, created_at, max_workers=None):
+    """
+    Hash the passwords of ``accounts`` in one batch and return the user
+    entries keyed by id, in the shape ``add_new_student`` stores.
+    """
+    hashes = hash_passwords([account["password"] for account in accounts], max_workers)
+    return {
+        account["username"]: {
+            "username": account["username"],
+            "password_hash": password_hash,
+            "name": account["name"],
+            "email": account["email"],
+            "role": "student",
+            "created_at": created_at,
+            "created_by": created_by,
+            "first_login": True
+        }
+        for account, password_hash in zip(accounts, hashes)
+    }
+
+
+def credentials_csv(accounts):
+    """CSV (UTF-8 with BOM, so Excel opens it correctly) of the new ids and passwords."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["이름", "아이디", "비밀번호", "이메일"])
+    for account in accounts:
+        writer.writerow([account["name"], account["username"], account["password"], account["email"]])
+    return output.getvalue().encode("utf-8-sig")
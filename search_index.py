@@ -0,0 +1,141 @@
+"""
+Character n-gram full-text search over the shared problem repository.
+"""
+
+import re
+import threading
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lowercase and collapse whitespace so n-grams match the way the old substring search did."""
+    return _WHITESPACE.sub(" ", str(text or "").lower()).strip()
+
+
+def ngrams(text, n):
+    """Return the set of character n-grams of ``text`` (the whole text if shorter)."""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class RepositorySearchIndex:
+    """
+    Inverted index from character n-grams to repository problem ids.
+
+    Korean text has no reliable word boundaries, so titles and contents
+    are indexed as overlapping character bigrams plus single characters
+    (for one-letter queries). A query matches a problem when its text is a
+    substring of the title or content, exactly like the previous
+    ``query in title or query in content`` filter; candidates come from
+    intersecting the posting lists and are ranked by where and how often
+    the query occurs, with title and word-prefix matches first.
+
+    The index is maintained per problem by ``update`` when the repository
+    is saved, and rebuilt from scratch by ``rebuild``.
+    """
+
+    TITLE_WEIGHT = 3
+    PREFIX_BONUS = 2
+    TITLE_PREFIX_BONUS = 5
+
+    def __init__(self, n=2):
+        self.n = n
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._documents = {}
+
+    def rebuild(self, problems):
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            for problem in problems:
+                self._add(problem)
+
+    def update(self, problems, changed):
+        """
+        Re-index the problems whose ids are in ``changed``.
+
+        Args:
+            problems (list): The current repository problem list.
+            changed (list): Problem ids added, edited or removed.
+        """
+        changed = set(changed)
+        with self._lock:
+            for problem_id in changed:
+                self._remove(problem_id)
+            for problem in problems:
+                if problem.get("id") in changed:
+                    self._add(problem)
+
+    def search(self, query, limit=None):
+        """
+        Return matching problems, best match first.
+
+        Returns:
+            list: ``(problem, score)`` pairs.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        with self._lock:
+            grams = ngrams(query, self.n) if len(query) >= self.n else {query}
+            postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+                if not candidates:
+                    break
+
+            results = []
+            for problem_id in candidates:
+                problem, title, content = self._documents[problem_id]
+                score = self._score(query, title, content)
+                if score:
+                    results.append((problem, score))
+
+        results.sort(key=lambda item: (-item[1], str(item[0].get("title", ""))))
+        return results[:limit] if limit else results
+
+    def _score(self, query, title, content):
+        title_hits = title.count(query)
+        content_hits = content.count(query)
+        if not title_hits and not content_hits:
+            return 0
+
+        score = title_hits * self.TITLE_WEIGHT + content_hits
+        if title.startswith(query):
+            score += self.TITLE_PREFIX_BONUS
+        elif (" " + query) in (" " + title) or (" " + query) in (" " + content):
+            score += self.PREFIX_BONUS
+        return score
+
+    def _add(self, problem):
+        problem_id = problem.get("id")
+        if not problem_id:
+            return
+        title = normalize(problem.get("title", ""))
+        content = normalize(problem.get("content", ""))
+        self._documents[problem_id] = (problem, title, content)
+
+        grams = set()
+        for text in (title, content):
+            grams |= ngrams(text, self.n)
+            grams |= set(text)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(problem_id)
+
+    def _remove(self, problem_id):
+        document = self._documents.pop(problem_id, None)
+        if document is None:
+            return
+        _, title, content = document
+        for text in (title, content):
+            for gram in ngrams(text, self.n) | set(text):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(problem_id)
+                    if not posting:
+                        del self._postings[gram]
@@ -0,0 +1,467 @@
+"""
+Storage backends for users, teacher problems, student records and the problem repository.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from journal import RecordJournal
+
+
+def empty_repository():
+    """Return an empty problem repository in the shape the app stores."""
+    return {
+        "problems": [],
+        "metadata": {
+            "last_updated": datetime.now().isoformat(),
+            "version": "1.0"
+        }
+    }
+
+
+class JsonStorage:
+    """
+    The original JSON file layout under ``data_dir``.
+
+    Every ``save_*`` accepts an optional ``changed`` list. The JSON files
+    are rewritten whole regardless, except student records, which go
+    through the append-only journal.
+    """
+
+    name = "json"
+
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.record_journal = RecordJournal(self._path("student_records.json"))
+
+    def _path(self, file_name):
+        return os.path.join(self.data_dir, file_name)
+
+    def _read(self, file_name, default):
+        try:
+            with open(self._path(file_name), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _write(self, file_name, data):
+        tmp_path = self._path(file_name) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self._path(file_name))
+
+    def load_users(self):
+        return self._read("users.json", {})
+
+    def save_users(self, users, changed=None):
+        self._write("users.json", users)
+
+    def load_teacher_problems(self):
+        return self._read("teacher_problems.json", {})
+
+    def save_teacher_problems(self, teacher_problems, changed=None):
+        self._write("teacher_problems.json", teacher_problems)
+
+    def load_student_records(self):
+        return self.record_journal.load()
+
+    def save_student_records(self, student_records, changed=None):
+        if changed is None:
+            self.record_journal.write_snapshot(student_records)
+            return
+
+        for student_id, problem_id in changed:
+            student_record = student_records.get(student_id)
+            if student_record is None:
+                self.record_journal.delete_student(student_id)
+            elif problem_id is None:
+                self.record_journal.put_student(student_id, student_record)
+            else:
+                self.record_journal.set_record(student_id, problem_id, student_record["problems"][problem_id])
+
+    def load_problem_repository(self):
+        return self._read("problem_repository.json", None)
+
+    def save_problem_repository(self, repository, changed=None):
+        self._write("problem_repository.json", repository)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    role TEXT,
+    created_by TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_users_created_by ON users(created_by);
+
+CREATE TABLE IF NOT EXISTS problems (
+    owner_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    is_list INTEGER NOT NULL,
+    id TEXT,
+    created_by TEXT,
+    type TEXT,
+    difficulty TEXT,
+    subject TEXT,
+    grade TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (owner_key, position)
+);
+CREATE INDEX IF NOT EXISTS idx_problems_id ON problems(id);
+CREATE INDEX IF NOT EXISTS idx_problems_created_by ON problems(created_by);
+
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS attempts (
+    student_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    status TEXT,
+    score REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (student_id, problem_id)
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_problem ON attempts(problem_id);
+CREATE INDEX IF NOT EXISTS idx_attempts_status ON attempts(status);
+
+CREATE TABLE IF NOT EXISTS repository_items (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    subject TEXT,
+    difficulty TEXT,
+    type TEXT,
+    created_by TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_repository_position ON repository_items(position);
+CREATE INDEX IF NOT EXISTS idx_repository_subject ON repository_items(subject);
+
+CREATE TABLE IF NOT EXISTS repository_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class SqliteStorage:
+    """
+    SQLite backend in WAL mode with one row per user, problem, attempt and
+    repository item.
+
+    ``save_*`` without ``changed`` replaces a whole dataset in one
+    transaction; with ``changed`` only the listed rows are upserted or
+    deleted (a key that is missing from the in-memory data is deleted).
+
+    ``changed`` holds usernames for users, top-level keys of
+    teacher_problems (a teacher id or a problem id), ``(student_id,
+    problem_id)`` pairs for records (``problem_id=None`` means the whole
+    student), and problem ids for the repository.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path="data/app.db"):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.connection().executescript(_SCHEMA)
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self.connection()
+        with self._write_lock, conn:
+            work(conn)
+
+    # 사용자
+    def load_users(self):
+        rows = self.connection().execute("SELECT username, data FROM users ORDER BY rowid")
+        return {username: json.loads(data) for username, data in rows}
+
+    def save_users(self, users, changed=None):
+        def work(conn):
+            if changed is None:
+                conn.execute("DELETE FROM users")
+                keys = users.keys()
+            else:
+                keys = changed
+            for username in keys:
+                user = users.get(username)
+                if user is None:
+                    conn.execute("DELETE FROM users WHERE username = ?", (username,))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO users (username, role, created_by, data) VALUES (?, ?, ?, ?)",
+                        (username, user.get("role"), user.get("created_by"), _dumps(user))
+                    )
+        self._transaction(work)
+
+    # 교사 문제 (교사별 목록과 문제 ID별 항목이 섞여 있음)
+    def load_teacher_problems(self):
+        teacher_problems = {}
+        rows = self.connection().execute(
+            "SELECT owner_key, is_list, data FROM problems ORDER BY rowid"
+        )
+        for owner_key, is_list, data in rows:
+            value = json.loads(data)
+            if is_list:
+                teacher_problems.setdefault(owner_key, []).append(value)
+            else:
+                teacher_problems[owner_key] = value
+        return teacher_problems
+
+    def save_teacher_problems(self, teacher_problems, changed=None):
+        def work(conn):
+            if changed is None:
+                conn.execute("DELETE FROM problems")
+                keys = teacher_problems.keys()
+            else:
+                keys = changed
+            for owner_key in keys:
+                conn.execute("DELETE FROM problems WHERE owner_key = ?", (owner_key,))
+                value = teacher_problems.get(owner_key)
+                if value is None:
+                    continue
+                if isinstance(value, list):
+                    if not value:
+                        # 빈 목록도 그대로 복원되도록 표시 행 저장
+                        conn.execute(
+                            "INSERT INTO problems (owner_key, position, is_list, data) VALUES (?, -1, 0, '[]')",
+                            (owner_key,)
+                        )
+                    for position, problem in enumerate(value):
+                        self._insert_problem(conn, owner_key, position, 1, problem)
+                else:
+                    self._insert_problem(conn, owner_key, 0, 0, value)
+        self._transaction(work)
+
+    @staticmethod
+    def _insert_problem(conn, owner_key, position, is_list, problem):
+        fields = problem if isinstance(problem, dict) else {}
+        conn.execute(
+            "INSERT INTO problems (owner_key, position, is_list, id, created_by, type, difficulty, subject, grade, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                owner_key, position, is_list,
+                fields.get("id"), fields.get("created_by"),
+                fields.get("type") or fields.get("problem_type"),
+                fields.get("difficulty"), fields.get("subject"),
+                None if fields.get("grade") is None else str(fields.get("grade")),
+                _dumps(problem)
+            )
+        )
+
+    # 학생 기록
+    def load_student_records(self):
+        conn = self.connection()
+        student_records = {}
+        for student_id, data in conn.execute("SELECT student_id, data FROM students ORDER BY rowid"):
+            student_record = json.loads(data)
+            student_record["problems"] = {}
+            student_records[student_id] = student_record
+        for student_id, problem_id, data in conn.execute(
+            "SELECT student_id, problem_id, data FROM attempts ORDER BY rowid"
+        ):
+            student_record = student_records.setdefault(student_id, {"problems": {}})
+            student_record["problems"][problem_id] = json.loads(data)
+        return student_records
+
+    def save_student_records(self, student_records, changed=None):
+        def work(conn):
+            if changed is None:
+                conn.execute("DELETE FROM attempts")
+                conn.execute("DELETE FROM students")
+                items = [(student_id, None) for student_id in student_records]
+            else:
+                items = changed
+            for student_id, problem_id in items:
+                student_record = student_records.get(student_id)
+                if student_record is None:
+                    conn.execute("DELETE FROM attempts WHERE student_id = ?", (student_id,))
+                    conn.execute("DELETE FROM students WHERE student_id = ?", (student_id,))
+                elif problem_id is None:
+                    self._put_student(conn, student_id, student_record)
+                else:
+                    record = student_record.get("problems", {}).get(problem_id)
+                    if record is None:
+                        conn.execute(
+                            "DELETE FROM attempts WHERE student_id = ? AND problem_id = ?",
+                            (student_id, problem_id)
+                        )
+                    else:
+                        conn.execute(
+                            "INSERT OR IGNORE INTO students (student_id, data) VALUES (?, '{}')",
+                            (student_id,)
+                        )
+                        self._upsert_attempt(conn, student_id, problem_id, record)
+        self._transaction(work)
+
+    def _put_student(self, conn, student_id, student_record):
+        meta = {key: value for key, value in student_record.items() if key != "problems"}
+        conn.execute("INSERT OR REPLACE INTO students (student_id, data) VALUES (?, ?)", (student_id, _dumps(meta)))
+        conn.execute("DELETE FROM attempts WHERE student_id = ?", (student_id,))
+        for problem_id, record in student_record.get("problems", {}).items():
+            self._upsert_attempt(conn, student_id, problem_id, record)
+
+    @staticmethod
+    def _upsert_attempt(conn, student_id, problem_id, record):
+        conn.execute(
+            "INSERT INTO attempts (student_id, problem_id, status, score, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(student_id, problem_id) DO UPDATE SET "
+            "status = excluded.status, score = excluded.score, data = excluded.data",
+            (student_id, problem_id, record.get("status"), record.get("score"), _dumps(record))
+        )
+
+    # 문제 저장소
+    def load_problem_repository(self):
+        conn = self.connection()
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM repository_meta")}
+        if not meta:
+            return None
+        problems = [json.loads(data) for (data,) in conn.execute(
+            "SELECT data FROM repository_items ORDER BY position"
+        )]
+        repository = {"problems": problems}
+        repository.update(meta)
+        return repository
+
+    def save_problem_repository(self, repository, changed=None):
+        problems = repository.get("problems", [])
+        ids = [problem.get("id") for problem in problems]
+        # ID가 없거나 겹치는 문제가 있으면 ID로 행을 찾을 수 없으므로 전체 저장
+        if changed is not None and (not all(ids) or len(set(ids)) != len(ids)):
+            changed = None
+
+        def work(conn):
+            if changed is None:
+                conn.execute("DELETE FROM repository_items")
+                row_ids = set()
+                for position, problem in enumerate(problems):
+                    row_id = problem.get("id") or "_pos_%d" % position
+                    if row_id in row_ids:
+                        # 같은 ID의 문제도 잃지 않도록 행 키만 바꿔 저장 (데이터의 id는 그대로)
+                        row_id = "%s#%d" % (row_id, position)
+                    row_ids.add(row_id)
+                    self._upsert_repository_item(conn, position, problem, row_id)
+            else:
+                positions = {problem["id"]: position for position, problem in enumerate(problems)}
+                for problem_id in changed:
+                    position = positions.get(problem_id)
+                    if position is None:
+                        conn.execute("DELETE FROM repository_items WHERE id = ?", (problem_id,))
+                    else:
+                        self._upsert_repository_item(conn, position, problems[position])
+                # 이전 전체 저장에서 임시 키(id#위치, _pos_N)로 저장한 행 등 지금 목록에 없는 행은 삭제하고,
+                # 삭제, 추가로 밀린 나머지 문제의 위치를 다시 매김
+                stored = dict(conn.execute("SELECT id, position FROM repository_items"))
+                for row_id in stored:
+                    if row_id not in positions:
+                        conn.execute("DELETE FROM repository_items WHERE id = ?", (row_id,))
+                for problem_id, position in positions.items():
+                    if stored.get(problem_id) != position:
+                        conn.execute("UPDATE repository_items SET position = ? WHERE id = ?", (position, problem_id))
+            for key, value in repository.items():
+                if key != "problems":
+                    conn.execute(
+                        "INSERT OR REPLACE INTO repository_meta (key, value) VALUES (?, ?)",
+                        (key, _dumps(value))
+                    )
+        self._transaction(work)
+
+    @staticmethod
+    def _upsert_repository_item(conn, position, problem, row_id=None):
+        conn.execute(
+            "INSERT OR REPLACE INTO repository_items (id, position, subject, difficulty, type, created_by, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                row_id or problem.get("id") or "_pos_%d" % position, position,
+                problem.get("subject"), problem.get("difficulty"),
+                problem.get("type"), problem.get("created_by"),
+                _dumps(problem)
+            )
+        )
+
+
+def create_storage(backend=None, data_dir="data", db_path=None):
+    """
+    Create the storage backend selected by ``backend`` or ``STORAGE_BACKEND``.
+
+    Args:
+        backend (str): "json" (default) or "sqlite".
+        data_dir (str): Directory holding the JSON files.
+        db_path (str): SQLite database path, defaults to ``SQLITE_PATH`` or
+            ``<data_dir>/app.db``.
+
+    Returns:
+        JsonStorage or SqliteStorage
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "json")).lower()
+    if backend == "sqlite":
+        return SqliteStorage(db_path or os.getenv("SQLITE_PATH") or os.path.join(data_dir, "app.db"))
+    if backend == "json":
+        return JsonStorage(data_dir)
+    raise ValueError(f"알 수 없는 저장소 백엔드입니다: {backend}")
+
+
+def migrate_json_to_sqlite(data_dir="data", db_path=None):
+    """
+    Copy the current JSON files (including the student record journal)
+    into an SQLite database, replacing whatever the database held.
+
+    Returns:
+        dict: Number of migrated rows per dataset.
+    """
+    source = JsonStorage(data_dir)
+    target = SqliteStorage(db_path or os.path.join(data_dir, "app.db"))
+
+    users = source.load_users()
+    teacher_problems = source.load_teacher_problems()
+    student_records = source.load_student_records()
+    repository = source.load_problem_repository() or empty_repository()
+
+    target.save_users(users)
+    target.save_teacher_problems(teacher_problems)
+    target.save_student_records(student_records)
+    target.save_problem_repository(repository)
+
+    return {
+        "users": len(users),
+        "teacher_problems": len(teacher_problems),
+        "student_records": sum(len(record.get("problems", {})) for record in student_records.values()),
+        "problem_repository": len(repository.get("problems", []))
+    }
+
+
+if __name__ == "__main__":
+    # 사용법: python storage.py migrate [data_dir] [db_path]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("사용법: python storage.py migrate [data_dir] [db_path]")
+        sys.exit(1)
+    counts = migrate_json_to_sqlite(*sys.argv[2:4])
+    for dataset, count in counts.items():
+        print(f"{dataset}: {count}")